@@ -0,0 +1,55 @@
+#cython: boundscheck=False, wraparound=False, initializedcheck=False, cdivision=True
+
+"""
+Cythonized version of longest_monotonic_subseq_length_loose() in lis.py, over
+the rows of a 2D array. This is the fitness kernel of ALLMAPS, where all
+individuals of a GA population are scored at once.
+"""
+
+import numpy as np
+cimport numpy as np
+cimport cython
+
+
+cdef int lis_loose(double[:] x, double[:] tops, int sign) nogil:
+    """ Length of the longest non-decreasing (sign=1) or non-increasing
+    (sign=-1) subsequence of x, by patience sort on the pile tops.
+    """
+    cdef int n = x.shape[0]
+    cdef int npiles = 0
+    cdef int i, lo, hi, mid
+    cdef double v
+    for i in range(n):
+        v = sign * x[i]
+        # Leftmost pile whose top is larger than v
+        lo, hi = 0, npiles
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tops[mid] <= v:
+                lo = mid + 1
+            else:
+                hi = mid
+        tops[lo] = v
+        if lo == npiles:
+            npiles += 1
+    return npiles
+
+
+def longest_monotonic_subseq_lengths_loose(double[:, :] X):
+    """
+    Same as longest_monotonic_subseq_length_loose() on each row of X, returns
+    the two arrays max(li, ld) and li - ld.
+    """
+    cdef int m = X.shape[0]
+    cdef int n = X.shape[1]
+    cdef np.ndarray[double, ndim=1] tops = np.empty(n + 1)
+    cdef np.ndarray[long, ndim=1] best = np.zeros(m, dtype=np.int_)
+    cdef np.ndarray[long, ndim=1] diff = np.zeros(m, dtype=np.int_)
+    cdef double[:] tv = tops
+    cdef int r, li, ld
+    for r in range(m):
+        li = lis_loose(X[r], tv, 1)
+        ld = lis_loose(X[r], tv, -1)
+        best[r] = li if li > ld else ld
+        diff[r] = li - ld
+    return best, diff
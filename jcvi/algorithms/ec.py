@@ -15,7 +15,6 @@ import logging
 import multiprocessing
 
 from deap import base, creator, tools
-from deap.algorithms import varAnd
 from jcvi.algorithms.lis import longest_monotonic_subseq_length
 
 
@@ -37,13 +36,17 @@ def colinear_evaluate(tour, scaffolds):
     return score,
 
 
-def genome_mutation(candidate):
+def genome_mutation(candidate, delta=None):
     """Return the mutants created by inversion mutation on the candidates.
 
     This function performs inversion or insertion. It randomly chooses two
     locations along the candidate and reverses the values within that
     slice. Insertion is done by popping one item and insert it back at random
     position.
+
+    If `delta` is given, as delta(tour, p, q, segment), it should return the
+    score change when tour[p:q] is replaced by segment. The fitness of the
+    mutant is then updated from its parent rather than evaluated again.
     """
     size = len(candidate)
     prob = random.random()
@@ -55,13 +58,25 @@ def genome_mutation(candidate):
         q += 1
         s = candidate[p:q]
         x = candidate[:p] + s[::-1] + candidate[q:]
-        return creator.Individual(x),
+        parent, mutant = candidate, creator.Individual(x)
     else:            # Insertion
         p = random.randint(0, size-1)
         q = random.randint(0, size-1)
+        parent, mutant = creator.Individual(candidate), candidate
+        if candidate.fitness.valid:
+            parent.fitness.values = candidate.fitness.values
         cq = candidate.pop(q)
         candidate.insert(p, cq)
-        return candidate,
+        if p > q:
+            p, q = q, p
+        q += 1
+
+    if delta is not None and parent.fitness.valid:
+        score, = parent.fitness.values
+        mutant.fitness.values = score + delta(parent, p, q, mutant[p:q]),
+    else:
+        del mutant.fitness.values
+    return mutant,
 
 
 def genome_mutation_orientation(candidate):
@@ -96,21 +111,69 @@ def GA_setup(guess, weights=(1.0,)):
     return toolbox
 
 
+def evaluate_invalid(population, toolbox):
+    """Evaluate the individuals with an invalid fitness. If the toolbox has
+    `evaluate_batch`, all of them are evaluated in one call.
+    """
+    invalid_ind = [ind for ind in population if not ind.fitness.valid]
+    if not invalid_ind:
+        return
+    if hasattr(toolbox, "evaluate_batch"):
+        fitnesses = toolbox.evaluate_batch(invalid_ind)
+    else:
+        fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
+    for ind, fit in zip(invalid_ind, fitnesses):
+        ind.fitness.values = fit
+
+
+def evaluate_exact(population, toolbox):
+    """Evaluate all the individuals again. Fitness values updated from the
+    parents (see genome_mutation()) accumulate rounding errors over the
+    generations, this resets them.
+    """
+    for ind in population:
+        ind.fitness.values = toolbox.evaluate(ind)
+
+
+def make_individual(x, fitness):
+    ind = creator.Individual(x)
+    ind.fitness.values = fitness
+    return ind
+
+
+def varAnd(population, toolbox, cxpb, mutpb):
+    """Same as varAnd() in deap, except that the fitness of the mutants is
+    left to the mutation operator, which may update it incrementally.
+    """
+    offspring = [toolbox.clone(ind) for ind in population]
+
+    # Apply crossover and mutation on the offspring
+    for i in range(1, len(offspring), 2):
+        if random.random() < cxpb:
+            offspring[i - 1], offspring[i] = toolbox.mate(offspring[i - 1],
+                                                          offspring[i])
+            del offspring[i - 1].fitness.values, offspring[i].fitness.values
+
+    for i in range(len(offspring)):
+        if random.random() < mutpb:
+            offspring[i], = toolbox.mutate(offspring[i])
+
+    return offspring
+
+
 def eaSimpleConverge(population, toolbox, cxpb, mutpb, ngen, stats=None,
-                     halloffame=None, callback=None, verbose=True):
+                     halloffame=None, callback=None, verbose=True, exact=50):
     """This algorithm reproduce the simplest evolutionary algorithm as
     presented in chapter 7 of [Back2000]_.
 
     Modified to allow checking if there is no change for ngen, as a simple
     rule for convergence. Interface is similar to eaSimple(). However, in
     eaSimple, ngen is total number of iterations; in eaSimpleConverge, we
-    terminate only when the best is NOT updated for ngen iterations.
+    terminate only when the best is NOT updated for ngen iterations. Every
+    `exact` generations, the population and the hall of fame are evaluated
+    again, see evaluate_exact().
     """
-    # Evaluate the individuals with an invalid fitness
-    invalid_ind = [ind for ind in population if not ind.fitness.valid]
-    fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
-    for ind, fit in zip(invalid_ind, fitnesses):
-        ind.fitness.values = fit
+    evaluate_invalid(population, toolbox)
 
     if halloffame is not None:
         halloffame.update(population)
@@ -127,11 +190,11 @@ def eaSimpleConverge(population, toolbox, cxpb, mutpb, ngen, stats=None,
         # Vary the pool of individuals
         offspring = varAnd(offspring, toolbox, cxpb, mutpb)
 
-        # Evaluate the individuals with an invalid fitness
-        invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-        fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
-        for ind, fit in zip(invalid_ind, fitnesses):
-            ind.fitness.values = fit
+        evaluate_invalid(offspring, toolbox)
+        if exact and gen % exact == 0:
+            evaluate_exact(offspring, toolbox)
+            if halloffame is not None:
+                evaluate_exact(halloffame, toolbox)
 
         # Update the hall of fame with the generated individuals
         if halloffame is not None:
@@ -161,12 +224,102 @@ def eaSimpleConverge(population, toolbox, cxpb, mutpb, ngen, stats=None,
     return population
 
 
+def eaIsland(conn, toolbox, seed, npop, cxpb, mutpb, nelites):
+    """Evolve one subpopulation of GA_islands() in its own process. Each
+    request from conn has the number of generations to run and the migrants
+    that replace the worst individuals; the reply has the best individuals.
+    A request of None stops the island.
+    """
+    random.seed(seed)
+    population = toolbox.population(n=npop)
+    evaluate_invalid(population, toolbox)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        ngen, migrants = request
+        if migrants:
+            population.sort(key=lambda ind: ind.fitness, reverse=True)
+            population[-len(migrants):] = [make_individual(x, fitness)
+                                           for x, fitness in migrants]
+        for gen in range(ngen):
+            offspring = toolbox.select(population, len(population))
+            offspring = varAnd(offspring, toolbox, cxpb, mutpb)
+            evaluate_invalid(offspring, toolbox)
+            population[:] = offspring
+        evaluate_exact(population, toolbox)
+        elites = tools.selBest(population, nelites)
+        conn.send([(list(ind), ind.fitness.values) for ind in elites])
+    conn.close()
+
+
+def GA_islands(toolbox, ngen=500, npop=100, seed=666, islands=2,
+               migration=20, nmigrants=2, cxpb=.7, mutpb=.2, callback=None,
+               verbose=True):
+    """Island model GA: each island evolves its own population of npop in a
+    separate process, seeded with seed + i. Every `migration` generations,
+    the islands pause, evaluate their population again (see evaluate_exact())
+    and send their best nmigrants individuals to the next island in a ring.
+
+    The processes are forked after the toolbox is set up, so the fitness
+    data (e.g. matrices bound to toolbox.evaluate) are shared rather than
+    pickled. The run stops when the best over all islands is NOT updated for
+    ngen generations, the same rule as eaSimpleConverge(). Results only
+    depend on seed and the number of islands.
+    """
+    conns, procs = [], []
+    for i in range(islands):
+        conn, child_conn = multiprocessing.Pipe()
+        p = multiprocessing.Process(target=eaIsland,
+                                    args=(child_conn, toolbox, seed + i, npop,
+                                          cxpb, mutpb, nmigrants))
+        p.daemon = True
+        p.start()
+        child_conn.close()
+        conns.append(conn)
+        procs.append(p)
+
+    best = None
+    gen = updated = 0
+    migrants = [[] for i in range(islands)]
+    while gen - updated <= ngen:
+        for conn, m in zip(conns, migrants):
+            conn.send((migration, m))
+        elites = [conn.recv() for conn in conns]
+        gen += migration
+
+        for x, fitness in sum(elites, []):
+            ind = make_individual(x, fitness)
+            if best is None or ind.fitness > best.fitness:
+                best = ind
+                updated = gen
+        if callback is not None:
+            callback(best, gen)
+        if verbose:
+            print("Current iteration {0}: max_score={1}".
+                  format(gen, best.fitness.values), file=sys.stderr)
+
+        # Ring topology, island i takes the elites of island i - 1
+        migrants = elites[-1:] + elites[:-1]
+
+    for conn, p in zip(conns, procs):
+        conn.send(None)
+        conn.close()
+        p.join()
+    return best
+
+
 def GA_run(toolbox, ngen=500, npop=100, seed=666, cpus=1, callback=None):
+    """Run GA from the toolbox of GA_setup(). When cpus > 1, run cpus islands
+    in parallel, see GA_islands().
+    """
     logging.debug("GA setup: ngen={0} npop={1} cpus={2} seed={3}".
                   format(ngen, npop, cpus, seed))
     if cpus > 1:
-        pool = multiprocessing.Pool(cpus)
-        toolbox.register("map", pool.map)
+        tour = GA_islands(toolbox, ngen=ngen, npop=npop, seed=seed,
+                          islands=cpus, callback=callback)
+        return tour, tour.fitness
+
     random.seed(seed)
     pop = toolbox.population(n=npop)
     hof = tools.HallOfFame(1)
@@ -178,8 +331,7 @@ def GA_run(toolbox, ngen=500, npop=100, seed=666, cpus=1, callback=None):
     eaSimpleConverge(pop, toolbox, .7, .2, ngen, stats=stats,
                      halloffame=hof, callback=callback)
     tour = hof[0]
-    if cpus > 1:
-        pool.terminate()
+    evaluate_exact([tour], toolbox)
     return tour, tour.fitness
 
 
@@ -9,6 +9,7 @@ from __future__ import print_function
 import sys
 import logging
 
+import numpy as np
 import networkx as nx
 from collections import deque
 from string import maketrans
@@ -497,6 +498,40 @@ def longest_path_weighted_nodes(G, source, target, weights=None):
     return path, score[ti]
 
 
+def shortest_path_lengths(G, pairs, weight="weight"):
+    """
+    Weighted shortest path lengths for selected (source, target) pairs only.
+    Dijkstra is run on a sparse adjacency matrix from the distinct sources in
+    `pairs`, rather than all-pairs over the whole graph. Unreachable pairs are
+    left out of the returned dict.
+
+    >>> G = nx.DiGraph()
+    >>> G.add_weighted_edges_from([(1, 2, 1), (2, 3, 2), (1, 3, 5), (3, 4, 1)])
+    >>> sorted(shortest_path_lengths(G, [(1, 3), (1, 4), (4, 1)]).items())
+    [((1, 3), 3.0), ((1, 4), 4.0)]
+    """
+    from scipy.sparse.csgraph import dijkstra
+
+    pairs = [(a, b) for a, b in pairs if a in G and b in G]
+    if not pairs:
+        return {}
+
+    nodes = list(G.nodes())
+    A = nx.to_scipy_sparse_matrix(G, nodelist=nodes, weight=weight,
+                                  format="csr")
+    node_to_index = dict((n, i) for i, n in enumerate(nodes))
+    sources = sorted(set(node_to_index[a] for a, b in pairs))
+    source_to_row = dict((s, i) for i, s in enumerate(sources))
+    D = dijkstra(A, directed=True, indices=sources)
+
+    lengths = {}
+    for a, b in pairs:
+        d = D[source_to_row[node_to_index[a]], node_to_index[b]]
+        if np.isfinite(d):
+            lengths[(a, b)] = d
+    return lengths
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
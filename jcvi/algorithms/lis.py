@@ -5,6 +5,7 @@
 # http://wordaligned.org/articles/patience-sort
 from __future__ import print_function
 import bisect
+import numpy as np
 
 # We want a maximum function which accepts a default value
 from functools import partial, reduce
@@ -141,55 +142,143 @@ def longest_decreasing_subsequence_loose(xs):
     return [x for (x, i) in ll]
 
 
-def backtracking(a, L, bestsofar):
-    """
-    Start with the heaviest weight and emit index
-    """
-    w, j = max(L.items())
-    while j != -1:
-        yield j
-        w, j = bestsofar[j]
-
-
 def heaviest_increasing_subsequence(a, debug=False):
     """
     Returns the heaviest increasing subsequence for array a. Elements are (key,
-    weight) pairs.
+    weight) pairs. Keys are ranked, and a Fenwick tree over the ranks answers
+    the heaviest subsequence ending below each key in O(log n), together with
+    the index it ends at, for the backtracking.
 
     >>> heaviest_increasing_subsequence([(3, 3), (2, 2), (1, 1), (0, 5)])
     ([(0, 5)], 5)
+    >>> heaviest_increasing_subsequence([(1, 2), (3, 1), (2, 2), (3, 2)])
+    ([(1, 2), (2, 2), (3, 2)], 6)
     """
-    # Stores the smallest idx of last element of a subsequence of weight w
-    L = {0: -1}
+    rank = dict((k, i + 1) for i, k in enumerate(sorted(set(k for k, w in a))))
+    size = len(rank)
+    tree_weight = [0] * (size + 1)
+    tree_idx = [-1] * (size + 1)
     bestsofar = [(0, -1)] * len(a)  # (best weight, from_idx)
     for i, (key, weight) in enumerate(a):
+        # Heaviest subsequence that ends with a smaller key
+        w, j = 0, -1
+        r = rank[key] - 1
+        while r:
+            if tree_weight[r] > w:
+                w, j = tree_weight[r], tree_idx[r]
+            r -= r & -r
+
+        w += weight
+        bestsofar[i] = (w, j)
+        r = rank[key]
+        while r <= size:
+            if w > tree_weight[r]:
+                tree_weight[r], tree_idx[r] = w, i
+            r += r & -r
+
+        if debug:
+            print((key, weight), bestsofar[i])
 
-        for w, j in L.items():
-            if j != -1 and a[j][0] >= key:
-                continue
+    best, j = 0, -1
+    for i, (w, from_idx) in enumerate(bestsofar):
+        if w > best:
+            best, j = w, i
 
-            new_weight = w + weight
-            if new_weight in L and a[L[new_weight]][0] <= key:
-                continue
+    tb = []
+    while j != -1:
+        tb.append(j)
+        j = bestsofar[j][1]
+    return [a[x] for x in reversed(tb)], best
 
-            L[new_weight] = i
-            newbest = (new_weight, j)
-            if newbest > bestsofar[i]:
-                bestsofar[i] = newbest
 
-        if debug:
-            #print (key, weight), L
-            print((key, weight), bestsofar)
+def patience_sort_rows(X, loose=False):
+    """
+    Patience sort each row of a 2D array, all rows at once. Every column is
+    placed with a vectorized binary search on the pile tops of all rows.
+    Returns the number of piles, the column on top of each pile and the
+    backlink of each column to the top of the previous pile (-1 for none).
+    With loose=True, equal values go on top of each other, i.e. the piles
+    are for non-decreasing subsequences.
+    """
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    m, n = X.shape
+    rows = np.arange(m)
+    tops = np.full((m, n + 1), np.inf)
+    top_idx = np.full((m, n + 1), -1, dtype=int)
+    prev = np.full((m, n), -1, dtype=int)
+    npiles = np.zeros(m, dtype=int)
+    less = np.less_equal if loose else np.less
+    nsteps = n.bit_length() + 1
+    for j in range(n):
+        x = X[:, j]
+        lo = np.zeros(m, dtype=int)
+        hi = np.full(m, n)
+        for k in range(nsteps):
+            mid = (lo + hi) // 2
+            right = less(tops[rows, mid], x)
+            lo = np.where(right, mid + 1, lo)
+            hi = np.where(right, hi, mid)
+        tops[rows, lo] = x
+        top_idx[rows, lo] = j
+        prev[:, j] = np.where(lo > 0, top_idx[rows, lo - 1], -1)
+        np.maximum(npiles, lo + 1, out=npiles)
+
+    return npiles, top_idx, prev
+
+
+def longest_increasing_subseq_lengths(X, loose=False):
+    """
+    Vectorized longest_increasing_subseq_length() over the rows of X.
 
-    tb = reversed(list(backtracking(a, L, bestsofar)))
-    return [a[x] for x in tb], max(L.items())[0]
+    >>> longest_increasing_subseq_lengths([[0, 1, 2], [3, 1, 2]]).tolist()
+    [3, 2]
+    >>> longest_increasing_subseq_lengths([[1, 1, 2]], loose=True).tolist()
+    [3]
+    """
+    npiles, top_idx, prev = patience_sort_rows(X, loose=loose)
+    return npiles
+
+
+def longest_monotonic_subseq_lengths(X, loose=False):
+    """
+    Vectorized longest_monotonic_subseq_length() over the rows of X, use
+    loose=True to match longest_monotonic_subseq_length_loose().
+
+    >>> X = [(4, 5, 1, 2, 3), (1, 2, 3, 5, 4)]
+    >>> a, b = longest_monotonic_subseq_lengths(X)
+    >>> a.tolist(), b.tolist()
+    ([3, 4], [1, 2])
+    """
+    X = np.atleast_2d(np.asarray(X))
+    li = longest_increasing_subseq_lengths(X, loose=loose)
+    ld = longest_increasing_subseq_lengths(X[:, ::-1], loose=loose)
+    return np.maximum(li, ld), li - ld
+
+
+def longest_increasing_subsequences(X, loose=False):
+    """
+    Vectorized longest_increasing_subsequence() over the rows of X. Returns
+    the column indices of a longest increasing subsequence for each row.
+
+    >>> [x.tolist() for x in longest_increasing_subsequences([[3, 1, 2, 0]])]
+    [[1, 2]]
+    """
+    npiles, top_idx, prev = patience_sort_rows(X, loose=loose)
+    m = len(npiles)
+    rows = np.arange(m)
+    lis = np.full((m, npiles.max() if m else 0), -1, dtype=int)
+    j = top_idx[rows, npiles - 1]
+    for k in range(lis.shape[1] - 1, -1, -1):
+        valid = k < npiles
+        lis[valid, k] = j[valid]
+        j = np.where(valid, prev[rows, np.maximum(j, 0)], j)
+    return [x[:n] for x, n in zip(lis, npiles)]
 
 
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
 
-    import numpy as np
     A = np.random.random_integers(0, 10, 10)
     A = list(A)
     B = zip(A, [1] * 10)
@@ -30,6 +30,7 @@ import os
 import os.path as op
 import shutil
 import logging
+from collections import defaultdict
 from six.moves import cStringIO
 import networkx as nx
 
@@ -194,6 +195,185 @@ class SCIPSolver(AbstractMIPSolver):
         return results
 
 
+class PackingSolver(object):
+    """
+    In-process solver for 0-1 packing problems, which is what quota alignment
+    reduces to:
+
+        Maximize sum(w[i] x[i])
+        Subject to sum(x[i] for i in C) <= cap, for each constraint C
+        Binary x[i]
+
+    Branch and bound on the heaviest undecided variable, include first. The
+    starting incumbent is the greedy solution. At each node the bound
+    partitions the undecided variables among the constraints, each constraint
+    can take at most its remaining capacity of them. Variables with
+    non-positive weights are never selected. When `node_limit` is
+    reached the search stops, results are then the best found so far and
+    `upper_bound` holds the root bound.
+
+    >>> s = PackingSolver([5, 3, 2], [(1, 2)], [1])
+    >>> s.results, s.obj_val, s.optimal
+    ([0, 1], 8, True)
+    """
+
+    def __init__(self, weights, constraints, capacities, node_limit=100000):
+        n = len(weights)
+        # Heaviest variables are decided first
+        self.order = order = sorted(range(n), key=lambda i: (-weights[i], i))
+        rank = dict((x, i) for i, x in enumerate(order))
+        self.weights = [weights[x] for x in order]
+        self.members = [sorted(rank[x] for x in c) for c in constraints]
+        self.var_cons = [[] for i in range(n)]
+        for ic, c in enumerate(self.members):
+            for i in c:
+                self.var_cons[i].append(ic)
+        self.residual = list(capacities)
+        self.node_limit = node_limit
+        self.nodes = 0
+
+        self.obj_val, chosen = self.greedy()
+        self.best = set(chosen)
+        self.upper_bound = self.bound(0)
+        if node_limit and self.upper_bound > self.obj_val:
+            self.branch(0, 0, [])
+            if self.nodes < node_limit:  # search completed
+                self.upper_bound = self.obj_val
+        self.optimal = self.upper_bound <= self.obj_val
+        self.results = sorted(order[i] for i in self.best)
+
+    def feasible(self, i):
+        residual = self.residual
+        return all(residual[c] > 0 for c in self.var_cons[i])
+
+    def take(self, i, delta):
+        residual = self.residual
+        for c in self.var_cons[i]:
+            residual[c] -= delta
+
+    def greedy(self):
+        chosen = []
+        for i in range(len(self.weights)):
+            if self.weights[i] > 0 and self.feasible(i):
+                self.take(i, 1)
+                chosen.append(i)
+        for i in chosen:
+            self.take(i, -1)
+        return sum(self.weights[i] for i in chosen), chosen
+
+    def bound(self, k):
+        """
+        Upper bound on the weight that variables k .. n-1 can still add.
+        """
+        weights = self.weights
+        free = set(i for i in range(k, len(weights))
+                   if weights[i] > 0 and self.feasible(i))
+        total = 0
+        for c, members in enumerate(self.members):
+            group = [i for i in members if i in free]
+            free.difference_update(group)
+            # members are sorted, so heaviest first
+            total += sum(weights[i] for i in group[:self.residual[c]])
+        return total + sum(weights[i] for i in free)
+
+    def branch(self, k, obj, chosen):
+        if self.nodes >= self.node_limit:
+            return
+        self.nodes += 1
+        if obj > self.obj_val:
+            self.obj_val, self.best = obj, set(chosen)
+        # Weights are sorted, the rest cannot add anything
+        if k == len(self.weights) or self.weights[k] <= 0:
+            return
+        if obj + self.bound(k) <= self.obj_val:
+            return
+
+        if self.feasible(k):
+            self.take(k, 1)
+            chosen.append(k)
+            self.branch(k + 1, obj + self.weights[k], chosen)
+            chosen.pop()
+            self.take(k, -1)
+        self.branch(k + 1, obj, chosen)
+
+
+def packing_worker(args):
+    """
+    PackingSolver on one connected component, shipped as plain lists.
+    """
+    ids, weights, constraints, capacities, max_size, node_limit = args
+    if len(ids) > max_size:
+        node_limit = 0
+    s = PackingSolver(weights, constraints, capacities, node_limit=node_limit)
+    return [ids[i] for i in s.results], s.obj_val, s.upper_bound, s.optimal
+
+
+def solve_packing(weights, constraints, capacities, cpus=1, max_size=200,
+                  node_limit=100000):
+    """
+    Solve the 0-1 packing problem in `PackingSolver`, with no need for MIP
+    binaries. Variables that share no constraint are independent, so the
+    problem is split into connected components that are solved separately,
+    in parallel when cpus > 1. Components larger than max_size are only
+    solved greedily. Returns the selected variables, the objective value and
+    an upper bound on the optimum.
+
+    >>> solve_packing([5, 3, 2, 4], [(1, 2)], [1])
+    ([0, 1, 3], 12, 12)
+    """
+    from jcvi.apps.grid import parallel_map
+    from jcvi.utils.grouper import UnionFind
+
+    n = len(weights)
+    # Non-positive weights never help, and a constraint with no more members
+    # than its capacity never binds
+    useful = [w > 0 for w in weights]
+    cons = []
+    for c, cap in zip(constraints, capacities):
+        c = sorted(set(x for x in c if useful[x]))
+        if len(c) > cap:
+            cons.append((c, cap))
+
+    uf = UnionFind(n)
+    for c, cap in cons:
+        uf.join(*c)
+
+    components = defaultdict(list)
+    for i in range(n):
+        if useful[i]:
+            components[uf.find(i)].append(i)
+    component_cons = defaultdict(list)
+    for c, cap in cons:
+        component_cons[uf.find(c[0])].append((c, cap))
+
+    args = []
+    for root, ids in sorted(components.items(), key=lambda x: x[1][0]):
+        local = dict((x, i) for i, x in enumerate(ids))
+        cc = component_cons[root]
+        args.append((ids, [weights[x] for x in ids],
+                     [[local[x] for x in c] for c, cap in cc],
+                     [cap for c, cap in cc], max_size, node_limit))
+
+    results, obj_val, upper_bound, nexact = [], 0, 0, 0
+    for ids, obj, bound, optimal in parallel_map(packing_worker, args,
+                                                 cpus=cpus):
+        results.extend(ids)
+        obj_val += obj
+        upper_bound += bound
+        nexact += optimal
+
+    logging.debug("{0} components, {1} solved to optimality".
+                  format(len(args), nexact))
+    if upper_bound > obj_val:
+        logging.debug("objective value ({0}), upper bound ({1}), gap {2:.2f}%".
+                      format(obj_val, upper_bound,
+                             (upper_bound - obj_val) * 100. / upper_bound))
+    else:
+        logging.debug("optimized objective value ({0})".format(obj_val))
+
+    return sorted(results), obj_val, upper_bound
+
+
 class LPInstance (object):
     """
     CPLEX LP format commonly contains three blocks:
@@ -9,7 +9,10 @@ import math
 import numpy as np
 
 
-is_symmetric = lambda M: (M.T == M).all()
+def is_symmetric(M):
+    if hasattr(M, "tocsr"):     # scipy sparse matrix
+        return (M != M.T).nnz == 0
+    return (M.T == M).all()
 
 
 def moving_sum(a, window=10):
@@ -103,15 +106,25 @@ def get_signs(M, cutoff=1e-10, validate=True, ambiguous=True):
     >>> M = np.array([[0,1,-1],[1,0,0],[-1,0,0]])
     >>> get_signs(M)
     array([ 1,  1, -1])
+
+    M can also be a scipy sparse matrix, then only the leading eigenvector is
+    computed, without converting M to a dense array.
     """
     # Is this a symmetric matrix?
     assert is_symmetric(M), "the matrix is not symmetric:\n{0}".format(str(M))
     N, x = M.shape
 
-    # eigh() works on symmetric matrix (Hermitian)
-    w, v = np.linalg.eigh(M)
-    m = np.argmax(w)
-    mv = v[:, m]
+    if hasattr(M, "tocsr") and N > 2:
+        from scipy.sparse.linalg import eigsh
+        w, v = eigsh(M.astype(float), k=1, which="LA")
+        mv = v[:, 0]
+    else:
+        if hasattr(M, "toarray"):
+            M = M.toarray()
+        # eigh() works on symmetric matrix (Hermitian)
+        w, v = np.linalg.eigh(M)
+        m = np.argmax(w)
+        mv = v[:, m]
     f = lambda x: (x if abs(x) > cutoff else 0)
     mv = [f(x) for x in mv]
 
@@ -3,7 +3,8 @@
 
 """
 TSP solver using Concorde. This is much faster than the LP-formulation in
-algorithms.lpsolve.tsp().
+algorithms.lpsolve.tsp(). When `concorde` is not installed, an in-process
+local search heuristic (LocalSearchTSP) is used instead.
 """
 from __future__ import print_function
 
@@ -11,10 +12,11 @@ import os.path as op
 import os
 import logging
 import shutil
+import time
 import numpy as np
 
 from collections import defaultdict
-from itertools import combinations
+from itertools import combinations, permutations
 
 from jcvi.formats.base import FileShredder, must_open
 from jcvi.utils.iter import pairwise
@@ -122,6 +124,195 @@ class Concorde (object):
         return tour
 
 
+class LocalSearchTSP (object):
+    """
+    Heuristic solver for directed (asymmetric) TSP instances, given as a
+    square distance matrix D where D[i, j] is the cost of going from i to j.
+
+    Each restart builds a nearest-neighbor tour and improves it with Or-opt
+    (move a segment of 1-3 cities, optionally reversed) and 2-opt (reverse a
+    segment) until no move helps. The local optimum is then repeatedly
+    perturbed with a double-bridge kick, which preserves the direction of all
+    segments, and re-optimized; a kick is kept only if it gives a shorter
+    tour. Cities carry don't-look bits: after a kick, only moves that touch
+    the cities next to a changed edge are tried, and each pass only revisits
+    the cities that the previous pass moved. Reversal costs are read off prefix sums over the tour, so every
+    candidate move of a given city is scored in one NumPy operation.
+
+    Instances of up to `exact` cities are solved by enumeration.
+    """
+    def __init__(self, D, restarts=3, kicks=50, time_budget=None, seed=666,
+                       exact=8, eps=1e-9):
+
+        D = np.asarray(D, dtype=float)
+        assert D.ndim == 2 and D.shape[0] == D.shape[1], \
+                "distance matrix must be square"
+        self.D = D
+        self.n = D.shape[0]
+        self.eps = eps
+        self.rng = np.random.RandomState(seed)
+        self.deadline = None if time_budget is None \
+                        else time.time() + time_budget
+
+        if self.n <= exact:
+            tour = self.enumerate_tours()
+        else:
+            tour = self.search(restarts, kicks)
+        self.tour = tour.tolist()
+        self.cost = self.evaluate(tour)
+        logging.debug("TSP local search: n={0}, cost={1}".\
+                        format(self.n, self.cost))
+
+    def timeout(self):
+        return self.deadline is not None and time.time() > self.deadline
+
+    def evaluate(self, tour):
+        return self.D[tour, np.roll(tour, -1)].sum()
+
+    def enumerate_tours(self):
+        n = self.n
+        best, best_cost = np.arange(n), np.inf
+        for p in permutations(range(1, n)):
+            tour = np.array((0,) + p, dtype=int)
+            cost = self.evaluate(tour)
+            if cost < best_cost:
+                best, best_cost = tour, cost
+        return best
+
+    def nearest_neighbor(self, start=0):
+        D, n = self.D, self.n
+        visited = np.zeros(n, dtype=bool)
+        tour = [start]
+        visited[start] = True
+        for i in xrange(n - 1):
+            d = np.where(visited, np.inf, D[tour[-1]])
+            b = int(d.argmin())
+            tour.append(b)
+            visited[b] = True
+        # Rotate so that city 0 comes first, all moves keep tour[0] in place
+        tour = np.array(tour, dtype=int)
+        return np.roll(tour, -int(np.flatnonzero(tour == 0)[0]))
+
+    def prefix_costs(self, tour):
+        D = self.D
+        nxt = np.roll(tour, -1)
+        F = np.concatenate(([0], np.cumsum(D[tour, nxt])))  # Forward
+        B = np.concatenate(([0], np.cumsum(D[nxt, tour])))  # Reversed
+        return nxt, F, B
+
+    def two_opt(self, tour, look, touched):
+        """
+        Reverse tour[i..j] if that shortens the tour, scanning j for each i
+        where tour[i - 1] or tour[i] is in `look`. Cities whose edges change
+        are added to `look` and `touched`.
+        """
+        D, n, eps = self.D, self.n, self.eps
+        nxt, F, B = self.prefix_costs(tour)
+        for i in xrange(1, n - 1):
+            a, ti = tour[i - 1], tour[i]
+            if not (look[a] or look[ti]):
+                continue
+            j = np.arange(i + 1, n)
+            tj, b = tour[j], nxt[j]
+            delta = D[a, tj] + D[ti, b] - D[a, ti] - D[tj, b] \
+                    + (B[j] - B[i]) - (F[j] - F[i])
+            k = delta.argmin()
+            if delta[k] < -eps:
+                jj = j[k]
+                cities = [a, ti, tour[jj], nxt[jj]]
+                look[cities] = touched[cities] = True
+                tour[i: jj + 1] = tour[i: jj + 1][::-1]
+                nxt, F, B = self.prefix_costs(tour)
+
+    def or_opt(self, tour, look, touched, maxlen=3):
+        """
+        Move tour[i..i+L-1] between two other adjacent cities, in either
+        direction, if that shortens the tour. Only segments with an end or a
+        neighbor in `look` are moved, see `two_opt()`.
+        """
+        D, n, eps = self.D, self.n, self.eps
+        nxt, F, B = self.prefix_costs(tour)
+        positions = np.arange(n)
+        for L in xrange(1, maxlen + 1):
+            i = 1
+            while i + L <= n:
+                e = i + L - 1
+                p, s, t, q = tour[i - 1], tour[i], tour[e], nxt[e]
+                if not (look[p] or look[s] or look[t] or look[q]):
+                    i += 1
+                    continue
+                gain = D[p, s] + D[t, q] - D[p, q]
+                k = positions[(positions < i - 1) | (positions > e)]
+                u, v = tour[k], nxt[k]
+                base = D[u, v]
+                fwd = D[u, s] + D[t, v] - base
+                rev = D[u, t] + D[s, v] - base + (B[e] - B[i]) - (F[e] - F[i])
+                fk, rk = fwd.argmin(), rev.argmin()
+                reverse = rev[rk] < fwd[fk]
+                kk, delta = (k[rk], rev[rk]) if reverse else (k[fk], fwd[fk])
+                if delta - gain < -eps:
+                    cities = [p, s, t, q, tour[kk], nxt[kk]]
+                    look[cities] = touched[cities] = True
+                    segment = tour[i: e + 1]
+                    if reverse:
+                        segment = segment[::-1]
+                    rest = np.concatenate((tour[:i], tour[e + 1:]))
+                    idx = kk + 1 if kk < i else kk + 1 - L
+                    tour[:] = np.concatenate((rest[:idx], segment, rest[idx:]))
+                    nxt, F, B = self.prefix_costs(tour)
+                i += 1
+
+    def local_search(self, tour, look=None):
+        """
+        Improve tour in place until no move helps. `look` is a boolean array
+        over the cities from which moves are tried, default all.
+        """
+        if look is None:
+            look = np.ones(self.n, dtype=bool)
+        while not self.timeout():
+            touched = np.zeros(self.n, dtype=bool)
+            self.or_opt(tour, look, touched)
+            self.two_opt(tour, look, touched)
+            if not touched.any():
+                break
+            look = touched
+        return tour
+
+    def double_bridge(self, tour):
+        """
+        Returns the kicked tour and the don't-look bits, with only the ends of
+        the three new edges switched on.
+        """
+        n = self.n
+        a, b, c = np.sort(self.rng.choice(np.arange(1, n), 3, replace=False))
+        tour = np.concatenate((tour[:a], tour[b:c], tour[a:b], tour[c:]))
+        look = np.zeros(n, dtype=bool)
+        for x in (a, a + c - b, c):
+            look[[tour[x - 1], tour[x]]] = True
+        return tour, look
+
+    def search(self, restarts, kicks):
+        best, best_cost = None, np.inf
+        for r in xrange(max(restarts, 1)):
+            start = 0 if r == 0 else self.rng.randint(self.n)
+            tour = self.local_search(self.nearest_neighbor(start))
+            cost = self.evaluate(tour)
+            for k in xrange(kicks):
+                if self.timeout():
+                    break
+                candidate = self.local_search(*self.double_bridge(tour))
+                candidate_cost = self.evaluate(candidate)
+                if candidate_cost < cost - self.eps:
+                    tour, cost = candidate, candidate_cost
+            if cost < best_cost:
+                best, best_cost = tour, cost
+            if self.timeout():
+                logging.debug("TSP time budget exhausted after {0} restarts".\
+                                format(r + 1))
+                break
+        return best
+
+
 def node_to_edge(edges, directed=True):
     """
     From list of edges, record per node, incoming and outgoing edges
@@ -155,21 +346,63 @@ def populate_edge_weights(edges):
     return new_edges
 
 
-def hamiltonian(edges, directed=False, precision=0):
+def edges_to_matrix(edges, nodes, directed=False):
+    """
+    Dense distance matrix over `nodes`, with one extra dummy node at the end
+    that has zero distance to and from every node. Missing edges get a penalty
+    larger than the cost of any tour that avoids them.
+
+    >>> edges_to_matrix([(1, 2, 1), (2, 3, 2)], [1, 2, 3])
+    array([[ 0.,  1., 17.,  0.],
+           [ 1.,  0.,  2.,  0.],
+           [17.,  2.,  0.,  0.],
+           [ 0.,  0.,  0.,  0.]])
+    """
+    n = len(nodes)
+    nodes_indices = dict((x, i) for i, x in enumerate(nodes))
+    weights = [abs(x[-1]) for x in edges] or [0]
+    inf = 2 * (n + 1) * max(weights) + 1
+    D = np.ones((n + 1, n + 1), dtype=float) * inf
+    for a, b, w in edges:
+        ia, ib = nodes_indices[a], nodes_indices[b]
+        D[ia, ib] = min(D[ia, ib], w)
+        if not directed:
+            D[ib, ia] = D[ia, ib]
+    D[n, :] = D[:, n] = 0
+    np.fill_diagonal(D, 0)
+    return D
+
+
+def hamiltonian(edges, directed=False, precision=0, solver=None, **kwargs):
     """
     Calculates shortest path that traverses each node exactly once. Convert
     Hamiltonian path problem to TSP by adding one dummy point that has a distance
     of zero to all your other points. Solve the TSP and get rid of the dummy
     point - what remains is the Hamiltonian Path.
 
+    `solver` is either "concorde" or "native" (LocalSearchTSP, which takes
+    extra `kwargs` such as `time_budget`). Default is concorde if it is on the
+    PATH.
+
     >>> g = [(1,2), (2,3), (3,4), (4,2), (3,5)]
     >>> hamiltonian(g)
     [1, 2, 4, 3, 5]
     >>> hamiltonian([(1, 2), (2, 3)], directed=True)
     [1, 2, 3]
+    >>> hamiltonian(g, solver="native")
+    [1, 2, 4, 3, 5]
     """
     edges = populate_edge_weights(edges)
     incident, nodes = node_to_edge(edges, directed=False)
+    if solver is None:
+        solver = "concorde" if which("concorde") else "native"
+    if solver == "native":
+        D = edges_to_matrix(edges, nodes, directed=directed)
+        tour = LocalSearchTSP(D, **kwargs).tour
+        dummy_index = tour.index(len(nodes))
+        tour = tour[dummy_index + 1:] + tour[:dummy_index]
+        return [nodes[x] for x in tour]
+
     DUMMY = "DUMMY"
     dummy_edges = edges + [(DUMMY, x, 0) for x in nodes]
     if directed:
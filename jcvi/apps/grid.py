@@ -8,6 +8,7 @@ import sys
 import re
 import logging
 
+from collections import deque
 from multiprocessing import Pool, Process, Queue, cpu_count
 
 from jcvi.formats.base import write_file, must_open
@@ -28,6 +29,63 @@ class Parallel(object):
         p.map(sh, self.cmds)
 
 
+def parallel_map(func, args, cpus=1):
+    """
+    Map func over args, in a process pool when cpus > 1. Results are returned
+    in the order of args, so that the output does not depend on cpus.
+    """
+    cpus = min(cpus, len(args))
+    if cpus <= 1:
+        return [func(x) for x in args]
+
+    p = Pool(processes=cpus)
+    results = p.map(func, args)
+    p.close()
+    p.join()
+    return results
+
+
+_pipeline_func = None
+
+
+def _pipeline_init(func):
+    global _pipeline_func
+    _pipeline_func = func
+
+
+def _pipeline_run(a):
+    return _pipeline_func(a)
+
+
+def pipeline_map(func, args, cpus=1, maxpending=None):
+    """
+    Lazy map of func over the iterable args, in a process pool when cpus > 1.
+    At most `maxpending` items (default 2 * cpus) are in flight, so args is
+    consumed only as fast as results are taken, and results are yielded in
+    input order. func is handed to the workers once when they start, not
+    pickled with every item.
+    """
+    if cpus <= 1:
+        for a in args:
+            yield func(a)
+        return
+
+    maxpending = maxpending or 2 * cpus
+    p = Pool(processes=cpus, initializer=_pipeline_init, initargs=(func,))
+    pending = deque()
+    try:
+        for a in args:
+            pending.append(p.apply_async(_pipeline_run, (a,)))
+            if len(pending) >= maxpending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        p.close()
+    finally:
+        p.terminate()
+        p.join()
+
+
 class Dependency (object):
     """
     Used by MakeManager.
@@ -22,6 +22,7 @@ from jcvi import __version__ as version
 from jcvi.algorithms.formula import reject_outliers, spearmanr
 from jcvi.algorithms.lis import longest_monotonic_subseq_length_loose as lms, \
             longest_monotonic_subsequence_loose as lmseq
+from jcvi.algorithms.graph import shortest_path_lengths
 from jcvi.algorithms.tsp import hamiltonian
 from jcvi.algorithms.matrix import determine_signs
 from jcvi.algorithms.ec import GA_setup, GA_run
@@ -127,7 +128,8 @@ class ScaffoldOO (object):
     """
     def __init__(self, lgs, scaffolds, mapc, pivot, weights, sizes,
                  function=(lambda x: x.rank), linkage=min, fwtour=None,
-                 skipconcorde=False, ngen=500, npop=100, cpus=8, seed=666):
+                 skipconcorde=False, tsp_time=30, tsp_restarts=3,
+                 ngen=500, npop=100, cpus=8, seed=666):
 
         self.lgs = lgs
         self.lengths = mapc.lengths
@@ -139,6 +141,8 @@ class ScaffoldOO (object):
         self.function = function
         self.linkage = linkage
         self.skipconcorde = skipconcorde
+        self.tsp_time = tsp_time
+        self.tsp_restarts = tsp_restarts
 
         self.prepare_linkage_groups()  # populate all data
         for mlg in self.lgs:
@@ -177,9 +181,10 @@ class ScaffoldOO (object):
             scaffolds_oo = dict(tour)
             scfs, tour, ww = self.prepare_ec(scaffolds, tour, weights)
             callbacki = partial(callback, i=i)
+            evaluator = ColinearEvaluator(scfs, ww, len(scaffolds))
             toolbox = GA_setup(tour)
-            toolbox.register("evaluate", colinear_evaluate_multi,
-                                         scfs=scfs, weights=ww)
+            toolbox.register("evaluate", evaluator)
+            toolbox.register("evaluate_batch", evaluator.evaluate_batch)
             tour, fitness = GA_run(toolbox, ngen=ngen, npop=npop, \
                                             cpus=cpus, seed=seed,
                                             callback=callbacki)
@@ -263,29 +268,30 @@ class ScaffoldOO (object):
 
         logging.debug("Graph size: |V|={0}, |E|={1}.".format(len(G), G.size()))
 
-        L = nx.all_pairs_dijkstra_path_length(G)
-        for a, b in combinations(scaffolds, 2):
-            if G.has_edge(a, b):
-                continue
-            if a in L and b in L[a]:
-                l = L[a][b]
-                G.add_edge(a, b, weight=l)
-                G.add_edge(b, a, weight=l)
+        pairs = [(a, b) for a, b in combinations(scaffolds, 2) \
+                        if not G.has_edge(a, b)]
+        L = shortest_path_lengths(G, pairs)
+        for (a, b), l in L.items():
+            G.add_edge(a, b, weight=l)
+            G.add_edge(b, a, weight=l)
 
         edges = []
         for a, b, d in G.edges(data=True):
             edges.append((a, b, d['weight']))
 
         if self.skipconcorde:
-            logging.debug("concorde-TSP skipped. Use default scaffold ordering.")
+            logging.debug("TSP skipped. Use default scaffold ordering.")
             tour = scaffolds[:]
             return tour
         try:
-            tour = hamiltonian(edges, directed=True, precision=2)
+            tour = hamiltonian(edges, directed=True, precision=2,
+                               time_budget=self.tsp_time,
+                               restarts=self.tsp_restarts)
             assert tour[0] == START and tour[-1] == END
             tour = tour[1:-1]
-        except:
-            logging.debug("concorde-TSP failed. Use default scaffold ordering.")
+        except (AssertionError, IOError) as e:
+            logging.debug("TSP failed ({0}). Use default scaffold ordering.".\
+                            format(e))
             tour = scaffolds[:]
         return tour
 
@@ -773,6 +779,57 @@ class GapEstimator (object):
             self.gapsizes.append(gapsize)
 
 
+class ColinearEvaluator(object):
+    """
+    Vectorized colinear_evaluate_multi(). The marker series of each map are
+    concatenated in the order of scaffold indices, with per-scaffold offsets.
+    The series of any tour is then a gather from the concatenated array, and
+    has the same length for all tours, so that a whole population is scored
+    at once by the compiled LIS kernel.
+    """
+    def __init__(self, scfs, weights, nscaffolds):
+        self.weights = weights
+        self.maps = []
+        for scf in scfs:
+            counts = np.zeros(nscaffolds, dtype=int)
+            values = []
+            for si in xrange(nscaffolds):
+                series = scf.get(si, [])
+                counts[si] = len(series)
+                values.extend(series)
+            starts = np.cumsum(counts) - counts
+            self.maps.append((np.array(values, dtype="float64"), starts,
+                              counts))
+
+    def series(self, tours, i):
+        """
+        Marker series of map i for each tour, as rows of a 2D array.
+        """
+        values, starts, counts = self.maps[i]
+        s = tours.ravel()
+        c = counts[s]
+        offsets = np.repeat(starts[s] - (np.cumsum(c) - c), c)
+        idx = offsets + np.arange(len(offsets))
+        return values[idx].reshape(len(tours), -1)
+
+    def evaluate_batch(self, tours):
+        """
+        Weighted scores of all tours, same as colinear_evaluate_multi().
+        """
+        from jcvi.algorithms.clis import longest_monotonic_subseq_lengths_loose
+
+        tours = np.array(tours, dtype=int).reshape(len(tours), -1)
+        scores = np.zeros(len(tours))
+        for i, w in enumerate(self.weights):
+            score, diff = longest_monotonic_subseq_lengths_loose(
+                                self.series(tours, i))
+            scores += score * w
+        return [(x,) for x in scores]
+
+    def __call__(self, tour):
+        return self.evaluate_batch([tour])[0]
+
+
 def colinear_evaluate_multi(tour, scfs, weights):
     weighted_score = 0
     for scf, w in zip(scfs, weights):
@@ -1352,6 +1409,11 @@ def path(args):
                  help="Do not visualize the alignments")
     p.add_option("--skipconcorde", default=False, action="store_true",
                  help="Skip TSP optimizer, can speed up large cases")
+    p.add_option("--tsp_time", default=30, type="float",
+                 help="Time budget in seconds per partition for the native "
+                      "TSP solver, used when concorde is not installed")
+    p.add_option("--tsp_restarts", default=3, type="int",
+                 help="Restarts of the native TSP solver")
     p.add_option("--renumber", default=False, action="store_true",
                  help="Renumber chromosome based on decreasing sizes")
     p.set_cpus(cpus=16)
@@ -1481,7 +1543,8 @@ def path(args):
         logging.debug("Working on {0} ...".format(tag))
         s = ScaffoldOO(lgs, scaffolds, cc, pivot, weights, sizes,
                        function=function, linkage=linkage, fwtour=fwtour,
-                       skipconcorde=skipconcorde,
+                       skipconcorde=skipconcorde, tsp_time=opts.tsp_time,
+                       tsp_restarts=opts.tsp_restarts,
                        ngen=ngen, npop=npop, cpus=cpus, seed=seed)
 
         solutions.append(s)
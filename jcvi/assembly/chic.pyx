@@ -12,6 +12,10 @@ Support three versions with different objective functions:
   plus the actual link distances. Maximize Sum(1 / distance) for all links.
   For performance consideration, we actually use a histogram to approximate
   all link distances. See golden_array() in hic for details.
+
+The contact matrices can either be dense numpy arrays, or scipy CSR matrices
+(with P and Q reshaped to N x 2N and N x N*BB, see CLMFile), in which case
+only the non-zero neighbors of each contig are visited.
 """
 
 from __future__ import division
@@ -23,6 +27,7 @@ import array
 
 
 ctypedef np.int_t INT
+ctypedef np.int32_t INDEX
 DEF LIMIT = 10000000
 DEF BB = 12
 cdef int *GR = \
@@ -31,7 +36,43 @@ cdef int *GR = \
        271443,  439204,  710647, 1149851]
 
 
-def score_evaluate_M(array.array[int] tour,
+def score_evaluate_M(array.array[int] tour, tour_sizes=None, tour_M=None):
+    if is_sparse(tour_M):
+        return sparse_evaluate_M(tour, tour_sizes, tour_M.indptr,
+                                 tour_M.indices, tour_M.data)
+    return dense_evaluate_M(tour, tour_sizes, tour_M)
+
+
+def score_evaluate_P(array.array[int] tour, tour_sizes=None, tour_P=None):
+    if is_sparse(tour_P):
+        return sparse_evaluate_P(tour, tour_sizes, tour_P.indptr,
+                                 tour_P.indices, tour_P.data)
+    return dense_evaluate_P(tour, tour_sizes, tour_P)
+
+
+def score_evaluate_Q(array.array[int] tour, tour_sizes=None, tour_Q=None):
+    if is_sparse(tour_Q):
+        return sparse_evaluate_Q(tour, tour_sizes, tour_Q.indptr,
+                                 tour_Q.indices, tour_Q.data)
+    return dense_evaluate_Q(tour, tour_sizes, tour_Q)
+
+
+def is_sparse(m):
+    return hasattr(m, "indptr")
+
+
+def tour_positions(array.array[int] tour, int n):
+    """
+    Position of each contig in the tour, -1 if the contig is not on the tour.
+    """
+    cdef np.ndarray[INT, ndim=1] pos = np.full(n, -1, dtype=np.int_)
+    cdef int i
+    for i in range(len(tour)):
+        pos[tour[i]] = i
+    return pos
+
+
+def dense_evaluate_M(array.array[int] tour,
                      np.ndarray[INT, ndim=1] tour_sizes=None,
                      np.ndarray[INT, ndim=2] tour_M=None):
     cdef np.ndarray[INT, ndim=1] sizes_oo = tour_sizes[tour]
@@ -56,7 +97,7 @@ def score_evaluate_M(array.array[int] tour,
     return s,
 
 
-def score_evaluate_P(array.array[int] tour,
+def dense_evaluate_P(array.array[int] tour,
                      np.ndarray[INT, ndim=1] tour_sizes=None,
                      np.ndarray[INT, ndim=3] tour_P=None):
     cdef np.ndarray[INT, ndim=1] sizes_oo = tour_sizes[tour]
@@ -80,7 +121,7 @@ def score_evaluate_P(array.array[int] tour,
     return s,
 
 
-def score_evaluate_Q(array.array[int] tour,
+def dense_evaluate_Q(array.array[int] tour,
                      np.ndarray[INT, ndim=1] tour_sizes=None,
                      np.ndarray[INT, ndim=3] tour_Q=None):
     cdef np.ndarray[INT, ndim=1] sizes_oo = tour_sizes[tour]
@@ -103,3 +144,90 @@ def score_evaluate_Q(array.array[int] tour,
                 c = tour_Q[a, b, ic]
                 s += c / (GR[ic] + dist)
     return s,
+
+
+def sparse_evaluate_M(array.array[int] tour,
+                      np.ndarray[INT, ndim=1] tour_sizes,
+                      np.ndarray[INDEX, ndim=1] indptr,
+                      np.ndarray[INDEX, ndim=1] indices,
+                      np.ndarray[INT, ndim=1] data):
+    cdef np.ndarray[INT, ndim=1] sizes_oo = tour_sizes[tour]
+    cdef np.ndarray[INT, ndim=1] sizes_cum = np.cumsum(sizes_oo) - sizes_oo // 2
+    cdef np.ndarray[INT, ndim=1] pos = tour_positions(tour, len(tour_sizes))
+
+    cdef double s = 0.0
+    cdef int size = len(tour)
+    cdef int a, b, ia, ib, k
+    cdef double dist
+    for ia in range(size):
+        a = tour[ia]
+        for k in range(indptr[a], indptr[a + 1]):
+            b = indices[k]
+            ib = pos[b]
+            if ib <= ia:
+                continue
+            dist = sizes_cum[ib] - sizes_cum[ia]
+            if dist > LIMIT:
+                continue
+            s += data[k] / dist
+    return s,
+
+
+def sparse_evaluate_P(array.array[int] tour,
+                      np.ndarray[INT, ndim=1] tour_sizes,
+                      np.ndarray[INDEX, ndim=1] indptr,
+                      np.ndarray[INDEX, ndim=1] indices,
+                      np.ndarray[INT, ndim=1] data):
+    cdef np.ndarray[INT, ndim=1] sizes_oo = tour_sizes[tour]
+    cdef np.ndarray[INT, ndim=1] sizes_cum = np.cumsum(sizes_oo)
+    cdef np.ndarray[INT, ndim=1] pos = tour_positions(tour, len(tour_sizes))
+
+    cdef double s = 0.0
+    cdef int size = len(tour)
+    cdef int a, b, j, ia, ib, k
+    cdef double dist
+    for ia in range(size):
+        a = tour[ia]
+        # Columns 2b and 2b+1 hold the number of links and their harmonic mean
+        for k in range(indptr[a], indptr[a + 1] - 1):
+            j = indices[k]
+            if j % 2 or indices[k + 1] != j + 1:
+                continue
+            b = j // 2
+            ib = pos[b]
+            if ib <= ia:
+                continue
+            dist = sizes_cum[ib - 1] - sizes_cum[ia]
+            if dist > LIMIT:
+                continue
+            s += data[k] / (data[k + 1] + dist)
+    return s,
+
+
+def sparse_evaluate_Q(array.array[int] tour,
+                      np.ndarray[INT, ndim=1] tour_sizes,
+                      np.ndarray[INDEX, ndim=1] indptr,
+                      np.ndarray[INDEX, ndim=1] indices,
+                      np.ndarray[INT, ndim=1] data):
+    cdef np.ndarray[INT, ndim=1] sizes_oo = tour_sizes[tour]
+    cdef np.ndarray[INT, ndim=1] sizes_cum = np.cumsum(sizes_oo)
+    cdef np.ndarray[INT, ndim=1] pos = tour_positions(tour, len(tour_sizes))
+
+    cdef double s = 0.0
+    cdef int size = len(tour)
+    cdef int a, b, j, ia, ib, k
+    cdef double dist
+    for ia in range(size):
+        a = tour[ia]
+        # Column b * BB + ic holds the number of links in golden bin ic
+        for k in range(indptr[a], indptr[a + 1]):
+            j = indices[k]
+            b = j // BB
+            ib = pos[b]
+            if ib <= ia:
+                continue
+            dist = sizes_cum[ib - 1] - sizes_cum[ia]
+            if dist > LIMIT:
+                continue
+            s += data[k] / (GR[j % BB] + dist)
+    return s,
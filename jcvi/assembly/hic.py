@@ -17,10 +17,9 @@ import math
 
 from collections import defaultdict
 from functools import partial
-from multiprocessing import Pool
 
 from jcvi.algorithms.formula import outlier_cutoff
-from jcvi.algorithms.ec import GA_setup, GA_run
+from jcvi.algorithms.ec import GA_setup, GA_run, genome_mutation
 from jcvi.algorithms.matrix import get_signs
 from jcvi.apps.base import OptionParser, ActionDispatcher, backup, iglob, \
     mkdir, symlink
@@ -47,6 +46,30 @@ BB = UB - LB + 1    # Span for golden_array()
 ACCEPT = green("ACCEPT")
 REJECT = red("REJECT")
 BINSIZE = 50000
+LIMIT = 10000000    # Links further apart are not scored, same as chic
+GR = np.array([5778, 9349, 15127, 24476, 39603, 64079, 103682, 167761,
+               271443, 439204, 710647, 1149851])
+# One record per contig pair in the CLM file, golden is indexed by the
+# orientations of a and b, 0 for '-' and 1 for '+'
+CLM_DTYPE = np.dtype([("a", "<i4"), ("b", "<i4"), ("links", "<i4"),
+                      ("strandedness", "<i4"), ("md", "<i4"), ("mh", "<i4"),
+                      ("golden", "<i4", (2, 2, BB))])
+CLMBIN_MAGIC = b"CLMBIN1\n"
+
+
+def active_property(func):
+    """ Property of CLMFile that is computed once, and kept until the set of
+    active contigs changes.
+    """
+    name = func.__name__
+
+    def getter(self):
+        if name not in self._cache:
+            self._cache[name] = func(self)
+        return self._cache[name]
+
+    getter.__doc__ = func.__doc__
+    return property(getter)
 
 
 class ContigOrderingLine(object):
@@ -86,7 +109,35 @@ class ContigOrdering(LineFile):
                      gapsize=gapsize, gaptype=gaptype, evidence=evidence)
 
 
-class CLMFile:
+class CLMRecords(object):
+    """ Rows of CLM_DTYPE records, with a and b replaced by contig indices
+    of the caller. A column is only read, for the selected rows, when it is
+    accessed, so a memory-mapped binary CLM is never copied as a whole.
+    """
+    def __init__(self, records, rows, a, b):
+        self.records = records
+        self.rows = rows
+        self.a = a
+        self.b = b
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, field):
+        if field == "a":
+            return self.a
+        if field == "b":
+            return self.b
+        return self.records[field][self.rows]
+
+    def select(self, a, b):
+        """ Rows where both a and b are >= 0, with a and b replaced.
+        """
+        keep = np.flatnonzero((a >= 0) & (b >= 0))
+        return CLMRecords(self.records, self.rows[keep], a[keep], b[keep])
+
+
+class CLMFile(object):
     '''CLM file (modified) has the following format:
 
     tig00046211+ tig00063795+       1       53173
@@ -130,6 +181,7 @@ class CLMFile:
 
         # Arrange contig names and sizes
         _tigs, _sizes = zip(*tigs)
+        self.ids = list(_tigs)
         self.contigs = set(_tigs)
         self.sizes = np.array(_sizes)
         self.tig_to_size = dict(tigs)
@@ -138,39 +190,65 @@ class CLMFile:
         self.active = set(_tigs)
 
     def parse_clm(self):
+        """ Load the contacts into self.records (see CLMRecords), where a and
+        b index into self.ids. The binary file from `clm2bin` is used instead
+        of the CLM file when it is up-to-date.
+        """
         clmfile = self.clmfile
-        logging.debug("Parse clmfile `{}`".format(clmfile))
-        fp = open(clmfile)
-        contacts = {}
+        binfile = clmfile + ".bin"
+        if op.exists(binfile) and (not op.exists(clmfile) or
+                                   op.getmtime(binfile) >= op.getmtime(clmfile)):
+            logging.debug("Load binary clmfile `{}`".format(binfile))
+            ids, records = read_clm_bin(binfile)
+        else:
+            logging.debug("Parse clmfile `{}`".format(clmfile))
+            ids, records = read_clm_text(clmfile)
+
+        # Map to the contigs in the idsfile
+        tig_to_gid = dict((x, i) for (i, x) in enumerate(self.ids))
+        gids = np.array([tig_to_gid.get(x, -1) for x in ids], dtype=int)
+        if len(records):
+            a, b = gids[records["a"]], gids[records["b"]]
+        else:
+            a = b = np.zeros(0, dtype=int)
+        rows = np.arange(len(records))
+        self.records = CLMRecords(records, rows, a, b).select(a, b)
+
+    @property
+    def contacts(self):
+        """ Number of links between contig pairs, {(at, bt): links}.
+        """
+        ids, r = self.ids, self.records
+        return dict(((ids[a], ids[b]), links) for a, b, links in
+                    zip(r["a"], r["b"], r["links"]))
+
+    @property
+    def orientations(self):
+        """ Strandedness of the contig pairs, {(at, bt): (strandedness,
+        links, harmonic mean of link distances)}, taken from the orientation
+        with the shortest harmonic mean.
+        """
+        ids, r = self.ids, self.records
+        return dict(((ids[a], ids[b]), (strandedness, md, mh)) for
+                    a, b, strandedness, md, mh in
+                    zip(r["a"], r["b"], r["strandedness"], r["md"], r["mh"]))
+
+    @property
+    def contacts_oriented(self):
+        """ The golden_array() of link distances for each orientation,
+        {(at, bt): {(ao, bo): counts}}, in both (at, bt) and (bt, at).
+        """
+        ids = self.ids
         contacts_oriented = defaultdict(dict)
-        orientations = defaultdict(list)
-        for row in fp:
-            atoms = row.strip().split('\t')
-            assert len(atoms) == 3, "Malformed line `{}`".format(atoms)
-            abtig, links, dists = atoms
-            atig, btig = abtig.split()
-            at, ao = atig[:-1], atig[-1]
-            bt, bo = btig[:-1], btig[-1]
-            if at not in self.tig_to_size:
-                continue
-            if bt not in self.tig_to_size:
-                continue
-            dists = [int(x) for x in dists.split()]
-            contacts[(at, bt)] = len(dists)
-            gdists = golden_array(dists)
-            contacts_oriented[(at, bt)][(FF[ao], FF[bo])] = gdists
-            contacts_oriented[(bt, at)][(RR[bo], RR[ao])] = gdists
-            strandedness = 1 if ao == bo else -1
-            orientations[(at, bt)].append((strandedness, dists))
-
-        self.contacts = contacts
-        self.contacts_oriented = contacts_oriented
-        # Preprocess the orientations dict
-        for (at, bt), dists in orientations.items():
-            dists = [(s, d, hmean_int(d)) for (s, d) in dists]
-            strandedness, md, mh = min(dists, key=lambda x: x[-1])
-            orientations[(at, bt)] = (strandedness, len(md), mh)
-        self.orientations = orientations
+        for a, b, golden in zip(self.records["a"], self.records["b"],
+                                self.records["golden"]):
+            at, bt = ids[a], ids[b]
+            for ao in (-1, 1):
+                for bo in (-1, 1):
+                    gdists = golden[(ao + 1) // 2, (bo + 1) // 2]
+                    contacts_oriented[(at, bt)][(ao, bo)] = gdists
+                    contacts_oriented[(bt, at)][(-bo, -ao)] = gdists
+        return contacts_oriented
 
     def calculate_densities(self):
         """
@@ -178,18 +256,20 @@ class CLMFile:
         considered to have high level of inter-contig links in the current
         partition.
         """
-        active = self.active
-        densities = defaultdict(int)
-        for (at, bt), links in self.contacts.items():
-            if not (at in active and bt in active):
-                continue
-            densities[at] += links
-            densities[bt] += links
+        active = self.active_index >= 0
+        a, b, links = self.records["a"], self.records["b"], \
+            self.records["links"]
+        keep = active[a] & active[b]
+        n = len(self.ids)
+        densities = np.bincount(a[keep], links[keep], minlength=n) + \
+            np.bincount(b[keep], links[keep], minlength=n)
+        linked = np.bincount(np.concatenate((a[keep], b[keep])), minlength=n)
 
         logdensities = {}
-        for x, d in densities.items():
+        for i in np.flatnonzero(linked):
+            x = self.ids[i]
             s = self.tig_to_size[x]
-            logd = np.log10(d * 1. / min(s, 500000))
+            logd = np.log10(densities[i] * 1. / min(s, 500000))
             logdensities[x] = logd
 
         return logdensities
@@ -284,18 +364,25 @@ class CLMFile:
         logging.debug("{}: {} => {} {}"
                       .format(method, score, score_flipped, tag))
 
+    def scorer(self, tour):
+        """ Incremental scorer on the current tour, see TourScorer.
+        """
+        return TourScorer(tour, self.active_sizes, self.M,
+                          oriented=self.oriented)
+
     def flip_all(self, tour):
         """ Initialize the orientations based on pairwise O matrix.
         """
+        scorer = self.scorer(tour)
         if self.signs is None:  # First run
             score = 0
         else:
             old_signs = self.signs[:self.N]
-            score, = self.evaluate_tour_Q(tour)
+            score = scorer.score_Q(self.signs)
 
         # Remember we cannot have ambiguous orientation code (0 or '?') here
         self.signs = get_signs(self.O, validate=False, ambiguous=False)
-        score_flipped, = self.evaluate_tour_Q(tour)
+        score_flipped = scorer.score_Q(self.signs)
         if score_flipped >= score:
             tag = ACCEPT
         else:
@@ -307,9 +394,10 @@ class CLMFile:
     def flip_whole(self, tour):
         """ Test flipping all contigs at the same time to see if score improves.
         """
-        score, = self.evaluate_tour_Q(tour)
+        scorer = self.scorer(tour)
+        score = scorer.score_Q(self.signs)
         self.signs = -self.signs
-        score_flipped, = self.evaluate_tour_Q(tour)
+        score_flipped = scorer.score_Q(self.signs)
         if score_flipped > score:
             tag = ACCEPT
         else:
@@ -320,20 +408,20 @@ class CLMFile:
 
     def flip_one(self, tour):
         """ Test flipping every single contig sequentially to see if score
-        improves.
+        improves. Each flip only rescores the links of the flipped contig.
         """
         n_accepts = n_rejects = 0
         any_tag_ACCEPT = False
+        scorer = self.scorer(tour)
+        score = scorer.score_Q(self.signs)
         for i, t in enumerate(tour):
-            if i == 0:
-                score, = self.evaluate_tour_Q(tour)
-            self.signs[t] = -self.signs[t]
-            score_flipped, = self.evaluate_tour_Q(tour)
-            if score_flipped > score:
+            delta = scorer.flip_delta_Q(i, self.signs)
+            score_flipped = score + delta
+            if delta > 0:
+                self.signs[t] = -self.signs[t]
                 n_accepts += 1
                 tag = ACCEPT
             else:
-                self.signs[t] = -self.signs[t]
                 n_rejects += 1
                 tag = REJECT
             self.flip_log("FLIPONE ({}/{})".format(i + 1, len(self.signs)),
@@ -345,26 +433,19 @@ class CLMFile:
                       .format(n_accepts, n_rejects))
         return ACCEPT if any_tag_ACCEPT else REJECT
 
-    def prune_tour(self, tour, cpus):
+    def prune_tour(self, tour):
         """ Test deleting each contig and check the delta_score; tour here must
         be an array of ints.
         """
         while True:
-            tour_score, = self.evaluate_tour_M(tour)
+            scorer = TourScorer(tour, self.active_sizes, self.M)
+            tour_score = scorer.score_M()
             logging.debug("Starting score: {}".format(tour_score))
-            active_sizes = self.active_sizes
-            M = self.M
-            args = []
+            results = []
             for i, t in enumerate(tour):
-                stour = tour[:i] + tour[i + 1:]
-                args.append((t, stour, tour_score, active_sizes, M))
-
-            # Parallel run
-            p = Pool(processes=cpus)
-            results = list(p.imap(prune_tour_worker, args))
-            assert len(tour) == len(results), \
-                "Array size mismatch, tour({}) != results({})"\
-                .format(len(tour), len(results))
+                delta_score = -scorer.remove_delta_M(i)
+                log10d = np.log10(delta_score) if delta_score > 1e-9 else -9
+                results.append((t, log10d))
 
             # Identify outliers
             active_contigs = self.active_contigs
@@ -389,12 +470,21 @@ class CLMFile:
         return tour
 
     @property
+    def active(self):
+        return self._active
+
+    @active.setter
+    def active(self, tigs):
+        self._active = tigs
+        self._cache = {}
+
+    @active_property
     def active_contigs(self):
         return list(self.active)
 
-    @property
+    @active_property
     def active_sizes(self):
-        return np.array([self.tig_to_size[x] for x in self.active])
+        return np.array([self.tig_to_size[x] for x in self.active_contigs])
 
     @property
     def N(self):
@@ -404,46 +494,67 @@ class CLMFile:
     def oo(self):
         return range(self.N)
 
-    @property
+    @active_property
     def tig_to_idx(self):
-        return dict((x, i) for (i, x) in enumerate(self.active))
+        return dict((x, i) for (i, x) in enumerate(self.active_contigs))
 
-    @property
+    @active_property
+    def active_index(self):
+        """ Index of each contig in self.ids among the active contigs, -1 if
+        the contig is not active.
+        """
+        tig_to_idx = self.tig_to_idx
+        return np.array([tig_to_idx.get(x, -1) for x in self.ids], dtype=int)
+
+    @active_property
+    def active_records(self):
+        """ Records between active contigs, with a and b converted to the
+        indices of the active contigs.
+        """
+        active_index = self.active_index
+        a, b = active_index[self.records["a"]], active_index[self.records["b"]]
+        return self.records.select(a, b)
+
+    def symmetric_matrix(self, ai, bi, values):
+        """
+        Sparse N x (N * ncols) matrix, where cell (ai, bi * ncols + c) and
+        (bi, ai * ncols + c) contain values[:, c]. If a contig pair occurs more
+        than once, the last values are used.
+        """
+        from scipy.sparse import coo_matrix
+
+        N = self.N
+        values = np.asarray(values, dtype=int).reshape(len(ai), -1)
+        ncols = values.shape[1]
+        idx = last_unique(np.minimum(ai, bi) * N + np.maximum(ai, bi))
+        ai, bi, values = ai[idx], bi[idx], values[idx]
+        c = np.arange(ncols)
+        rows = np.repeat(np.concatenate((ai, bi)), ncols)
+        cols = (np.concatenate((bi, ai))[:, None] * ncols + c).ravel()
+        data = np.concatenate((values, values)).ravel()
+        return coo_matrix((data, (rows, cols)), shape=(N, N * ncols)).tocsr()
+
+    @active_property
     def M(self):
         """
         Contact frequency matrix. Each cell contains how many inter-contig
-        links between i-th and j-th contigs.
+        links between i-th and j-th contigs. This is a sparse matrix, that only
+        stores the contig pairs with links.
         """
-        N = self.N
-        tig_to_idx = self.tig_to_idx
-        M = np.zeros((N, N), dtype=int)
-        for (at, bt), links in self.contacts.items():
-            if not (at in tig_to_idx and bt in tig_to_idx):
-                continue
-            ai = tig_to_idx[at]
-            bi = tig_to_idx[bt]
-            M[ai, bi] = M[bi, ai] = links
-        return M
+        r = self.active_records
+        return self.symmetric_matrix(r["a"], r["b"], r["links"])
 
-    @property
+    @active_property
     def O(self):
         """
         Pairwise strandedness matrix. Each cell contains whether i-th and j-th
         contig are the same orientation +1, or opposite orientation -1.
         """
-        N = self.N
-        tig_to_idx = self.tig_to_idx
-        O = np.zeros((N, N), dtype=int)
-        for (at, bt), (strandedness, md, mh) in self.orientations.items():
-            if not (at in tig_to_idx and bt in tig_to_idx):
-                continue
-            ai = tig_to_idx[at]
-            bi = tig_to_idx[bt]
-            score = strandedness * md
-            O[ai, bi] = O[bi, ai] = score
-        return O
+        r = self.active_records
+        return self.symmetric_matrix(r["a"], r["b"],
+                                     r["strandedness"] * r["md"])
 
-    @property
+    @active_property
     def P(self):
         """
         Contact frequency matrix with better precision on distance between
@@ -452,18 +563,13 @@ class CLMFile:
         harmonic mean of the links for the orientation configuration that is
         shortest. This offers better precision for the distance between big
         contigs.
+
+        The sparse matrix is N x 2N, where cells (i, 2j) and (i, 2j + 1) hold
+        the number of links and their harmonic mean.
         """
-        N = self.N
-        tig_to_idx = self.tig_to_idx
-        P = np.zeros((N, N, 2), dtype=int)
-        for (at, bt), (strandedness, md, mh) in self.orientations.items():
-            if not (at in tig_to_idx and bt in tig_to_idx):
-                continue
-            ai = tig_to_idx[at]
-            bi = tig_to_idx[bt]
-            P[ai, bi, 0] = P[bi, ai, 0] = md
-            P[ai, bi, 1] = P[bi, ai, 1] = mh
-        return P
+        r = self.active_records
+        return self.symmetric_matrix(r["a"], r["b"],
+                                     np.column_stack((r["md"], r["mh"])))
 
     @property
     def Q(self):
@@ -471,21 +577,229 @@ class CLMFile:
         Contact frequency matrix when contigs are already oriented. This is s a
         similar matrix as M, but rather than having the number of links in the
         cell, it points to an array that has the actual distances.
+
+        The sparse matrix is N x N*BB, where cells (i, j * BB) .. (i, j * BB +
+        BB - 1) hold the golden_array() of links between i-th and j-th contigs,
+        in their current orientations.
         """
+        from scipy.sparse import coo_matrix
+
         N = self.N
-        tig_to_idx = self.tig_to_idx
-        signs = self.signs
-        Q = np.ones((N, N, BB), dtype=int) * -1  # Use -1 as the sentinel
-        for (at, bt), k in self.contacts_oriented.items():
-            if not (at in tig_to_idx and bt in tig_to_idx):
-                continue
-            ai = tig_to_idx[at]
-            bi = tig_to_idx[bt]
-            ao = signs[ai]
-            bo = signs[bi]
-            Q[ai, bi] = k[(ao, bo)]
+        ai, bi, table = self.oriented_table
+        signs = (self.signs[:N] + 1) // 2
+        data = table[np.arange(len(ai)), signs[ai], signs[bi]].astype(int)
+        rows = np.repeat(ai, BB)
+        cols = (bi[:, None] * BB + np.arange(BB)).ravel()
+        Q = coo_matrix((data.ravel(), (rows, cols)), shape=(N, N * BB))
+        Q = Q.tocsr()
+        Q.eliminate_zeros()
         return Q
 
+    @active_property
+    def oriented_table(self):
+        """
+        The oriented contacts as arrays: contig indices ai, bi and a table of
+        golden_array() with shape (len(ai), 2, 2, BB), indexed by the
+        orientations of ai and bi, 0 for '-' and 1 for '+'. Both (ai, bi) and
+        (bi, ai) are included.
+        """
+        r = self.active_records
+        N = self.N
+        ai = np.concatenate((r["a"], r["b"]))
+        bi = np.concatenate((r["b"], r["a"]))
+        # Reverse orientation: b in (-bo) followed by a in (-ao)
+        reverse = r["golden"][:, ::-1, ::-1].transpose(0, 2, 1, 3)
+        table = np.concatenate((r["golden"], reverse))
+        idx = last_unique(ai * N + bi)
+        return ai[idx], bi[idx], table[idx]
+
+    @active_property
+    def oriented(self):
+        """
+        Same content as matrix Q, but keeps all orientations and only the
+        contig pairs that have links, keyed by the contig indices. This is what
+        TourScorer uses to rescore a flip without rebuilding Q.
+        """
+        oriented = {}
+        for a, b, golden in zip(*self.oriented_table):
+            oriented[(a, b)] = dict(((ao, bo), golden[(ao + 1) // 2,
+                                                      (bo + 1) // 2])
+                                    for ao in (-1, 1) for bo in (-1, 1))
+        return oriented
+
+
+class TourScorer(object):
+    """
+    Incremental version of score_evaluate_M() and score_evaluate_Q() in chic.
+    The contig ends and mid-points along the tour are kept as cumulative
+    arrays, so that the score change of a move only involves the contigs it
+    touches and their non-zero neighbors in the sparse matrix M within LIMIT,
+    rather than the whole tour.
+
+    `oriented` maps pairs of contig indices (a, b), a before b in the tour, to
+    a dict of the golden_array() counts for each orientation (ao, bo), this
+    is what matrix Q is built from. It is only needed for the Q scores.
+    """
+    def __init__(self, tour, tour_sizes, tour_M, oriented=None):
+        from scipy.sparse import csr_matrix
+
+        self.sizes = np.asarray(tour_sizes)
+        self.M = csr_matrix(tour_M)
+        self.oriented = oriented
+        if oriented is not None:
+            self.partners = defaultdict(list)
+            for a, b in oriented:
+                self.partners[a].append(b)
+        self.set_tour(tour)
+
+    def set_tour(self, tour):
+        self.tour = np.array(tour, dtype=int)
+        sizes_oo = self.sizes[self.tour]
+        self.ends = np.cumsum(sizes_oo)
+        self.mids = self.ends - sizes_oo // 2
+        self.pos = np.full(len(self.sizes), -1, dtype=int)
+        self.pos[self.tour] = np.arange(len(self.tour))
+        # Mid-points indexed by contig rather than by position
+        self.tig_mids = np.zeros(len(self.sizes), dtype=int)
+        self.tig_mids[self.tour] = self.mids
+
+    def window_score_M(self, tigs):
+        """
+        Score of the contig pairs that involve any of tigs. Only the non-zero
+        neighbors of tigs in matrix M are visited.
+        """
+        sub = self.M[tigs].tocoo()
+        a, b = tigs[sub.row], sub.col
+        keep = (self.pos[b] >= 0) & ((b > a) | ~np.in1d(b, tigs))
+        dist = np.abs(self.tig_mids[b] - self.tig_mids[a])
+        keep &= dist <= LIMIT
+        return np.true_divide(sub.data[keep], dist[keep]).sum()
+
+    def score_M(self):
+        return self.window_score_M(self.tour)
+
+    def segment_mids(self, p, segment):
+        sizes_oo = self.sizes[segment]
+        start = self.ends[p - 1] if p else 0
+        ends = start + np.cumsum(sizes_oo)
+        return ends, ends - sizes_oo // 2
+
+    def move_delta_M(self, p, q, segment):
+        """
+        Score change when positions p .. q-1 are replaced by segment, which is
+        a rearrangement of the same contigs (reversal, transposition, etc.).
+        Contigs outside p .. q-1 stay at the same place.
+        """
+        segment = np.array(segment, dtype=int)
+        old = self.window_score_M(segment)
+        saved = self.tig_mids[segment]
+        self.tig_mids[segment] = self.segment_mids(p, segment)[1]
+        new = self.window_score_M(segment)
+        self.tig_mids[segment] = saved
+        return new - old
+
+    def move(self, p, q, segment):
+        """
+        Apply the rearrangement in move_delta_M().
+        """
+        segment = np.array(segment, dtype=int)
+        self.tour[p:q] = segment
+        self.ends[p:q], self.mids[p:q] = self.segment_mids(p, segment)
+        self.pos[segment] = np.arange(p, q)
+        self.tig_mids[segment] = self.mids[p:q]
+
+    def remove_delta_M(self, i):
+        """
+        Score change when the contig at position i is removed. Only the pairs
+        that involve i, or that span i within LIMIT, are affected.
+        """
+        tour, mids = self.tour, self.mids
+        size = self.sizes[tour[i]]
+        old = self.window_score_M(tour[i:i + 1])
+        # Contigs after i move closer by size
+        lo = np.searchsorted(mids, mids[i] - size - LIMIT, side="left")
+        left = tour[lo:i]
+        sub = self.M[left].tocoo()
+        a, b = left[sub.row], sub.col
+        keep = self.pos[b] > i
+        D = self.tig_mids[b[keep]] - self.tig_mids[a[keep]]
+        W = sub.data[keep]
+        before = np.true_divide(W, D)[D <= LIMIT].sum()
+        after = np.true_divide(W, D - size)[D - size <= LIMIT].sum()
+        return after - before - old
+
+    def pair_score_Q(self, a, b, gap, signs):
+        """
+        Score of contig a before contig b, with gap bases in between.
+        """
+        if gap > LIMIT:
+            return 0
+        k = self.oriented.get((a, b))
+        if k is None:
+            return 0
+        counts = k.get((signs[a], signs[b]))
+        if counts is None:
+            return 0
+        return np.true_divide(counts, GR + gap).sum()
+
+    def gap(self, pa, pb):
+        return self.ends[pb - 1] - self.ends[pa]
+
+    def score_Q(self, signs):
+        pos = self.pos
+        s = 0.
+        for a, b in self.oriented:
+            pa, pb = pos[a], pos[b]
+            if pa < 0 or pb < 0 or pa >= pb:
+                continue
+            s += self.pair_score_Q(a, b, self.gap(pa, pb), signs)
+        return s
+
+    def flip_delta_Q(self, i, signs):
+        """
+        Score change when the orientation of the contig at position i flips.
+        """
+        a = self.tour[i]
+        pos = self.pos
+        flipped = signs.copy()
+        flipped[a] = -flipped[a]
+        delta = 0.
+        for b in self.partners[a]:
+            pb = pos[b]
+            if pb < 0 or pb == i:
+                continue
+            pair = (a, b, self.gap(i, pb)) if i < pb else \
+                   (b, a, self.gap(pb, i))
+            delta += self.pair_score_Q(*(pair + (flipped,))) - \
+                     self.pair_score_Q(*(pair + (signs,)))
+        return delta
+
+
+class TourMoveDelta(object):
+    """
+    Score change of score_evaluate_M() for a mutation in algorithms.ec, to be
+    used as `delta` in genome_mutation(). A single `TourScorer` is kept, and
+    moved to the parent tour of each mutation by rearranging only the span
+    where it differs from the previous one.
+    """
+    def __init__(self, tour_sizes, tour_M):
+        self.tour_sizes = tour_sizes
+        self.tour_M = tour_M
+        self.scorer = None
+
+    def __call__(self, tour, p, q, segment):
+        tour = np.array(tour, dtype=int)
+        scorer = self.scorer
+        if scorer is None or len(scorer.tour) != len(tour):
+            scorer = self.scorer = TourScorer(tour, self.tour_sizes,
+                                              self.tour_M)
+        else:
+            diff = np.flatnonzero(scorer.tour != tour)
+            if len(diff):
+                a, b = diff[0], diff[-1] + 1
+                scorer.move(a, b, tour[a:b])
+        return scorer.move_delta_M(p, q, segment)
+
 
 def hmean_int(a, a_min=5778, a_max=1149851):
     """ Harmonic mean of an array, returns the closest int
@@ -494,6 +808,14 @@ def hmean_int(a, a_min=5778, a_max=1149851):
     return int(round(hmean(np.clip(a, a_min, a_max))))
 
 
+def golden_bins(a, phi=1.61803398875, lb=LB, ub=UB):
+    """ Index of the golden_array() bin of each value in a.
+    """
+    # Same as int(round(math.log(x, phi))) for positive x
+    c = np.floor(np.log(a) / math.log(phi) + .5).astype(int)
+    return np.clip(c, lb, ub) - lb
+
+
 def golden_array(a, phi=1.61803398875, lb=LB, ub=UB):
     """ Given list of ints, we aggregate similar values so that it becomes an
     array of multiples of phi, where phi is the golden ratio.
@@ -506,27 +828,110 @@ def golden_array(a, phi=1.61803398875, lb=LB, ub=UB):
     discussion here:
     <https://www.johndcook.com/blog/2017/03/22/golden-powers-are-nearly-integers/>
     """
-    counts = np.zeros(BB, dtype=int)
-    for x in a:
-        c = int(round(math.log(x, phi)))
-        if c < lb:
-            c = lb
-        if c > ub:
-            c = ub
-        counts[c - lb] += 1
-    return counts
-
-
-def prune_tour_worker(arg):
-    """ Worker thread for CLMFile.prune_tour()
+    c = golden_bins(np.asarray(a, dtype="float64"), phi=phi, lb=lb, ub=ub)
+    return np.bincount(c, minlength=BB)
+
+
+def last_unique(keys):
+    """ Indices of the last occurrence of each unique key.
+    """
+    keys = np.asarray(keys)
+    _, idx = np.unique(keys[::-1], return_index=True)
+    return np.sort(len(keys) - 1 - idx)
+
+
+def read_clm_text(clmfile):
+    """ Parse the CLM file into contig ids, and an array of CLM_DTYPE records
+    where a and b index into the ids. All link distances are binned at once.
     """
-    from .chic import score_evaluate_M
+    ids, tig_to_gid = [], {}
+    pair_to_idx = {}
+    pairs, strands, aos, bos, dists = [], [], [], [], []
+    fp = open(clmfile)
+    for row in fp:
+        atoms = row.strip().split('\t')
+        assert len(atoms) == 3, "Malformed line `{}`".format(atoms)
+        abtig, links, d = atoms
+        atig, btig = abtig.split()
+        at, ao = atig[:-1], atig[-1]
+        bt, bo = btig[:-1], btig[-1]
+        for t in (at, bt):
+            if t not in tig_to_gid:
+                tig_to_gid[t] = len(ids)
+                ids.append(t)
+        pair = (tig_to_gid[at], tig_to_gid[bt])
+        if pair not in pair_to_idx:
+            pair_to_idx[pair] = len(pair_to_idx)
+        pairs.append(pair_to_idx[pair])
+        strands.append(1 if ao == bo else -1)
+        aos.append(FF[ao])
+        bos.append(FF[bo])
+        dists.append(np.fromstring(d, dtype=int, sep=" "))
+    fp.close()
 
-    t, stour, tour_score, active_sizes, M = arg
-    stour_score, = score_evaluate_M(stour, active_sizes, M)
-    delta_score = tour_score - stour_score
-    log10d = np.log10(delta_score) if delta_score > 1e-9 else -9
-    return t, log10d
+    records = np.zeros(len(pair_to_idx), dtype=CLM_DTYPE)
+    if not dists:
+        return ids, records
+    pairs, strands = np.array(pairs), np.array(strands)
+    aos, bos = (np.array(aos) + 1) // 2, (np.array(bos) + 1) // 2
+    n = np.array([len(x) for x in dists])
+    lines = np.repeat(np.arange(len(dists)), n)
+    dists = np.concatenate(dists).astype("float64")
+
+    # Histograms and the harmonic means, as in hmean_int(), of each line
+    golden = np.bincount(lines * BB + golden_bins(dists),
+                         minlength=len(n) * BB).reshape(-1, BB)
+    inverse = np.bincount(lines, 1. / np.clip(dists, 5778, 1149851),
+                          minlength=len(n))
+    mh = np.floor(n / inverse + .5).astype(int)
+
+    gids = np.array(sorted(pair_to_idx, key=pair_to_idx.get)).reshape(-1, 2)
+    records["a"], records["b"] = gids[:, 0], gids[:, 1]
+    # Pairs need not be on adjacent lines, the last line of a pair wins
+    last = last_unique(pairs)
+    records["links"][pairs[last]] = n[last]
+    records["golden"][pairs, aos, bos] = golden
+    # The orientation with the shortest harmonic mean, first one if tied
+    order = np.lexsort((np.arange(len(n)), mh, pairs))
+    _, first = np.unique(pairs[order], return_index=True)
+    best = order[first]
+    records["strandedness"] = strands[best]
+    records["md"] = n[best]
+    records["mh"] = mh[best]
+    return ids, records
+
+
+def write_clm_bin(binfile, ids, records):
+    """ Binary CLM: magic line, header size, JSON header with the contig ids,
+    then the CLM_DTYPE records.
+    """
+    header = json.dumps({"ids": ids, "records": len(records)}).encode("utf-8")
+    # Pad the header so that the records are 8-byte aligned
+    header += b" " * (-(len(CLMBIN_MAGIC) + 8 + len(header)) % 8)
+    fw = open(binfile, "wb")
+    fw.write(CLMBIN_MAGIC)
+    fw.write(np.array([len(header)], dtype="<i8").tobytes())
+    fw.write(header)
+    fw.write(np.ascontiguousarray(records, dtype=CLM_DTYPE).tobytes())
+    fw.close()
+
+
+def read_clm_bin(binfile):
+    """ Read the binary CLM from write_clm_bin(), the records are memory-mapped.
+    """
+    fp = open(binfile, "rb")
+    magic = fp.read(len(CLMBIN_MAGIC))
+    assert magic == CLMBIN_MAGIC, "`{}` is not a binary CLM".format(binfile)
+    size, = np.frombuffer(fp.read(8), dtype="<i8")
+    header = json.loads(fp.read(size).decode("utf-8"))
+    fp.close()
+    nrecords = header["records"]
+    if not nrecords:
+        return header["ids"], np.zeros(0, dtype=CLM_DTYPE)
+    offset = len(CLMBIN_MAGIC) + 8 + size
+    records = np.memmap(binfile, dtype=CLM_DTYPE, mode="r",
+                        offset=offset, shape=(nrecords,))
+    return header["ids"], records
 
 
 def main():
@@ -545,6 +950,7 @@ def main():
         ('movie', 'plot heatmap optimization history in a tourfile'),
         # Reference-based analytics
         ('bam2mat', 'convert bam file to .npy format used in plotting'),
+        ('clm2bin', 'convert CLM file to binary format for faster loading'),
         ('mergemat', 'combine counts from multiple .npy data files'),
         ('heatmap', 'plot heatmap based on .npy file'),
             )
@@ -561,6 +967,9 @@ def heatmap(args):
     between bin i and bin j. The `genome.json` contains the offsets of each
     contig/chr so that we know where to draw boundary lines, or extract per
     contig/chromosome heatmap.
+
+    The .npz data file from `bam2mat --levels` can be used instead, then the
+    stored resolution closest to --resolution is plotted.
     """
     p = OptionParser(heatmap.__doc__)
     p.add_option("--resolution", default=500000, type="int",
@@ -579,10 +988,15 @@ def heatmap(args):
     contig = opts.chr
     # Load contig/chromosome starts and sizes
     header = json.loads(open(jsonfile).read())
-    resolution = header.get("resolution", opts.resolution)
+    if npyfile.endswith(".npz"):
+        resolutions = [int(x) for x in header["resolutions"]]
+        resolution = min(resolutions, key=lambda x: abs(x - opts.resolution))
+        header.update(header["resolutions"][str(resolution)])
+        A = load_pyramid(npyfile, resolution, header["total_bins"])
+    else:
+        A = np.load(npyfile)
+        resolution = header.get("resolution", opts.resolution)
     logging.debug("Resolution set to {}".format(resolution))
-    # Load the matrix
-    A = np.load(npyfile)
 
     # Select specific submatrix
     if contig:
@@ -631,6 +1045,37 @@ def heatmap(args):
     savefig(image_name, dpi=iopts.dpi, iopts=iopts)
 
 
+def load_pyramid(npzfile, resolution, total_bins):
+    """ Load the matrix at a given resolution from `bam2mat --levels` output.
+    """
+    pyramid = np.load(npzfile)
+    keys = pyramid["keys_{}".format(resolution)]
+    counts = pyramid["counts_{}".format(resolution)]
+    return links_to_matrix(keys, counts, total_bins)
+
+
+def clm2bin(args):
+    """
+    %prog clm2bin test.clm
+
+    Convert the CLM file to a binary file `test.clm.bin`, where the link
+    distances are already binned. `optimize`, `score` etc. load the binary
+    file in place of the CLM file when it is newer than the CLM file.
+    """
+    p = OptionParser(clm2bin.__doc__)
+    opts, args = p.parse_args(args)
+
+    if len(args) != 1:
+        sys.exit(not p.print_help())
+
+    clmfile, = args
+    binfile = clmfile + ".bin"
+    ids, records = read_clm_text(clmfile)
+    write_clm_bin(binfile, ids, records)
+    logging.debug("{} contig pairs of {} contigs written to `{}`"
+                  .format(len(records), len(ids), binfile))
+
+
 def mergemat(args):
     """
     %prog mergemat *.npy
@@ -694,6 +1139,136 @@ def get_distbins(start=100, bins=2500, ratio=1.01):
     return bins, binsizes
 
 
+def get_bam_regions(bamfile, seqs, chunksize=10000000):
+    """ Split the sequences into regions of at most chunksize, so that the
+    regions can be fetched separately through the BAM index.
+    """
+    import pysam
+    bamfile = pysam.AlignmentFile(bamfile, "rb")
+    seqlen = dict(zip(bamfile.references, bamfile.lengths))
+    bamfile.close()
+    regions = []
+    for seq in seqs:
+        for start in xrange(0, seqlen[seq], chunksize):
+            regions.append((seq, start, min(start + chunksize, seqlen[seq])))
+    return regions
+
+
+def count_pairs(keys, counts=None):
+    """ Add up the counts (1 each by default) of identical keys, returns the
+    unique keys and their uint32 counts.
+    """
+    keys, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, weights=counts, minlength=len(keys))
+    return keys, counts.astype(np.uint32)
+
+
+def bam2mat_worker(arg):
+    """ Worker thread for bam2mat(), count the links from the reads that start
+    within the region. Links are kept as (key, count), where key is the index
+    of cell (abin, bbin) with abin <= bbin in the total_bins x total_bins
+    matrix.
+    """
+    import pysam
+
+    bamfilename, region, seqstarts, N, total_bins, bins, minsize, batch = arg
+    chr, start, end = region
+    keys, counts = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint32)
+    B = np.zeros(bins, dtype="int")
+
+    def flush(abins, bbins, dists, keys, counts):
+        if not abins:
+            return keys, counts
+        abins = np.array(abins, dtype=np.int64)
+        bbins = np.array(bbins, dtype=np.int64)
+        lo, hi = np.minimum(abins, bbins), np.maximum(abins, bbins)
+        k, c = count_pairs(lo * total_bins + hi)
+        keys, counts = count_pairs(np.concatenate((keys, k)),
+                                   np.concatenate((counts, c)))
+        # Same as int(round(math.log(dist * 1. / minsize, 1.01)))
+        dists = np.array(dists, dtype="float64")
+        db = np.floor(np.log(dists / minsize) / math.log(1.01) + .5)
+        B[:] += np.bincount(db.astype(int), minlength=bins)
+        return keys, counts
+
+    bamfile = pysam.AlignmentFile(bamfilename, "rb")
+    references = bamfile.references
+    abins, bbins, dists = [], [], []
+    j = k = 0
+    # Check all reads, rules borrowed from LACHESIS
+    # https://github.com/shendurelab/LACHESIS/blob/master/src/GenomeLinkMatrix.cc#L1476
+    for c in bamfile.fetch(chr, start, end):
+        # Reads overlapping the region start belong to the previous region
+        if c.reference_start < start:
+            continue
+        j += 1
+
+        if c.is_qcfail and c.is_duplicate:
+            continue
+        if c.is_secondary and c.is_supplementary:
+            continue
+        if c.mapping_quality == 0:
+            continue
+        if not c.is_paired:
+            continue
+        if c.is_read2:  # Take only one read
+            continue
+        if c.next_reference_id < 0:
+            continue
+
+        apos = c.reference_start
+        bchr = references[c.next_reference_id]
+        bpos = c.next_reference_start
+        if bchr not in seqstarts:
+            continue
+        if chr == bchr:
+            dist = abs(apos - bpos)
+            if dist < minsize:
+                continue
+            dists.append(dist)
+
+        abins.append(seqstarts[chr] + apos / N)
+        bbins.append(seqstarts[bchr] + bpos / N)
+        k += 1
+        if len(abins) >= batch:
+            keys, counts = flush(abins, bbins, dists, keys, counts)
+            abins, bbins, dists = [], [], []
+
+    keys, counts = flush(abins, bbins, dists, keys, counts)
+    bamfile.close()
+    return keys, counts, B, j, k
+
+
+def links_to_matrix(keys, counts, total_bins):
+    """ Dense symmetric matrix from the upper triangle cells in bam2mat_worker().
+    """
+    abins, bbins = keys // total_bins, keys % total_bins
+    A = np.zeros((total_bins, total_bins), dtype="int")
+    A[abins, bbins] = counts
+    A[bbins, abins] = counts
+    return A
+
+
+def coarsen_links(keys, counts, fine, coarse, factor):
+    """ Merge the cells of bam2mat_worker() into bins that are factor times
+    larger. `fine` and `coarse` are (seqstarts, seqsize, total_bins) at the two
+    resolutions, sequences that are absent at the coarse resolution are
+    dropped.
+    """
+    fstarts, fsizes, ftotal = fine
+    cstarts, csizes, ctotal = coarse
+    binmap = np.full(ftotal, -1, dtype=np.int64)
+    for seq, cstart in cstarts.items():
+        fstart, fsize = fstarts[seq], fsizes[seq]
+        binmap[fstart:fstart + fsize] = cstart + np.arange(fsize) // factor
+    abins, bbins = keys // ftotal, keys % ftotal
+    abins, bbins = binmap[abins], binmap[bbins]
+    keep = (abins >= 0) & (bbins >= 0)
+    abins, bbins = abins[keep], bbins[keep]
+    lo, hi = np.minimum(abins, bbins), np.maximum(abins, bbins)
+    return count_pairs(lo * ctotal + hi, counts[keep])
+
+
 def bam2mat(args):
     """
     %prog bam2mat input.bam
@@ -702,13 +1277,23 @@ def bam2mat(args):
     parameter is the resolution, which is the cell size. Small cell size lead
     to more fine-grained heatmap, but leads to large .mat size and slower
     plotting.
+
+    The bam file needs to be sorted and indexed, as the reads are counted by
+    region in parallel. With --levels, the counts are also written to a .npz
+    file at the resolution, and 2x, 4x, ... coarser resolutions, that can be
+    passed to `heatmap` instead of the .npy file.
     """
-    import pysam
+    from jcvi.apps.grid import parallel_map
     from jcvi.utils.cbook import percentage
 
     p = OptionParser(bam2mat.__doc__)
     p.add_option("--resolution", default=500000, type="int",
                  help="Resolution when counting the links")
+    p.add_option("--levels", default=1, type="int",
+                 help="Number of resolutions in the .npz, each 2x coarser")
+    p.add_option("--batch", default=1000000, type="int",
+                 help="Number of links to collect before counting")
+    p.set_cpus(cpus=1)
     opts, args = p.parse_args(args)
 
     if len(args) != 1:
@@ -727,74 +1312,58 @@ def bam2mat(args):
     jsonfile = pf + ".json"
     fwjson = open(jsonfile, "w")
     header = {"starts": seqstarts, "sizes": seqsize, "total_bins": total_bins,
+              "resolution": N,
               "distbinstarts": list(distbinstarts),
               "distbinsizes": list(distbinsizes)}
+    levels = [(N, (seqstarts, seqsize, total_bins))]
+    for i in range(1, opts.levels):
+        levels.append((N << i, get_seqstarts(bamfilename, N << i)))
+    if opts.levels > 1:
+        header["resolutions"] = dict((str(res), {"starts": starts,
+                                     "sizes": sizes, "total_bins": total})
+                                     for res, (starts, sizes, total) in levels)
     json.dump(header, fwjson, sort_keys=True, indent=4)
     fwjson.close()
     logging.debug("Contig bin starts written to `{}`".format(jsonfile))
 
     print(sorted(seqstarts.items(), key=lambda x: x[-1]))
+    regions = get_bam_regions(bamfilename, natsorted(seqstarts.keys()))
+    logging.debug("Count links in {} regions with {} cpus"
+                  .format(len(regions), opts.cpus))
+    results = parallel_map(bam2mat_worker,
+                           [(bamfilename, x, seqstarts, N, total_bins, bins,
+                             minsize, opts.batch) for x in regions],
+                           cpus=opts.cpus)
+
+    keys, counts, B, j, k = zip(*results)
+    keys, counts = count_pairs(np.concatenate(keys), np.concatenate(counts))
+    B = np.sum(B, axis=0)
+    logging.debug("Total reads counted: {}".format(percentage(2 * sum(k),
+                                                               sum(j))))
+
     logging.debug("Initialize matrix of size {}x{}"
                   .format(total_bins, total_bins))
-    A = np.zeros((total_bins, total_bins), dtype="int")
-    B = np.zeros(bins, dtype="int")
-
-    # Find the bin ID of each read
-    def bin_number(chr, pos):
-        return seqstarts[chr] + pos / N
-
-    def distbin_number(dist, start=minsize, ratio=1.01):
-        return int(round(math.log(dist * 1.0 / start, ratio)))
-
-    bamfile = pysam.AlignmentFile(bamfilename, "rb")
-    # Check all reads, rules borrowed from LACHESIS
-    # https://github.com/shendurelab/LACHESIS/blob/master/src/GenomeLinkMatrix.cc#L1476
-    j = k = 0
-    for c in bamfile:
-        j += 1
-        if j % 100000 == 0:
-            print("{} reads counted".format(j), file=sys.stderr)
-        # if j >= 10000: break
-
-        if c.is_qcfail and c.is_duplicate:
-            continue
-        if c.is_secondary and c.is_supplementary:
-            continue
-        if c.mapping_quality == 0:
-            continue
-        if not c.is_paired:
-            continue
-        if c.is_read2:  # Take only one read
-            continue
-
-        # pysam v0.8.3 does not support keyword reference_name
-        achr = bamfile.getrname(c.reference_id)
-        apos = c.reference_start
-        bchr = bamfile.getrname(c.next_reference_id)
-        bpos = c.next_reference_start
-        if achr not in seqstarts or bchr not in seqstarts:
-            continue
-        if achr == bchr:
-            dist = abs(apos - bpos)
-            if dist < minsize:
-                continue
-            db = distbin_number(dist)
-            B[db] += 1
-
-        abin, bbin = bin_number(achr, apos), bin_number(bchr, bpos)
-        A[abin, bbin] += 1
-        if abin != bbin:
-            A[bbin, abin] += 1
-
-        k += 1
-
-    logging.debug("Total reads counted: {}".format(percentage(2 * k, j)))
-    bamfile.close()
+    A = links_to_matrix(keys, counts, total_bins)
     np.save(pf, A)
     logging.debug("Link counts written to `{}.npy`".format(pf))
     np.save(pf + ".dist", B)
     logging.debug("Link dists written to `{}.dist.npy`".format(pf))
 
+    if opts.levels > 1:
+        pyramid = {}
+        for res, level in levels:
+            factor = res / N
+            if factor > 1:
+                lkeys, lcounts = coarsen_links(keys, counts, levels[0][1],
+                                               level, factor)
+            else:
+                lkeys, lcounts = keys, counts
+            pyramid["keys_{}".format(res)] = lkeys
+            pyramid["counts_{}".format(res)] = lcounts
+        np.savez_compressed(pf, **pyramid)
+        logging.debug("Link counts at {} resolutions written to `{}.npz`"
+                      .format(len(levels), pf))
+
 
 def simulate(args):
     """
@@ -1026,7 +1595,7 @@ def optimize(args):
     if runGA:
         for phase in range(1, 3):
             tour = optimize_ordering(fwtour, clm, phase, cpus)
-            tour = clm.prune_tour(tour, cpus)
+            tour = clm.prune_tour(tour)
 
     # Flip orientations
     phase = 1
@@ -1068,6 +1637,8 @@ def optimize_ordering(fwtour, clm, phase, cpus):
     toolbox = GA_setup(tour)
     toolbox.register("evaluate", score_evaluate_M,
                      tour_sizes=tour_sizes, tour_M=tour_M)
+    toolbox.register("mutate", genome_mutation,
+                     delta=TourMoveDelta(tour_sizes, tour_M))
     tour, tour_fitness = GA_run(toolbox, ngen=1000, npop=100, cpus=cpus,
                                 callback=callbacki)
     clm.tour = tour
@@ -1317,10 +1888,14 @@ def score(args):
 
         # Faster Cython version for evaluation
         from .chic import score_evaluate_M
+        from scipy.sparse import csr_matrix
+        tour_M = csr_matrix(tour_M)
         callbacki = partial(callback, oo=oo)
         toolbox = GA_setup(tour)
         toolbox.register("evaluate", score_evaluate_M,
                          tour_sizes=tour_sizes, tour_M=tour_M)
+        toolbox.register("mutate", genome_mutation,
+                         delta=TourMoveDelta(tour_sizes, tour_M))
         tour, tour.fitness = GA_run(toolbox, npop=100, cpus=opts.cpus,
                                     callback=callbacki)
         print(tour, tour.fitness)
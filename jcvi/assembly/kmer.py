@@ -17,7 +17,7 @@ from collections import defaultdict
 from jcvi.graphics.base import plt, asciiplot, set_human_axis, savefig, \
             markup, panel_labels, normalize_axes, set_ticklabels_helvetica, \
             write_messages
-from jcvi.formats.fasta import Fasta
+from jcvi.formats.twobit import get_twobit
 from jcvi.formats.base import BaseFile, must_open, get_number
 from jcvi.utils.cbook import thousands, percentage
 from jcvi.assembly.automaton import iter_project
@@ -546,9 +546,9 @@ def count(args):
     proc = Popen(cmd, stdin=PIPE, stdout=t)
     t.flush()
 
-    f = Fasta(fastafile, lazy=True)
-    for name, rec in f.iteritems_ordered():
-        kmers = list(make_kmers(rec.seq, K))
+    tb = get_twobit(fastafile)
+    for name in tb.keys():
+        kmers = list(make_kmers(tb.array(name, mask=False), K))
         print("\n".join(kmers), file=proc.stdin)
     proc.stdin.close()
     logging.debug(cmd)
@@ -632,11 +632,30 @@ def bin(args):
     fw.close()
 
 
-def make_kmers(seq, K):
-    seq = str(seq).upper().replace("N", "A")
-    seqlen = len(seq)
-    for i in xrange(seqlen - K + 1):
-        yield seq[i: i + K]
+def make_kmers(seq, K, chunksize=100000):
+    """
+    Yield all K-mers of seq, in upper case with N replaced by A. seq can be a
+    string or an uint8 array of ASCII characters (from formats.twobit).
+
+    >>> list(make_kmers("acgNt", 3))
+    ['ACG', 'CGA', 'GAT']
+    """
+    from numpy.lib.stride_tricks import as_strided
+
+    if not isinstance(seq, np.ndarray):
+        seq = str(seq).encode()
+        seq = np.frombuffer(seq, dtype=np.uint8)
+    seq = np.where((seq >= ord('a')) & (seq <= ord('z')), seq - 32, seq)
+    seq[seq == ord('N')] = ord('A')
+    seq = seq.astype(np.uint8)
+    dtype = "S{0}".format(K)
+    nkmers = len(seq) - K + 1
+    for i in xrange(0, nkmers, chunksize):
+        n = min(chunksize, nkmers - i)
+        window = as_strided(seq[i:], shape=(n, K), strides=(1, 1))
+        kmers = np.ascontiguousarray(window).view(dtype).ravel()
+        for kmer in kmers:
+            yield kmer
 
 
 def dump(args):
@@ -657,9 +676,9 @@ def dump(args):
     fastafile, = args
     K = opts.K
     fw = must_open(opts.outfile, "w")
-    f = Fasta(fastafile, lazy=True)
-    for name, rec in f.iteritems_ordered():
-        kmers = list(make_kmers(rec.seq, K))
+    tb = get_twobit(fastafile)
+    for name in tb.keys():
+        kmers = list(make_kmers(tb.array(name, mask=False), K))
         print("\n".join(kmers), file=fw)
     fw.close()
 
@@ -18,19 +18,25 @@ see supplementary info for sea anemone genome paper, formula::
          max(best score for A, best score for B)
 
 Finally a blast.filtered file is created.
+
+With --streaming, hits are never all held in memory: they are grouped by
+(query, subject) through an external merge sort on disk and the filters above
+are applied on the sorted stream, the output is the same.
 """
 from __future__ import print_function
 
 import sys
 import logging
 import os.path as op
+import numpy as np
 
 from collections import defaultdict
 from itertools import groupby
 
-from jcvi.formats.blast import Blast
-from jcvi.utils.grouper import Grouper
-from jcvi.utils.cbook import gene_name
+from jcvi.formats.blast import Blast, BlastLine, get_cscores
+from jcvi.utils.grouper import ArrayGrouper
+from jcvi.utils.cbook import gene_name, human_size
+from jcvi.utils.iter import ExternalSort
 from jcvi.compara.synteny import check_beds
 from jcvi.apps.base import OptionParser
 
@@ -39,6 +45,12 @@ def blastfilter_main(blast_file, p, opts):
 
     qbed, sbed, qorder, sorder, is_self = check_beds(blast_file, p, opts)
 
+    if opts.streaming:
+        blastfilter_streaming(blast_file, qbed, sbed, qorder, sorder,
+                              is_self, opts)
+        log_peak_memory()
+        return
+
     tandem_Nmax = opts.tandem_Nmax
     cscore = opts.cscore
 
@@ -46,7 +58,7 @@ def blastfilter_main(blast_file, p, opts):
     total_lines = sum(1 for line in fp if line[0] != '#')
     logging.debug("Load BLAST file `%s` (total %d lines)" % \
             (blast_file, total_lines))
-    bl = Blast(blast_file)
+    bl = Blast(blast_file, binary=True)
     blasts = sorted(list(bl), key=lambda b: b.score, reverse=True)
 
     filtered_blasts = []
@@ -112,29 +124,9 @@ def blastfilter_main(blast_file, p, opts):
                 flip=True, tandem_Nmax=tandem_Nmax)
         standems = tandem_grouper(sbed, filtered_blasts,
                 flip=False, tandem_Nmax=tandem_Nmax)
-
-        qdups_fh = open(op.splitext(opts.qbed)[0] + ".localdups", "w") \
-                if opts.tandems_only else None
-
-        if is_self:
-            for s in standems:
-                qtandems.join(*s)
-            qdups_to_mother = write_localdups(qtandems, qbed, qdups_fh)
-            sdups_to_mother = qdups_to_mother
-        else:
-            qdups_to_mother = write_localdups(qtandems, qbed, qdups_fh)
-            sdups_fh = open(op.splitext(opts.sbed)[0] + ".localdups", "w") \
-                    if opts.tandems_only else None
-            sdups_to_mother = write_localdups(standems, sbed, sdups_fh)
-
-        if opts.tandems_only:
-            # write out new .bed after tandem removal
-            write_new_bed(qbed, qdups_to_mother)
-            if not is_self:
-                write_new_bed(sbed, sdups_to_mother)
-
-            # just want to use this script as a tandem finder.
-            #sys.exit()
+        qdups_to_mother, sdups_to_mother = \
+                get_dups_to_mother(qtandems, standems, qbed, sbed,
+                                   is_self, opts)
 
         before_filter = len(filtered_blasts)
         filtered_blasts = list(filter_tandem(filtered_blasts, \
@@ -146,6 +138,179 @@ def blastfilter_main(blast_file, p, opts):
     fw = open(blastfilteredfile, "w")
     write_new_blast(filtered_blasts, fh=fw)
     fw.close()
+    log_peak_memory()
+
+
+def log_peak_memory():
+    import resource
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # in KB
+    logging.debug("Peak memory usage: {0}".\
+                  format(human_size(rss * 1024, a_kilobyte_is_1024_bytes=True)))
+
+
+def iter_normalized_blast(blast_file, qorder, sorder, is_self, strip=False,
+                          qbedfile=None, sbedfile=None):
+    """
+    Same checks as in `blastfilter_main()`, yields light-weight tuples
+    (query, subject, -score, lineno, qi, si, qseqid, sseqid, evalue, rest)
+    where `rest` is the rest of the BLAST line, after query and subject.
+    """
+    nwarnings = 0
+    lineno = 0
+    for row in open(blast_file):
+        if row[0] == '#':
+            continue
+        lineno += 1
+        b = BlastLine(row)
+        query, subject = b.query, b.subject
+        if query == subject:
+            continue
+
+        if strip:
+            query, subject = gene_name(query), gene_name(subject)
+        missing = None
+        if query not in qorder:
+            missing = query, qbedfile
+        elif subject not in sorder:
+            missing = subject, sbedfile
+        if missing:
+            if nwarnings < 100:
+                logging.warning("{0} not in {1}".format(*missing))
+            elif nwarnings == 100:
+                logging.warning("too many warnings.. suppressed")
+            nwarnings += 1
+            continue
+
+        qi, q = qorder[query]
+        si, s = sorder[subject]
+        if is_self and qi > si:
+            query, subject = subject, query
+            qi, si = si, qi
+            q, s = s, q
+
+        rest = str(b).split("\t", 2)[-1]
+        yield query, subject, -b.score, lineno, qi, si, \
+              q.seqid, s.seqid, b.evalue, rest
+
+
+def blastfilter_streaming(blast_file, qbed, sbed, qorder, sorder, is_self,
+                          opts):
+    """
+    Bounded-memory version of `blastfilter_main()`. Only per-gene data is
+    kept in memory; hits are grouped by (query, subject) with an external
+    sort (chunks of --chunksize hits), and the dedup, C-score and tandem
+    filters are applied on the sorted stream. Output is in the same order
+    as `blastfilter_main()` - score descending, then file order.
+    """
+    tandem_Nmax = opts.tandem_Nmax
+    cscore = opts.cscore
+    sortopts = dict(chunksize=opts.chunksize, tmpdir=opts.tmpdir)
+
+    best_score = defaultdict(float)
+
+    def normalized():
+        for h in iter_normalized_blast(blast_file, qorder, sorder, is_self,
+                        strip=opts.strip_names,
+                        qbedfile=qbed.filename, sbedfile=sbed.filename):
+            query, subject, score = h[0], h[1], -h[2]
+            if score > best_score[query]:
+                best_score[query] = score
+            if score > best_score[subject]:
+                best_score[subject] = score
+            yield h
+
+    pairs = ExternalSort(normalized(), **sortopts)
+    logging.debug("Load BLAST file `{0}` ({1} hits sorted into {2} runs)".\
+                  format(blast_file, len(pairs), len(pairs.runs)))
+
+    def filtered():
+        # Keep best hit for each (query, subject), then apply C-score filter
+        for key, hits in groupby(pairs, key=lambda x: x[:2]):
+            h = next(hits)
+            if cscore:
+                query, subject = key
+                best = max(best_score[query], best_score[subject])
+                if -h[2] / best <= cscore:
+                    continue
+            yield h
+
+    if tandem_Nmax:
+        logging.debug("running the local dups filter (tandem_Nmax=%d) .." % \
+                tandem_Nmax)
+        # `pairs` is sorted by query, so subject tandems can be found on the
+        # fly; query tandems need the hits sorted by subject
+        standems = ArrayGrouper()
+        for query, hits in groupby(filtered(), key=lambda x: x[0]):
+            hits = sorted((x[7], x[5]) for x in hits if x[8] < 1e-10)
+            join_tandems(standems, hits, tandem_Nmax)
+        bysubject = ExternalSort(((x[1], x[6], x[4]) for x in filtered()
+                                  if x[8] < 1e-10), **sortopts)
+        qtandems = ArrayGrouper()
+        for subject, hits in groupby(bysubject, key=lambda x: x[0]):
+            join_tandems(qtandems, [x[1:] for x in hits], tandem_Nmax)
+        bysubject.close()
+
+        qdups_to_mother, sdups_to_mother = \
+                get_dups_to_mother(qtandems, standems, qbed, sbed,
+                                   is_self, opts)
+
+        def mothers():
+            for h in filtered():
+                query = qdups_to_mother.get(h[0], h[0])
+                subject = sdups_to_mother.get(h[1], h[1])
+                if query == subject:
+                    continue
+                yield query, subject, h[2], h[3], h[-1]
+
+        mother_pairs = ExternalSort(mothers(), **sortopts)
+        survivors = (next(hits) for key, hits in \
+                        groupby(mother_pairs, key=lambda x: x[:2]))
+    else:
+        mother_pairs = None
+        survivors = ((h[0], h[1], h[2], h[3], h[-1]) for h in filtered())
+
+    final = ExternalSort(((h[2], h[3], h[0], h[1], h[4]) for h in survivors),
+                         **sortopts)
+    pairs.close()
+    if mother_pairs:
+        mother_pairs.close()
+
+    blastfilteredfile = blast_file + ".filtered"
+    fw = open(blastfilteredfile, "w")
+    for score, lineno, query, subject, rest in final:
+        print(BlastLine("\t".join((query, subject, rest))), file=fw)
+    fw.close()
+    final.close()
+    logging.debug("A total of {0} hits written to `{1}`".\
+                  format(len(final), blastfilteredfile))
+
+
+def get_dups_to_mother(qtandems, standems, qbed, sbed, is_self, opts):
+    qdups_fh = open(op.splitext(opts.qbed)[0] + ".localdups", "w") \
+            if opts.tandems_only else None
+
+    if is_self:
+        for s in standems:
+            qtandems.join(*s)
+        qdups_to_mother = write_localdups(qtandems, qbed, qdups_fh)
+        sdups_to_mother = qdups_to_mother
+    else:
+        qdups_to_mother = write_localdups(qtandems, qbed, qdups_fh)
+        sdups_fh = open(op.splitext(opts.sbed)[0] + ".localdups", "w") \
+                if opts.tandems_only else None
+        sdups_to_mother = write_localdups(standems, sbed, sdups_fh)
+
+    if opts.tandems_only:
+        # write out new .bed after tandem removal
+        write_new_bed(qbed, qdups_to_mother)
+        if not is_self:
+            write_new_bed(sbed, sdups_to_mother)
+
+        # just want to use this script as a tandem finder.
+        #sys.exit()
+
+    return qdups_to_mother, sdups_to_mother
 
 
 def write_localdups(tandems, bed, dups_fh=None):
@@ -190,7 +355,27 @@ def write_new_blast(filtered_blasts, fh=sys.stdout):
         print(b, file=fh)
 
 
-def filter_cscore(blast_list, cscore=.5):
+def filter_cscore(blast_list, cscore=.5, vectorized=True):
+    """
+    Keep hits with C-score > cscore, see `jcvi.formats.blast.get_cscores()`.
+    The pure Python version is used with vectorized=False.
+    """
+    if not vectorized:
+        for b in filter_cscore_python(blast_list, cscore=cscore):
+            yield b
+        return
+
+    blast_list = list(blast_list)
+    names = {}
+    queries = [names.setdefault(b.query, len(names)) for b in blast_list]
+    subjects = [names.setdefault(b.subject, len(names)) for b in blast_list]
+    scores = [b.score for b in blast_list]
+    cs, mask = get_cscores(queries, subjects, scores, cutoff=cscore)
+    for i in np.flatnonzero(mask):
+        yield blast_list[i]
+
+
+def filter_cscore_python(blast_list, cscore=.5):
 
     best_score = defaultdict(float)
     for b in blast_list:
@@ -237,19 +422,26 @@ def tandem_grouper(bed, blast_list, tandem_Nmax=10, flip=True):
 
     simple_blast.sort()
 
-    standems = Grouper()
+    standems = ArrayGrouper()
     for name, hits in groupby(simple_blast, key=lambda x: x[0]):
         # these are already sorted.
         hits = [x[1] for x in hits]
-        for ia, a in enumerate(hits[:-1]):
-            b = hits[ia + 1]
-            # on the same chr and rank difference no larger than tandem_Nmax
-            if b[1] - a[1] <= tandem_Nmax and b[0] == a[0]:
-                standems.join(a[1], b[1])
+        join_tandems(standems, hits, tandem_Nmax)
 
     return standems
 
 
+def join_tandems(tandems, hits, tandem_Nmax=10):
+    """
+    `hits` is a sorted list of (seqid, index) that hit the same gene.
+    """
+    for ia, a in enumerate(hits[:-1]):
+        b = hits[ia + 1]
+        # on the same chr and rank difference no larger than tandem_Nmax
+        if b[1] - a[1] <= tandem_Nmax and b[0] == a[0]:
+            tandems.join(a[1], b[1])
+
+
 def main(args):
 
     p = OptionParser(__doc__)
@@ -264,6 +456,12 @@ def main(args):
             help="retain hits that have good bitscore. a value of 0.5 means "
                  "keep all values that are 50% or greater of the best hit. "
                  "higher is more stringent [default: %default]")
+    p.add_option("--streaming", default=False, action="store_true",
+            help="group hits with external sort to bound memory usage")
+    p.add_option("--chunksize", default=500000, type="int",
+            help="number of hits to sort in memory with --streaming "
+                 "[default: %default]")
+    p.set_tmpdir()
 
     opts, args = p.parse_args(args)
 
@@ -19,12 +19,16 @@ from __future__ import print_function
 
 import os.path as op
 import sys
+import time
 from six.moves import cStringIO
 import logging
+import numpy as np
+
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
 
-from jcvi.utils.range import range_overlap
 from jcvi.utils.grouper import Grouper
-from jcvi.algorithms.lpsolve import GLPKSolver, SCIPSolver
+from jcvi.algorithms.lpsolve import GLPKSolver, SCIPSolver, solve_packing
 from jcvi.compara.synteny import AnchorFile, _score, check_beds
 from jcvi.formats.base import must_open
 from jcvi.apps.base import OptionParser
@@ -61,18 +65,68 @@ def get_1D_overlap(eclusters, depth=1):
     return overlap_set
 
 
+def get_1D_cliques(eclusters, depth=1):
+    """
+    Same constraints as `get_1D_overlap()`, but only the maximal cliques. In
+    an interval graph these are the active sets right before a right end that
+    follows a left end, so there is at most one per sweep event. The active
+    counts come from a cumulative sum over the sorted endpoint arrays, and
+    only cliques larger than depth are built.
+
+    >>> eclusters = [("1", 0, 10), ("1", 2, 8), ("1", 4, 12), ("1", 20, 30)]
+    >>> sorted(get_1D_overlap(eclusters))
+    [(0, 1), (0, 1, 2), (0, 2)]
+    >>> sorted(get_1D_cliques(eclusters))
+    [(0, 1, 2)]
+    """
+    overlap_set = set()
+    if not eclusters:
+        return overlap_set
+
+    chrs, lefts, rights = zip(*eclusters)
+    n = len(eclusters)
+    chrs = np.unique(chrs, return_inverse=True)[1]
+    ends_chr = np.concatenate((chrs, chrs))
+    ends_pos = np.concatenate((lefts, rights))
+    ends_lr = np.repeat([0, 1], n)  # 0/1 for left/right-ness
+    ends_i = np.tile(np.arange(n), 2)
+    order = np.lexsort((ends_i, ends_lr, ends_pos, ends_chr))
+    ends_lr, ends_i = ends_lr[order], ends_i[order]
+
+    nactive = np.cumsum(1 - 2 * ends_lr)
+    emit = np.zeros(2 * n, dtype=bool)
+    emit[:-1] = (ends_lr[:-1] == 0) & (ends_lr[1:] == 1) & \
+                (nactive[:-1] > depth)
+
+    active = set()
+    for left_right, i, e in zip(ends_lr.tolist(), ends_i.tolist(),
+                                emit.tolist()):
+        if left_right == 0:
+            active.add(i)
+        else:
+            active.remove(i)
+        if e:
+            overlap_set.add(tuple(sorted(active)))
+
+    return overlap_set
+
+
 def get_2D_overlap(chain, eclusters):
     """
     Implements a sweep line algorithm, that has better running time than naive O(n^2):
     assume block has x_ends, and y_ends for the bounds
 
     1. sort x_ends, and take a sweep line to scan the x_ends
-    2. if left end, test y-axis intersection of current block with `active` set;
-       also put this block in the `active` set
+    2. if left end, test y-axis intersection of current block with the blocks
+       in the `active` set; also put this block in the `active` set
     3. if right end, remove block from the `active` set
+
+    The y ranges of the active blocks are kept sorted by start for each y
+    chromosome, so the y test only visits the active blocks that start
+    before the current block ends.
     """
     mergeables = Grouper()
-    active = set()
+    active = defaultdict(list)  # y chromosome => sorted (ymin, ymax, block)
 
     x_ends = []
     for i, (range_x, range_y, score) in enumerate(eclusters):
@@ -85,14 +139,19 @@ def get_2D_overlap(chain, eclusters):
     for chr, pos, left_right, i in x_ends:
         if chr != chr_last:
             active.clear()
+        ychr, ymin, ymax = eclusters[i][1]
+        yactive = active[ychr]
+        yitem = (ymin, ymax, i)
         if left_right == 0:
-            active.add(i)
-            for x in active:
-                # check y-overlap
-                if range_overlap(eclusters[x][1], eclusters[i][1]):
-                    mergeables.join(x, i)
+            insort(yactive, yitem)
+            mergeables.join(i)
+            # check y-overlap, only blocks that start before ymax
+            for k in xrange(bisect_right(yactive, (ymax, float("inf")))):
+                jmin, jmax, j = yactive[k]
+                if jmax >= ymin:
+                    mergeables.join(j, i)
         else:  # right end
-            active.remove(i)
+            del yactive[bisect_left(yactive, yitem)]
 
         chr_last = chr
 
@@ -131,9 +190,10 @@ def make_range(clusters, extend=0):
     return eclusters
 
 
-def get_constraints(clusters, quota=(1, 1), Nmax=0):
+def get_constraints(clusters, quota=(1, 1), Nmax=0, maximal=True):
     """
     Check pairwise cluster comparison, if they overlap then mark edge as conflict
+    With maximal=True, only maximal cliques of conflicting blocks are kept.
     """
     qa, qb = quota
     eclusters = make_range(clusters, extend=-Nmax)
@@ -143,10 +203,20 @@ def get_constraints(clusters, quota=(1, 1), Nmax=0):
     eclusters_x, eclusters_y, scores = zip(*eclusters)
 
     # represents the contraints over x-axis and y-axis
-    constraints_x = get_1D_overlap(eclusters_x, qa)
-    constraints_y = get_1D_overlap(eclusters_y, qb)
+    cliques_x = get_1D_cliques(eclusters_x, qa)
+    cliques_y = get_1D_cliques(eclusters_y, qb)
+    logging.debug("Maximal cliques: {0} on x-axis, {1} on y-axis".\
+                  format(len(cliques_x), len(cliques_y)))
+    if maximal:
+        return nodes, cliques_x, cliques_y
 
-    return nodes, constraints_x, constraints_y
+    # Enumerating all cliques can be very slow, only done with --all_cliques
+    all_x = get_1D_overlap(eclusters_x, qa)
+    all_y = get_1D_overlap(eclusters_y, qb)
+    logging.debug("All cliques: {0} on x-axis, {1} on y-axis".\
+                  format(len(all_x), len(all_y)))
+
+    return nodes, all_x, all_y
 
 
 def format_lp(nodes, constraints_x, qa, constraints_y, qb):
@@ -199,17 +269,38 @@ def format_lp(nodes, constraints_x, qa, constraints_y, qb):
 
 
 def solve_lp(clusters, quota, work_dir="work", Nmax=0,
-             self_match=False, solver="SCIP", verbose=False):
+             self_match=False, solver="BNB", verbose=False, cpus=1,
+             maximal=True):
     """
-    Solve the formatted LP instance
+    Solve the formatted LP instance. The default solver (BNB) runs in-process,
+    SCIP and GLPK are external binaries; if neither works, the in-process
+    solver is used instead.
     """
     qb, qa = quota  # flip it
     nodes, constraints_x, constraints_y = get_constraints(
-        clusters, (qa, qb), Nmax=Nmax)
+        clusters, (qa, qb), Nmax=Nmax, maximal=maximal)
 
     if self_match:
         constraints_x = constraints_y = constraints_x | constraints_y
 
+    start = time.time()
+    filtered_list = run_solver(nodes, constraints_x, qa, constraints_y, qb,
+                               work_dir=work_dir, solver=solver,
+                               verbose=verbose, cpus=cpus)
+    logging.debug("Solved in {0:.2f} seconds.".format(time.time() - start))
+
+    return filtered_list
+
+
+def run_solver(nodes, constraints_x, qa, constraints_y, qb, work_dir="work",
+               solver="BNB", verbose=False, cpus=1):
+    """
+    Run the chosen solver, falling back to BNB if the binaries fail.
+    """
+    if solver == "BNB":
+        return solve_bnb(nodes, constraints_x, qa, constraints_y, qb,
+                         cpus=cpus)
+
     lp_data = format_lp(nodes, constraints_x, qa, constraints_y, qb)
 
     if solver == "SCIP":
@@ -226,9 +317,35 @@ def solve_lp(clusters, quota, work_dir="work", Nmax=0,
             filtered_list = SCIPSolver(
                 lp_data, work_dir, verbose=verbose).results
 
+    if not filtered_list:
+        print("{0} fails... trying BNB".format(solver), file=sys.stderr)
+        filtered_list = solve_bnb(nodes, constraints_x, qa,
+                                  constraints_y, qb, cpus=cpus)
+
     return filtered_list
 
 
+def solve_bnb(nodes, constraints_x, qa, constraints_y, qb, cpus=1):
+    """
+    Same instance as `format_lp()`, solved in-process by branch and bound on
+    each group of blocks that are linked by constraints.
+    """
+    weights = [score for i, score in nodes]
+    constraints = list(constraints_x)
+    capacities = [qa] * len(constraints)
+    # non-self
+    if not (constraints_x is constraints_y):
+        constraints += list(constraints_y)
+        capacities += [qb] * len(constraints_y)
+
+    print("number of variables (%d), number of constraints (%d)" %
+          (len(nodes), len(constraints)), file=sys.stderr)
+
+    results, obj_val, upper_bound = solve_packing(weights, constraints,
+                                                  capacities, cpus=cpus)
+    return results
+
+
 def read_clusters(qa_file, qorder, sorder):
     af = AnchorFile(qa_file)
     blocks = af.blocks
@@ -260,14 +377,19 @@ def main(args):
                  "slightly overlapping (cutoff for `quota mapping`) "
                  "[default: %default units (gene or bp dist)]")
 
-    supported_solvers = ("SCIP", "GLPK")
+    supported_solvers = ("BNB", "SCIP", "GLPK")
     p.add_option("--self", dest="self_match",
                  action="store_true", default=False,
                  help="you might turn this on when screening paralogous blocks, "
                  "esp. if you have reduced mirrored blocks into non-redundant set")
-    p.add_option("--solver", default="SCIP", choices=supported_solvers,
-                 help="use MIP solver [default: %default]")
+    p.add_option("--all_cliques", default=False, action="store_true",
+                 help="constrain every clique of overlapping blocks, rather "
+                 "than only the maximal ones [default: %default]")
+    p.add_option("--solver", default="BNB", choices=supported_solvers,
+                 help="use MIP solver, BNB is built-in branch and bound, "
+                 "SCIP and GLPK need external binaries [default: %default]")
     p.set_verbose(help="Show verbose solver output")
+    p.set_cpus(cpus=1)
 
     p.add_option("--screen", default=False, action="store_true",
                  help="generate new anchors file [default: %default]")
@@ -307,7 +429,8 @@ def main(args):
 
     selected_ids = solve_lp(clusters, quota, work_dir=work_dir,
                             Nmax=opts.Nmax, self_match=self_match,
-                            solver=opts.solver, verbose=opts.verbose)
+                            solver=opts.solver, verbose=opts.verbose,
+                            cpus=opts.cpus, maximal=not opts.all_cliques)
 
     logging.debug("Selected {0} blocks.".format(len(selected_ids)))
     prefix = qa_file.rsplit(".", 1)[0]
@@ -10,13 +10,14 @@ import numpy as np
 from collections import Iterable, defaultdict
 
 from jcvi.algorithms.lis import heaviest_increasing_subsequence as his
-from jcvi.formats.bed import Bed, BedLine
+from jcvi.formats.bed import Bed, BedArray, BedLine, BedOrder
 from jcvi.formats.blast import Blast
 from jcvi.formats.base import BaseFile, SetFile, read_block, must_open
-from jcvi.utils.grouper import Grouper
+from jcvi.utils.grouper import UnionFind
 from jcvi.utils.cbook import gene_name, human_size
 from jcvi.utils.range import Range, range_chain
 from jcvi.apps.base import OptionParser, ActionDispatcher
+from jcvi.apps.grid import parallel_map
 
 
 class AnchorFile (BaseFile):
@@ -277,12 +278,27 @@ def group_hits(blasts):
     return all_hits
 
 
+def rank_seqid_lookup(order):
+    """ Returns a function accn => (rank, seqid). Orders of a `BedArray` read
+    the seqid off the columns, without building a `BedLine`.
+    """
+    if isinstance(order, BedOrder) and order.seqid is not None:
+        return order.rank_seqid
+
+    def lookup(accn):
+        i, b = order[accn]
+        return i, b.seqid
+
+    return lookup
+
+
 def read_blast(blast_file, qorder, sorder, is_self=False, ostrip=True):
     """ Read the blast and convert name into coordinates
     """
     filtered_blast = []
     seen = set()
-    bl = Blast(blast_file)
+    qlookup, slookup = rank_seqid_lookup(qorder), rank_seqid_lookup(sorder)
+    bl = Blast(blast_file, binary=True)
     for b in bl:
         query, subject = b.query, b.subject
         if query == subject:
@@ -292,17 +308,17 @@ def read_blast(blast_file, qorder, sorder, is_self=False, ostrip=True):
         if query not in qorder or subject not in sorder:
             continue
 
-        qi, q = qorder[query]
-        si, s = sorder[subject]
+        qi, qseqid = qlookup(query)
+        si, sseqid = slookup(subject)
 
         if is_self:
             # remove redundant a<->b to one side when doing self-self BLAST
             if qi > si:
                 query, subject = subject, query
                 qi, si = si, qi
-                q, s = s, q
+                qseqid, sseqid = sseqid, qseqid
             # Too close to diagonal! possible tandem repeats
-            if q.seqid == s.seqid and si - qi < 40:
+            if qseqid == sseqid and si - qi < 40:
                 continue
 
         key = query, subject
@@ -310,7 +326,7 @@ def read_blast(blast_file, qorder, sorder, is_self=False, ostrip=True):
             continue
         seen.add(key)
 
-        b.qseqid, b.sseqid = q.seqid, s.seqid
+        b.qseqid, b.sseqid = qseqid, sseqid
         b.qi, b.si = qi, si
         b.query, b.subject = query, subject
 
@@ -329,15 +345,16 @@ def read_anchors(ac, qorder, sorder, minsize=0):
     all_anchors = defaultdict(list)
     nanchors = 0
     anchor_to_block = {}
+    qlookup, slookup = rank_seqid_lookup(qorder), rank_seqid_lookup(sorder)
 
     for a, b, idx in ac.iter_pairs(minsize=minsize):
         if a not in qorder or b not in sorder:
             continue
-        qi, q = qorder[a]
-        si, s = sorder[b]
+        qi, qseqid = qlookup(a)
+        si, sseqid = slookup(b)
         pair = (qi, si)
 
-        all_anchors[(q.seqid, s.seqid)].append(pair)
+        all_anchors[(qseqid, sseqid)].append(pair)
         anchor_to_block[pair] = idx
         nanchors += 1
 
@@ -347,49 +364,138 @@ def read_anchors(ac, qorder, sorder, minsize=0):
     return all_anchors, anchor_to_block
 
 
-def synteny_scan(points, xdist, ydist, N):
+def get_grid_links(x, y, xdist, ydist):
     """
-    This is the core single linkage algorithm which behaves in O(n):
-    iterate through the pairs, foreach pair we look back on the
-    adjacent pairs to find links
+    Returns all pairs (i, j), i < j, such that |x[i] - x[j]| <= xdist and
+    |y[i] - y[j]| <= ydist. Points are hashed into (xdist + 1) x (ydist + 1)
+    grid cells, so that only points in the same or adjacent cells need to be
+    compared.
     """
-    clusters = Grouper()
-    n = len(points)
-    points.sort()
-    for i in range(n):
-        for j in range(i - 1, -1, -1):
-            # x-axis distance
-            del_x = points[i][0] - points[j][0]
-            if del_x > xdist:
-                break
-            # y-axis distance
-            del_y = points[i][1] - points[j][1]
-            if abs(del_y) > ydist:
-                continue
-            # otherwise join
-            clusters.join(points[i], points[j])
+    x, y = np.asarray(x), np.asarray(y)
+    n = len(x)
+    cx = (x // (xdist + 1)).astype(int)
+    cy = (y // (ydist + 1)).astype(int)
+    cy = cy - cy.min() + 1
+    width = cy.max() + 2
+    cells = cx * width + cy
+    order = np.argsort(cells, kind="mergesort")
+    cells = cells[order]
+    idx = np.arange(n)
+
+    ii, jj = [], []
+    # Only look at half of the neighbors, the other half is symmetric
+    for dcx, dcy in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):
+        target = cells + dcx * width + dcy
+        lo = np.searchsorted(cells, target, side="left")
+        hi = np.searchsorted(cells, target, side="right")
+        if dcx == dcy == 0:
+            lo = idx + 1
+        counts = np.maximum(hi - lo, 0)
+        total = counts.sum()
+        if not total:
+            continue
+        i = np.repeat(idx, counts)
+        j = np.repeat(lo - (np.cumsum(counts) - counts), counts) + \
+            np.arange(total)
+        i, j = order[i], order[j]
+        linked = (np.abs(x[i] - x[j]) <= xdist) & (np.abs(y[i] - y[j]) <= ydist)
+        ii.append(i[linked])
+        jj.append(j[linked])
 
-    # select clusters that are at least >=N
-    clusters = [sorted(cluster) for cluster in list(clusters) \
-            if _score(cluster) >= N]
+    if not ii:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return np.concatenate(ii), np.concatenate(jj)
+
+
+def _unique_labels(labels, values):
+    """
+    Returns the label once for each distinct (label, value) pair.
+    """
+    order = np.lexsort((values, labels))
+    labels, values = labels[order], values[order]
+    first = np.ones(len(labels), dtype=bool)
+    first[1:] = (labels[1:] != labels[:-1]) | (values[1:] != values[:-1])
+    return labels[first]
+
+
+def synteny_scan(points, xdist, ydist, N):
+    """
+    This is the core single linkage algorithm which behaves in O(n): two
+    points are linked if they are within xdist and ydist, see
+    `get_grid_links()`, linked points are then grouped with union-find.
+    Clusters are returned sorted, each cluster as a sorted list of points.
+    """
+    if not len(points):
+        return []
+
+    xy = np.array([p[:2] for p in points])
+    x, y = xy[:, 0], xy[:, 1]
+    a, b = get_grid_links(x, y, xdist, ydist)
+    clusters = UnionFind(len(points))
+    clusters.join_pairs(a, b)
+    labels = clusters.labels()
+
+    # Points that are not linked to anything do not form a cluster
+    linked = np.zeros(len(points), dtype=bool)
+    linked[a] = linked[b] = True
+
+    # select clusters that are at least >=N, see `_score()`
+    nx = np.bincount(_unique_labels(labels, x), minlength=len(points))
+    ny = np.bincount(_unique_labels(labels, y), minlength=len(points))
+    selected = linked & (np.minimum(nx, ny)[labels] >= N)
+    idx = np.flatnonzero(selected)
+    idx = idx[np.argsort(labels[idx], kind="mergesort")]
+    groups = np.split(idx, np.flatnonzero(np.diff(labels[idx])) + 1)
+    clusters = [sorted(set(points[i] for i in g)) for g in groups if len(g)]
+    clusters.sort()
 
     return clusters
 
 
-def batch_scan(points, xdist=20, ydist=20, N=5):
+def scan_worker(args):
+    """
+    synteny_scan() on one chromosome pair, shipped as column arrays.
+    """
+    x, y, score, xdist, ydist, N = args
+    points = list(zip(x.tolist(), y.tolist(), score.tolist()))
+    return synteny_scan(points, xdist, ydist, N)
+
+
+def batch_scan(points, xdist=20, ydist=20, N=5, cpus=1):
     """
-    runs synteny_scan() per chromosome pair
+    runs synteny_scan() per chromosome pair, chromosome pairs are scanned
+    in parallel when cpus > 1
     """
     chr_pair_points = group_hits(points)
 
-    clusters = []
+    args = []
     for chr_pair in sorted(chr_pair_points.keys()):
         points = chr_pair_points[chr_pair]
-        clusters.extend(synteny_scan(points, xdist, ydist, N))
+        if not points:
+            continue
+        x, y, score = zip(*points)
+        args.append((np.array(x), np.array(y), np.array(score),
+                     xdist, ydist, N))
+
+    clusters = []
+    for c in parallel_map(scan_worker, args, cpus=cpus):
+        clusters.extend(c)
 
     return clusters
 
 
+def liftover_worker(args):
+    """
+    synteny_liftover() on one chromosome pair, returns (qi, si, nearest).
+    """
+    hits, anchors, dist = args
+    lifted = []
+    for point, nearest in synteny_liftover(hits, anchors, dist):
+        qi, si = point[:2].tolist()
+        lifted.append((qi, si, tuple(int(x) for x in nearest)))
+    return lifted
+
+
 def synteny_liftover(points, anchors, dist):
     """
     This is to get the nearest anchors for all the points (useful for the
@@ -428,15 +534,17 @@ def get_bed_filenames(hintfile, p, opts):
     return opts.qbed, opts.sbed
 
 
-def check_beds(hintfile, p, opts, sorted=True):
+def check_beds(hintfile, p, opts, sorted=True, columnar=False):
     qbed_file, sbed_file = get_bed_filenames(hintfile, p, opts)
     # is this a self-self blast?
     is_self = (qbed_file == sbed_file)
     if is_self:
         logging.debug("Looks like self-self comparison.")
 
-    qbed = Bed(opts.qbed, sorted=sorted)
-    sbed = Bed(opts.sbed, sorted=sorted)
+    # columnar beds only support the read-only API, but use far less memory
+    BedClass = BedArray if columnar else Bed
+    qbed = BedClass(opts.qbed, sorted=sorted)
+    sbed = BedClass(opts.sbed, sorted=sorted)
     qorder = qbed.order
     sorder = sbed.order
 
@@ -451,6 +559,7 @@ def add_options(p, args, dist=10):
     p.set_beds()
     p.add_option("--dist", default=dist, type="int",
             help="Extent of flanking regions to search [default: %default]")
+    p.set_cpus(cpus=1)
 
     opts, args = p.parse_args(args)
 
@@ -746,7 +855,7 @@ def matrix(args):
     if seqidsfile:
         seqids = SetFile(seqidsfile, delimiter=',')
 
-    order = Bed(bedfile).order
+    order = BedArray(bedfile).order
     blocks = ac.blocks
     m = defaultdict(int)
     fw = open(matrixfile, "w")
@@ -1275,6 +1384,16 @@ def write_details(fw, details, bed):
             print("\t".join((gi, str(depth))), file=fw)
 
 
+def depth_worker(args):
+    """
+    range_depth() on one genome, summary is printed by the caller.
+    """
+    from jcvi.utils.range import range_depth
+
+    ranges, size = args
+    return range_depth(ranges, size, verbose=False)
+
+
 def depth(args):
     """
     %prog depth anchorfile --qbed qbedfile --sbed sbedfile
@@ -1283,7 +1402,7 @@ def depth(args):
     --sbed. The synteny blocks will be layered on the genomes, and the
     multiplicity will be summarized to stderr.
     """
-    from jcvi.utils.range import range_depth
+    from jcvi.utils.range import print_depth
 
     p = OptionParser(depth.__doc__)
     p.add_option("--depthfile",
@@ -1294,6 +1413,7 @@ def depth(args):
     p.add_option("--title", default=None, help="Title to display in plot")
     p.add_option("--quota", help="Force to use this quota, e.g. 1:1, 1:2 ...")
     p.set_beds()
+    p.set_cpus(cpus=1)
 
     opts, args = p.parse_args(args)
 
@@ -1318,11 +1438,18 @@ def depth(args):
         if is_self:
             qranges.append(srange)
 
+    # Both genomes are layered independently
+    args = [(qranges, len(qbed))]
+    if not is_self:
+        args.append((sranges, len(sbed)))
+    depths = parallel_map(depth_worker, args, cpus=opts.cpus)
+
     qgenome = op.basename(qbed.filename).split(".")[0]
     sgenome = op.basename(sbed.filename).split(".")[0]
     qtag = "Genome {0} depths".format(qgenome)
     print("{}:".format(qtag), file=sys.stderr)
-    dsq, details = range_depth(qranges, len(qbed))
+    dsq, details = depths[0]
+    print_depth(dsq, len(qbed))
     if depthfile:
         fw = open(depthfile, "w")
         write_details(fw, details, qbed)
@@ -1332,7 +1459,8 @@ def depth(args):
 
     stag = "Genome {0} depths".format(sgenome)
     print("{}:".format(stag), file=sys.stderr)
-    dss, details = range_depth(sranges, len(sbed))
+    dss, details = depths[1]
+    print_depth(dss, len(sbed))
     if depthfile:
         write_details(fw, details, sbed)
         fw.close()
@@ -1434,7 +1562,7 @@ def breakpoint(args):
         sys.exit(not p.print_help())
 
     blastfile, bedfile = args
-    order = Bed(bedfile).order
+    order = BedArray(bedfile).order
     blastbedfile = bed([blastfile])
     bbed = Bed(blastbedfile)
     for scaffold, bs in bbed.sub_beds():
@@ -1464,7 +1592,8 @@ def scan(args):
     p.set_stripnames()
 
     blast_file, anchor_file, dist, opts = add_options(p, args, dist=20)
-    qbed, sbed, qorder, sorder, is_self = check_beds(blast_file, p, opts)
+    qbed, sbed, qorder, sorder, is_self = check_beds(blast_file, p, opts,
+                                                     columnar=True)
 
     filtered_blast = read_blast(blast_file, qorder, sorder, \
                                 is_self=is_self, ostrip=False)
@@ -1472,7 +1601,8 @@ def scan(args):
     fw = open(anchor_file, "w")
     logging.debug("Chaining distance = {0}".format(dist))
 
-    clusters = batch_scan(filtered_blast, xdist=dist, ydist=dist, N=opts.n)
+    clusters = batch_scan(filtered_blast, xdist=dist, ydist=dist, N=opts.n,
+                          cpus=opts.cpus)
     for cluster in clusters:
         print("###", file=fw)
         for qi, si, score in cluster:
@@ -1488,7 +1618,8 @@ def scan(args):
 
     bedopts = ["--qbed=" + opts.qbed, "--sbed=" + opts.sbed]
     ostrip = [] if opts.strip_names else ["--no_strip_names"]
-    newanchorfile = liftover([lo, anchor_file] + bedopts + ostrip)
+    cpus = ["--cpus={0}".format(opts.cpus)]
+    newanchorfile = liftover([lo, anchor_file] + bedopts + ostrip + cpus)
     return newanchorfile
 
 
@@ -1508,7 +1639,8 @@ def liftover(args):
     p.set_stripnames()
 
     blast_file, anchor_file, dist, opts = add_options(p, args)
-    qbed, sbed, qorder, sorder, is_self = check_beds(blast_file, p, opts)
+    qbed, sbed, qorder, sorder, is_self = check_beds(blast_file, p, opts,
+                                                     columnar=True)
 
     filtered_blast = read_blast(blast_file, qorder, sorder,
                             is_self=is_self, ostrip=opts.strip_names)
@@ -1521,16 +1653,19 @@ def liftover(args):
     all_anchors, anchor_to_block = read_anchors(ac, qorder, sorder)
 
     # select hits that are close to the anchor list
-    lifted = 0
+    args = []
     for chr_pair in sorted(all_anchors.keys()):
-        hits = np.array(all_hits[chr_pair])
-        anchors = np.array(all_anchors[chr_pair])
-
-        if not len(hits):
+        hits = all_hits.get(chr_pair)
+        if not hits:
             continue
 
-        for point, nearest in synteny_liftover(hits, anchors, dist):
-            qi, si = point[:2]
+        hits = np.array([x[:2] for x in hits], dtype=int)
+        anchors = np.array(all_anchors[chr_pair], dtype=int)
+        args.append((hits, anchors, dist))
+
+    lifted = 0
+    for points in parallel_map(liftover_worker, args, cpus=opts.cpus):
+        for qi, si, nearest in points:
             block_id = anchor_to_block[nearest]
             query, subject = qbed[qi].accn, sbed[si].accn
             score = blast_to_score[(qi, si)]
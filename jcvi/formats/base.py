@@ -141,6 +141,89 @@ class FileMerger (object):
         return outfile
 
 
+def iter_record_chunks(filename, format="fasta", chunksize=1 << 22, group=1):
+    """
+    Read a FASTA/FASTQ stream in blocks of `chunksize` bytes, and yield
+    (index of the first record, number of records, text) for chunks that end
+    on record boundaries. Memory is bounded by chunksize plus the longest
+    record. FASTQ records are assumed to be 4 lines, `group` consecutive
+    records are kept in the same chunk (e.g. 2 for interleaved pairs).
+    """
+    fp = must_open(filename) if isinstance(filename, str) else filename
+    lines_per_chunk = 4 * group
+    index = 0
+    pending, pending_lines, last = [], 0, ""
+    while True:
+        block = fp.read(chunksize)
+        if not block:
+            chunk = "".join(pending)
+            if chunk:
+                yield index, count_records(chunk, format), chunk
+            break
+
+        cut = -1
+        if format == "fastq":
+            nlines = pending_lines + block.count("\n")
+            extra = nlines % lines_per_chunk
+            if nlines - extra > pending_lines:
+                cut = len(block)
+                for i in xrange(extra + 1):
+                    cut = block.rfind("\n", 0, cut)
+                cut += 1
+                pending_lines = extra
+            else:
+                pending_lines = nlines
+        else:
+            i = (last + block).rfind("\n>")
+            if i >= 0:
+                cut = i - len(last) + 1
+
+        if cut > 0:
+            chunk = "".join(pending) + block[:cut]
+            n = count_records(chunk, format)
+            yield index, n, chunk
+            index += n
+            pending = [block[cut:]]
+        else:
+            pending.append(block)
+        last = block[-1]
+
+
+def count_records(chunk, format="fasta"):
+    if format == "fastq":
+        return (chunk.count("\n") + (chunk[-1:] not in ("", "\n"))) // 4
+    return chunk.count("\n>") + (chunk[:1] == ">")
+
+
+def iter_chunk_texts(chunk, format="fasta"):
+    """
+    Split a chunk from iter_record_chunks() into the raw text of each record,
+    always ending with a newline.
+    """
+    if not chunk.endswith("\n"):
+        chunk += "\n"
+    if format == "fastq":
+        lines = chunk.splitlines(True)
+        for i in xrange(0, len(lines), 4):
+            yield "".join(lines[i: i + 4])
+        return
+
+    start = chunk.find(">")
+    while start >= 0:
+        end = chunk.find("\n>", start)
+        end = len(chunk) if end < 0 else end + 1
+        yield chunk[start: end]
+        start = end if end < len(chunk) else -1
+
+
+def iter_chunk_records(chunk, format="fasta"):
+    """
+    Parse a chunk from iter_record_chunks() into Bio.SeqRecord objects.
+    """
+    from six import StringIO
+    return SeqIO.parse(StringIO(chunk), format)
+
+
 class FileSplitter (object):
 
     def __init__(self, filename, outputdir=None, format="fasta", mode="cycle"):
@@ -152,7 +235,7 @@ class FileSplitter (object):
         logging.debug("format is %s" % format)
 
         if format in ("fasta", "fastq"):
-            self.klass = "seqio"
+            self.klass = "record"
         elif format == "clust":
             self.klass = "clust"
         else:
@@ -163,8 +246,10 @@ class FileSplitter (object):
 
     def _open(self, filename):
 
-        if self.klass == "seqio":
-            handle = SeqIO.parse(open(filename), self.format)
+        if self.klass == "record":
+            handle = (x for index, n, chunk in
+                        iter_record_chunks(filename, format=self.format)
+                        for x in iter_chunk_texts(chunk, format=self.format))
         elif self.klass == "clust":
             from jcvi.apps.uclust import ClustFile
             handle = iter(ClustFile(filename))
@@ -174,6 +259,9 @@ class FileSplitter (object):
 
     @property
     def num_records(self):
+        if self.klass == "record":
+            return sum(n for index, n, chunk in
+                       iter_record_chunks(self.filename, format=self.format))
         handle = self._open(self.filename)
         return sum(1 for x in handle)
 
@@ -221,9 +309,20 @@ class FileSplitter (object):
 
         return names
 
+    def _record_size(self, record):
+        """
+        Sequence length of a raw record from _open(), for the LPT weights.
+        """
+        if self.klass != "record":
+            return len(record)
+        header, seq = record.split("\n", 1)
+        if self.format == "fastq":
+            return len(seq.split("\n", 1)[0].rstrip())
+        return len(seq) - seq.count("\n") - seq.count("\r")
+
     def write(self, fw, batch):
-        if self.klass == "seqio":
-            SeqIO.write(batch, fw, self.format)
+        if self.klass == "record":
+            fw.writelines(batch)
         elif self.klass == "clust":
             for b in batch:
                 print(b, file=fw)
@@ -282,7 +381,7 @@ class FileSplitter (object):
                 mt, mi = min((x, i) for (i, x) in enumerate(endtime))
                 fw = filehandles[mi]
                 count = self.write(fw, [record])
-                endtime[mi] += len(record)
+                endtime[mi] += self._record_size(record)
 
         for fw in filehandles:
             fw.close()
@@ -480,6 +579,53 @@ def read_block(handle, signal):
         yield None, seq
 
 
+def npz_memmap(filename, key):
+    """
+    Memory-map one array stored in an uncompressed .npz file (as written by
+    `np.savez` or `npz_pack`), without loading it.
+    """
+    import struct
+    import zipfile
+    import numpy as np
+
+    zf = zipfile.ZipFile(filename)
+    info = zf.getinfo(key + ".npy")
+    zf.close()
+    assert info.compress_type == zipfile.ZIP_STORED, \
+            "`{0}` is compressed and cannot be memory-mapped".format(key)
+    fp = open(filename, "rb")
+    # Skip the zip local file header to get to the .npy payload
+    fp.seek(info.header_offset + 26)
+    namelen, extralen = struct.unpack("<HH", fp.read(4))
+    fp.seek(namelen + extralen, 1)
+    version = np.lib.format.read_magic(fp)
+    read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) \
+                  else np.lib.format.read_array_header_2_0
+    shape, fortran_order, dtype = read_header(fp)
+    offset = fp.tell()
+    fp.close()
+    if not np.prod(shape):
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode="r", shape=shape,
+                     offset=offset, order="F" if fortran_order else "C")
+
+
+def npz_pack(filename, npyfiles, remove=True):
+    """
+    Pack .npy files into an uncompressed .npz, streaming from disk so that the
+    arrays never need to fit in memory. `npyfiles` maps key => .npy file.
+    """
+    import zipfile
+
+    zf = zipfile.ZipFile(filename, "w", zipfile.ZIP_STORED, allowZip64=True)
+    for key, npyfile in sorted(npyfiles.items()):
+        zf.write(npyfile, key + ".npy")
+        if remove:
+            os.remove(npyfile)
+    zf.close()
+    return filename
+
+
 def is_number(s, cast=float):
     """
     Check if a string is a number. Use cast=int to check if s is an integer.
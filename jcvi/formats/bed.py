@@ -10,16 +10,16 @@ import math
 import logging
 import numpy as np
 
-from collections import defaultdict
+from collections import defaultdict, Mapping
 from itertools import groupby
 
-from jcvi.formats.base import LineFile, must_open, is_number, get_number
+from jcvi.formats.base import BaseFile, LineFile, must_open, is_number, get_number
 from jcvi.formats.sizes import Sizes
 from jcvi.utils.iter import pairwise
 from jcvi.utils.cbook import SummaryStats, thousands, percentage
 from jcvi.utils.grouper import Grouper
 from jcvi.utils.natsort import natsort_key, natsorted
-from jcvi.utils.range import Range, range_union, range_chain, \
+from jcvi.utils.range import Range, RangeIndex, range_union, range_chain, \
             range_distance, range_intersect
 from jcvi.apps.base import OptionParser, ActionDispatcher, sh, \
             need_update, popen
@@ -117,6 +117,7 @@ class Bed(LineFile):
         # for example, user might not like the lexico-order of seqid
         self.nullkey = lambda x: (natsort_key(x.seqid), x.start, x.accn)
         self.key = key or self.nullkey
+        self._range_index = None
 
         if not filename:
             return
@@ -135,6 +136,80 @@ class Bed(LineFile):
     def add(self, row):
         self.append(BedLine(row))
 
+    # All list mutators drop the cached `range_index`
+    def append(self, b):
+        del self.range_index
+        super(Bed, self).append(b)
+
+    def extend(self, beds):
+        del self.range_index
+        super(Bed, self).extend(beds)
+
+    def insert(self, i, b):
+        del self.range_index
+        super(Bed, self).insert(i, b)
+
+    def remove(self, b):
+        del self.range_index
+        super(Bed, self).remove(b)
+
+    def pop(self, *args):
+        del self.range_index
+        return super(Bed, self).pop(*args)
+
+    def sort(self, *args, **kwargs):
+        del self.range_index
+        super(Bed, self).sort(*args, **kwargs)
+
+    def reverse(self):
+        del self.range_index
+        super(Bed, self).reverse()
+
+    def __setitem__(self, i, b):
+        del self.range_index
+        super(Bed, self).__setitem__(i, b)
+
+    def __delitem__(self, i):
+        del self.range_index
+        super(Bed, self).__delitem__(i)
+
+    def __setslice__(self, i, j, beds):
+        del self.range_index
+        super(Bed, self).__setslice__(i, j, beds)
+
+    def __delslice__(self, i, j):
+        del self.range_index
+        super(Bed, self).__delslice__(i, j)
+
+    def __iadd__(self, beds):
+        del self.range_index
+        return super(Bed, self).__iadd__(beds)
+
+    def __imul__(self, n):
+        del self.range_index
+        return super(Bed, self).__imul__(n)
+
+    def __getstate__(self):
+        # copies rebuild their own index
+        state = self.__dict__.copy()
+        state["_range_index"] = None
+        return state
+
+    @property
+    def range_index(self):
+        """
+        Per-seqid interval index, built once on first query. Features edited
+        in place are not seen by the index, drop it with `del bed.range_index`.
+        """
+        if getattr(self, "_range_index", None) is None:
+            self._range_index = RangeIndex(self,
+                                    key=lambda x: (x.seqid, x.start, x.end))
+        return self._range_index
+
+    @range_index.deleter
+    def range_index(self):
+        self._range_index = None
+
     def print_to_file(self, filename="stdout", sorted=False):
         if sorted:
             self.sort(key=self.key)
@@ -144,6 +219,7 @@ class Bed(LineFile):
             if b.start < 1:
                 logging.error("Start < 1. Reset start for `{0}`.".format(b.accn))
                 b.start = 1
+                del self.range_index
             print(b, file=fw)
         fw.close()
 
@@ -197,13 +273,17 @@ class Bed(LineFile):
 
     def extract(self, seqid, start, end):
         # get all features within certain range
-        for b in self:
-            if b.seqid != seqid:
-                continue
-            if b.start < start or b.end > end:
-                continue
+        for b in self.range_index.contain(seqid, start, end):
             yield b
 
+    def overlap(self, seqid, start, end):
+        # get all features that overlap certain range
+        return self.range_index.overlap(seqid, start, end)
+
+    def nearest(self, seqid, start, end, k=1):
+        # get k features closest to certain range
+        return self.range_index.knearest(seqid, start, end, k=k)
+
     def sub_bed(self, seqid):
         # get all the beds on one chromosome
         for b in self:
@@ -226,6 +306,327 @@ class Bed(LineFile):
             yield seqid, ranks[0][1], ranks[-1][1]
 
 
+class BedOrder(Mapping):
+    """
+    Lazy accn => value mapping used by `BedArray`. Only the accn => row index
+    dict is kept in memory, the values (typically wrapping a `BedLine`) are
+    generated upon access. `seqid` maps a row index to its seqid, so that
+    callers that only need the position can skip building the value.
+    """
+    def __init__(self, index, getter, seqid=None):
+        self.index = index
+        self.getter = getter
+        self.seqid = seqid
+
+    def __getitem__(self, accn):
+        return self.getter(self.index[accn])
+
+    def rank_seqid(self, accn):
+        i = self.index[accn]
+        return i, self.seqid(i)
+
+    def __contains__(self, accn):
+        return accn in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class BedArray(BaseFile):
+    """
+    Columnar version of `Bed`. Seqids are integer-coded, start/end/strand are
+    stored as NumPy arrays and accessions are kept in a single string array.
+    Only the read-only part of the `Bed` API is supported, row access returns
+    `BedLine` objects built on the fly.
+    """
+    def __init__(self, filename=None, sorted=True, include=None):
+        super(BedArray, self).__init__(filename)
+        self.seqid_names = []
+        self.seqid_codes = np.zeros(0, dtype=np.int32)
+        self.starts = np.zeros(0, dtype=np.int64)
+        self.ends = np.zeros(0, dtype=np.int64)
+        self.accns_array = np.zeros(0, dtype="S1")
+        self.strands = np.zeros(0, dtype="S1")
+        self.scores = self.extras = None
+        self.nargs = np.zeros(0, dtype=np.int8)
+        self._index = None
+
+        if not filename:
+            return
+
+        seqids, starts, ends, accns, scores, strands, extras, nargs = \
+                [], [], [], [], [], [], [], []
+        for line in must_open(filename):
+            if line[0] == "#":
+                continue
+            b = BedLine(line)
+            if include and b.accn not in include:
+                continue
+            seqids.append(b.seqid)
+            starts.append(b.start)
+            ends.append(b.end)
+            accns.append(b.accn or "")
+            scores.append(b.score or "")
+            strands.append(b.strand or "")
+            extras.append("\t".join(b.extra) if b.extra else "")
+            nargs.append(b.nargs)
+
+        self._set_columns(seqids, starts, ends, accns, scores, strands,
+                          extras, nargs, sorted=sorted)
+        logging.debug("Loaded {0} features into columnar bed.".format(len(self)))
+
+    def _set_columns(self, seqids, starts, ends, accns, scores, strands,
+                     extras, nargs, sorted=True):
+        self.seqid_names = natsorted(set(seqids))
+        seqid_to_code = dict((x, i) for i, x in enumerate(self.seqid_names))
+        self.seqid_codes = np.array([seqid_to_code[x] for x in seqids],
+                                    dtype=np.int32)
+        self.starts = np.array(starts, dtype=np.int64)
+        self.ends = np.array(ends, dtype=np.int64)
+        self.accns_array = np.array(accns, dtype=str)
+        self.strands = np.array(strands, dtype="S1")
+        self.nargs = np.array(nargs, dtype=np.int8)
+        # Optional columns are only kept when the file has them
+        self.scores = np.array(scores, dtype=str) if any(scores) else None
+        self.extras = np.array(extras, dtype=str) if any(extras) else None
+        if sorted:
+            self.sort()
+
+    def sort(self):
+        # Same as `Bed.nullkey`, seqid codes are already in natsort order
+        self.take(np.lexsort((self.accns_array, self.starts,
+                              self.seqid_codes)))
+
+    @classmethod
+    def from_arrays(cls, seqids, starts, ends, accns=None, scores=None,
+                    strands=None, sorted=True):
+        """
+        Build from columns, missing columns before the last given one are
+        filled with ".".
+        """
+        barray = cls()
+        n = len(starts)
+        nargs = 6 if strands is not None else 5 if scores is not None else \
+                4 if accns is not None else 3
+        fill = lambda x, nx: x if x is not None else \
+                (["."] * n if nargs > nx else [""] * n)
+        barray._set_columns(seqids, starts, ends, fill(accns, 3),
+                            fill(scores, 4), fill(strands, 5), [""] * n,
+                            [nargs] * n, sorted=sorted)
+        return barray
+
+    @classmethod
+    def from_bed(cls, bed):
+        """
+        Convert from `Bed`, keeping the current ordering of features.
+        """
+        barray = cls()
+        barray.filename = bed.filename
+        if not bed:
+            return barray
+        columns = zip(*((b.seqid, b.start, b.end, b.accn or "", b.score or "",
+                         b.strand or "",
+                         "\t".join(b.extra) if b.extra else "", b.nargs)
+                        for b in bed))
+        barray._set_columns(*columns, sorted=False)
+        return barray
+
+    def to_bed(self):
+        """
+        Convert to `Bed`, keeping the current ordering of features.
+        """
+        bed = Bed()
+        bed.filename = self.filename
+        bed.extend(self)
+        return bed
+
+    def print_to_file(self, filename="stdout"):
+        fw = must_open(filename, "w")
+        for b in self:
+            print(b, file=fw)
+        fw.close()
+
+    def take(self, idx):
+        """
+        Reorder or subset the features in place, given an index array.
+        """
+        self.seqid_codes = self.seqid_codes[idx]
+        self.starts = self.starts[idx]
+        self.ends = self.ends[idx]
+        self.accns_array = self.accns_array[idx]
+        self.strands = self.strands[idx]
+        self.nargs = self.nargs[idx]
+        if self.scores is not None:
+            self.scores = self.scores[idx]
+        if self.extras is not None:
+            self.extras = self.extras[idx]
+        self._index = None
+
+    def select(self, idxs, starts, ends):
+        """
+        Returns a new `BedArray` with rows given by the concatenated index
+        arrays `idxs`, and coordinates replaced by `starts` and `ends`.
+        """
+        from copy import copy
+
+        newbed = copy(self)
+        if not idxs:
+            newbed.take(np.zeros(0, dtype=int))
+            return newbed
+        newbed.take(np.concatenate(idxs))
+        newbed.starts = np.concatenate(starts).astype(np.int64)
+        newbed.ends = np.concatenate(ends).astype(np.int64)
+        return newbed
+
+    def subset(self, seqids):
+        """
+        Returns a new `BedArray` with features on the given seqids only.
+        """
+        from copy import copy
+
+        codes = [i for i, x in enumerate(self.seqid_names) if x in seqids]
+        newbed = copy(self)
+        newbed.take(np.flatnonzero(np.in1d(self.seqid_codes, codes)))
+        return newbed
+
+    def bedline(self, i):
+        # Filled in from the columns directly, same fields as BedLine(line)
+        b = BedLine.__new__(BedLine)
+        b.seqid = self.seqid_names[self.seqid_codes[i]]
+        b.start = int(self.starts[i])
+        b.end = int(self.ends[i])
+        b.extra = b.accn = b.score = b.strand = None
+        args = [b.seqid, str(b.start - 1), str(b.end)]
+        nargs = self.nargs[i]
+        if nargs > 3:
+            b.accn = str(self.accns_array[i])
+            args.append(b.accn)
+        if nargs > 4:
+            b.score = str(self.scores[i])
+            args.append(b.score)
+        if nargs > 5:
+            b.strand = str(self.strands[i])
+            args.append(b.strand)
+        if nargs > 6:
+            b.extra = str(self.extras[i]).split("\t")
+            args += b.extra
+        b.args = args
+        b.nargs = len(args)
+        return b
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.bedline(j) for j in xrange(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("BedArray index out of range")
+        return self.bedline(i)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self.bedline(i)
+
+    @property
+    def index(self):
+        # accn => row index, built once
+        if self._index is None:
+            self._index = dict((x, i) for i, x in enumerate(self.accns_array))
+        return self._index
+
+    @property
+    def seqids(self):
+        return [self.seqid_names[x] for x in np.unique(self.seqid_codes)]
+
+    @property
+    def accns(self):
+        return natsorted(set(self.accns_array))
+
+    @property
+    def spans(self):
+        return self.ends - self.starts + 1
+
+    @property
+    def order(self):
+        return BedOrder(self.index, lambda i: (i, self.bedline(i)),
+                        seqid=lambda i: self.seqid_names[self.seqid_codes[i]])
+
+    @property
+    def ranks_in_chr(self):
+        """
+        Rank of each row among the rows on the same seqid, in row order.
+        """
+        codes = self.seqid_codes
+        order = np.argsort(codes, kind="mergesort")
+        sorted_codes = codes[order]
+        first = np.searchsorted(sorted_codes, sorted_codes, side="left")
+        ranks = np.empty(len(codes), dtype=np.int64)
+        ranks[order] = np.arange(len(codes)) - first
+        return ranks
+
+    @property
+    def order_in_chr(self):
+        ranks = self.ranks_in_chr
+
+        def getter(i):
+            seqid = self.seqid_names[self.seqid_codes[i]]
+            return seqid, int(ranks[i]), self.bedline(i)
+
+        return BedOrder(self.index, getter)
+
+    @property
+    def simple_bed(self):
+        return [(self.seqid_names[x], i) for (i, x) in
+                enumerate(self.seqid_codes)]
+
+    def chr_slices(self):
+        """
+        Yield (seqid, start index, end index) for each run of identical
+        seqids, end index is inclusive.
+        """
+        codes = self.seqid_codes
+        if not len(codes):
+            return
+        bounds = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(codes)])) - 1
+        for a, b in zip(starts, ends):
+            yield self.seqid_names[codes[a]], int(a), int(b)
+
+    def get_breaks(self):
+        # get chromosome break positions
+        return self.chr_slices()
+
+    def sub_bed(self, seqid):
+        # get all the beds on one chromosome
+        if seqid not in self.seqid_names:
+            return
+        code = self.seqid_names.index(seqid)
+        for i in np.flatnonzero(self.seqid_codes == code):
+            yield self.bedline(i)
+
+    def sub_beds(self):
+        # get all the beds on all chromosomes, emitting one at a time
+        for seqid, a, b in self.chr_slices():
+            yield seqid, [self.bedline(i) for i in xrange(a, b + 1)]
+
+    def extract(self, seqid, start, end):
+        # get all features within certain range
+        if seqid not in self.seqid_names:
+            return
+        code = self.seqid_names.index(seqid)
+        mask = (self.seqid_codes == code) & (self.starts >= start) & \
+               (self.ends <= end)
+        for i in np.flatnonzero(mask):
+            yield self.bedline(i)
+
+
 class BedpeLine(object):
 
     def __init__(self, sline):
@@ -388,6 +789,231 @@ def bed_sum(beds, seqid=None, unique=True):
     return unique_sum if unique else raw_sum
 
 
+def _overlap_pairs(astarts, aends, bstarts, bends):
+    """
+    Find all overlapping pairs between intervals a and b, b must be sorted by
+    starts. Returns two index arrays, grouped by a (and b in order within).
+    """
+    maxends = np.maximum.accumulate(bends) if len(bends) else bends
+    # Only b in [lo, hi) can possibly overlap a
+    lo = np.searchsorted(maxends, astarts, side="left")
+    hi = np.searchsorted(bstarts, aends, side="right")
+    counts = np.maximum(hi - lo, 0)
+    ai = np.repeat(np.arange(len(astarts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+    bj = np.repeat(lo, counts) + offsets
+    keep = bends[bj] >= astarts[ai]
+    return ai[keep], bj[keep]
+
+
+def _merge_groups(starts, ends, d=0):
+    """
+    Intervals are sorted by starts. As in `mergeBed`, overlapping and
+    book-ended intervals (or within distance d) are merged. Returns the index
+    of the first interval of each merged group.
+    """
+    if not len(starts):
+        return np.zeros(0, dtype=int)
+    maxends = np.maximum.accumulate(ends)
+    is_new = np.ones(len(starts), dtype=bool)
+    is_new[1:] = starts[1:] > maxends[:-1] + d + 1
+    return np.flatnonzero(is_new)
+
+
+def _complement_arrays(starts, ends, size):
+    """
+    Gaps within [1, size] that are not covered by the merged intervals.
+    """
+    cstarts = np.concatenate(([1], ends + 1))
+    cends = np.concatenate((starts - 1, [size]))
+    keep = cstarts <= cends
+    return cstarts[keep], cends[keep]
+
+
+def _chr_groups(barray, strand=False):
+    """
+    Group features by seqid (and strand), each group sorted by start.
+    Yields (seqid, strand, index array).
+    """
+    codes = barray.seqid_codes
+    keys = (barray.ends, barray.starts, barray.strands, codes) if strand \
+           else (barray.ends, barray.starts, codes)
+    order = np.lexsort(keys)
+    if not len(order):
+        return
+    codes, strands = codes[order], barray.strands[order]
+    change = codes[1:] != codes[:-1]
+    if strand:
+        change |= strands[1:] != strands[:-1]
+    for idx in np.split(order, np.flatnonzero(change) + 1):
+        yield barray.seqid_names[barray.seqid_codes[idx[0]]], \
+              (barray.strands[idx[0]] if strand else None), idx
+
+
+def _aggregate(values, how):
+    """
+    Aggregate the score column of merged features. Results stay integers if
+    all the scores are, e.g. sum of 2 and 3 is 5 rather than 5.0.
+
+    >>> _aggregate(["2", "3"], "sum"), _aggregate(["2", "3"], "mean")
+    (5, 2.5)
+    >>> _aggregate(["2", "4"], "median"), _aggregate(["2.0", "3"], "sum")
+    (3, 5.0)
+    """
+    integral = all(x.lstrip("+-").isdigit() for x in values)
+    values = [float(x) for x in values]
+    if how == "sum":
+        a = sum(values)
+    elif how == "min":
+        a = min(values)
+    elif how == "max":
+        a = max(values)
+    elif how == "median":
+        a = np.median(values)
+    elif how in ("mode", "antimode"):
+        counts = defaultdict(int)
+        for x in values:
+            counts[x] += 1
+        pick = max if how == "mode" else min
+        a = pick(counts.items(), key=lambda x: (x[1], -x[0]))[0]
+    else:
+        a = np.mean(values)
+    return int(a) if integral and a == int(a) else a
+
+
+def bed_merge(barray, d=0, strand=False, nms=False, scores=None, delim=";"):
+    """
+    Merge overlapping features, in-process version of `mergeBed`. Returns a
+    `BedArray` where accns are the collapsed names (if nms) and scores are
+    aggregated by `scores` (sum, min, max, mean, median, mode, antimode,
+    collapse).
+    """
+    nms = nms and len(barray) and barray.nargs.max() > 3
+    scores = scores if barray.scores is not None else None
+    seqids, starts, ends, accns, mscores, strands = [], [], [], [], [], []
+    for seqid, s, idx in _chr_groups(barray, strand=strand):
+        gstarts = _merge_groups(barray.starts[idx], barray.ends[idx], d=d)
+        bounds = zip(gstarts, np.append(gstarts[1:], len(idx)))
+        seqids += [seqid] * len(gstarts)
+        starts.append(barray.starts[idx][gstarts])
+        ends.append(np.maximum.reduceat(barray.ends[idx], gstarts))
+        strands += [s] * len(gstarts)
+        if nms:
+            names = barray.accns_array[idx]
+            accns += [delim.join(names[a:b]) for a, b in bounds]
+        if scores:
+            values = barray.scores[idx]
+            if scores == "collapse":
+                mscores += [delim.join(values[a:b]) for a, b in bounds]
+            else:
+                mscores += [str(_aggregate(values[a:b], scores))
+                            for a, b in bounds]
+
+    starts = np.concatenate(starts) if starts else []
+    ends = np.concatenate(ends) if ends else []
+    return BedArray.from_arrays(seqids, starts, ends,
+                                accns=accns if nms else None,
+                                scores=mscores if scores else None,
+                                strands=strands if strand else None)
+
+
+def bed_complement(barray, sizes):
+    """
+    Regions not covered by any feature, in-process version of
+    `complementBed`. `sizes` is a `Sizes` object or a list of (seqid, size),
+    output follows its order.
+    """
+    if isinstance(sizes, Sizes):
+        sizes = zip(sizes.ctgs, sizes.sizes)
+    merged = bed_merge(barray)
+    mgroups = dict((seqid, idx) for seqid, s, idx in _chr_groups(merged))
+    seqids, starts, ends = [], [], []
+    empty = np.zeros(0, dtype=np.int64)
+    for seqid, size in sizes:
+        idx = mgroups.get(seqid, empty)
+        cstarts, cends = _complement_arrays(merged.starts[idx],
+                                            merged.ends[idx], size)
+        seqids += [seqid] * len(cstarts)
+        starts.append(cstarts)
+        ends.append(cends)
+
+    starts = np.concatenate(starts) if starts else []
+    ends = np.concatenate(ends) if ends else []
+    return BedArray.from_arrays(seqids, starts, ends, sorted=False)
+
+
+def _bed_pairs(abed, bbed, extend=0):
+    """
+    Yields (aidx, bidx) overlapping pairs per seqid, features in a are extended
+    by `extend` on both sides.
+    """
+    bgroups = dict((seqid, idx) for seqid, s, idx in _chr_groups(bbed))
+    for seqid, s, aidx in _chr_groups(abed):
+        if seqid not in bgroups:
+            continue
+        bidx = bgroups[seqid]
+        ai, bj = _overlap_pairs(abed.starts[aidx] - extend,
+                                abed.ends[aidx] + extend,
+                                bbed.starts[bidx], bbed.ends[bidx])
+        yield aidx[ai], bidx[bj]
+
+
+def bed_intersect(abed, bbed):
+    """
+    Overlapping portions of features in a with features in b, in-process
+    version of `intersectBed`. Features keep their other columns from a.
+    """
+    aidx, starts, ends = [], [], []
+    for ai, bj in _bed_pairs(abed, bbed):
+        aidx.append(ai)
+        starts.append(np.maximum(abed.starts[ai], bbed.starts[bj]))
+        ends.append(np.minimum(abed.ends[ai], bbed.ends[bj]))
+    return abed.select(aidx, starts, ends)
+
+
+def bed_subtract(abed, bbed):
+    """
+    Remove from features in a the bases covered by features in b, in-process
+    version of `subtractBed`.
+    """
+    if not len(abed):
+        return abed
+    size = abed.ends.max()
+    sizes = [(x, size) for x in abed.seqid_names]
+    return bed_intersect(abed, bed_complement(bbed, sizes))
+
+
+def bed_coverage(abed, bbed):
+    """
+    For each feature in a, number of features in b that overlap it, and number
+    of bases covered by b. Returns two arrays, following the order of a.
+    """
+    counts = np.zeros(len(abed), dtype=int)
+    for ai, bj in _bed_pairs(abed, bbed):
+        np.add.at(counts, ai, 1)
+
+    bases = np.zeros(len(abed), dtype=int)
+    merged = bed_merge(bbed)
+    for ai, bj in _bed_pairs(abed, merged):
+        overlap = np.minimum(abed.ends[ai], merged.ends[bj]) - \
+                  np.maximum(abed.starts[ai], merged.starts[bj]) + 1
+        np.add.at(bases, ai, overlap)
+    return counts, bases
+
+
+def bed_window(abed, bbed, w=1000):
+    """
+    Pairs of features in a and b that are within distance w, in-process
+    version of `windowBed`. Returns two index arrays.
+    """
+    aidx, bidx = [np.zeros(0, dtype=int)], [np.zeros(0, dtype=int)]
+    for ai, bj in _bed_pairs(abed, bbed, extend=w):
+        aidx.append(ai)
+        bidx.append(bj)
+    return np.concatenate(aidx), np.concatenate(bidx)
+
+
 def main():
 
     actions = (
@@ -397,6 +1023,7 @@ def main():
         ('merge', 'merge bed files'),
         ('index', 'index bed file using tabix'),
         ('bins', 'bin bed lengths into each window'),
+        ('binstore', 'bin multiple bed files into a memory-mappable store'),
         ('summary', 'summarize the lengths of the intervals'),
         ('evaluate', 'make truth table and calculate sensitivity and specificity'),
         ('pile', 'find the ids that intersect'),
@@ -1249,26 +1876,73 @@ def uniq(args):
     return uniqbedfile
 
 
-def subtractbins(binfile1, binfile2):
-    from jcvi.graphics.landscape import BinFile
-
-    abin = BinFile(binfile1)
-    bbin = BinFile(binfile2)
-
-    assert len(abin) == len(bbin)
-
-    fw = open(binfile1, "w")
-
-    for a, b in zip(abin, bbin):
-        assert a.chr == b.chr
-        assert a.binlen == b.binlen
-
-        a.subtract(b)
-        print(a, file=fw)
-
-    fw.close()
-
-    return binfile1
+def get_bin_offsets(sizes, binsize):
+    """
+    Returns the number of bins per seqid (in the order of sizes), the bin
+    offsets of each seqid and the number of bases in each bin.
+    """
+    lens = np.array(sizes.sizes, dtype=np.int64)
+    nbins = (lens + binsize - 1) / binsize
+    offsets = np.concatenate(([0], np.cumsum(nbins)))
+    binlens = np.empty(offsets[-1], dtype=np.int64)
+    binlens.fill(binsize)
+    last_bin = lens % binsize
+    binlens[offsets[1:] - 1] = np.where(last_bin, last_bin, binsize)
+    return nbins, offsets, binlens
+
+
+def bin_features(barray, sizes, binsize, mode="span"):
+    """
+    Accumulate features into consecutive bins across the genome, vectorized
+    with difference arrays. Returns one value per bin, concatenated in the
+    order of sizes. Features on seqids not in sizes are ignored.
+    """
+    nbins, offsets, binlens = get_bin_offsets(sizes, binsize)
+    total = offsets[-1]
+    ctg_offset = dict(zip(sizes.ctgs, offsets[:-1]))
+    ctg_len = sizes.mapping
+    code_offset = np.array([ctg_offset.get(x, -1) for x in barray.seqid_names] +
+                           [-1], dtype=np.int64)
+    code_len = np.array([ctg_len.get(x, 0) for x in barray.seqid_names] + [0],
+                        dtype=np.int64)
+    off = code_offset[barray.seqid_codes]
+    keep = off >= 0
+    off = off[keep]
+    codes = barray.seqid_codes[keep]
+    starts = barray.starts[keep]
+    ends = np.minimum(barray.ends[keep], code_len[codes])
+    # Position at the very end of seqid stays in its last bin
+    lastbin = (code_len[codes] - 1) / binsize
+    startbin = np.minimum(starts / binsize, lastbin)
+    endbin = np.minimum(ends / binsize, lastbin)
+
+    if mode == "span":
+        same = startbin == endbin
+        spans = np.where(same, ends - starts + 1,
+                         (startbin + 1) * binsize - starts + 1)
+        values = np.bincount(off + startbin, weights=spans, minlength=total)
+        d = ~same
+        values += np.bincount(off[d] + endbin[d],
+                              weights=ends[d] - endbin[d] * binsize,
+                              minlength=total)
+        # Bins fully covered in between get the whole binsize
+        diff = np.bincount(off[d] + startbin[d] + 1, minlength=total + 1) - \
+               np.bincount(off[d] + endbin[d], minlength=total + 1)
+        values += np.cumsum(diff)[:total] * binsize
+        return values
+
+    weights = barray.scores[keep].astype(float) if mode == "score" else None
+    diff = np.bincount(off + startbin, weights=weights, minlength=total + 1) - \
+           np.bincount(off + endbin + 1, weights=weights, minlength=total + 1)
+    return np.cumsum(diff)[:total]
+
+
+def load_bins_bed(bedfile, mode="span", merge=True):
+    bed = BedArray(bedfile)
+    if merge:
+        scores = "median" if mode == "score" else None
+        bed = bed_merge(bed, scores=scores)
+    return bed
 
 
 def bins(args):
@@ -1307,74 +1981,97 @@ def bins(args):
         return binfile
 
     sz = Sizes(fastafile)
-    sizesfile = sz.filename
-    sizes = sz.mapping
-    fw = open(binfile, "w")
-    scores = "median" if mode == "score" else None
-    if not opts.nomerge:
-        bedfile = mergeBed(bedfile, nms=True, scores=scores)
+    bed = load_bins_bed(bedfile, mode=mode, merge=(not opts.nomerge))
+    nbins, offsets, binlens = get_bin_offsets(sz, binsize)
     if subtract:
-        subtractmerge = mergeBed(subtract)
-        subtract_complement = complementBed(subtractmerge, sizesfile)
-        bedfile = intersectBed(bedfile, subtract_complement)
+        sbed = bed_merge(BedArray(subtract))
+        bed = bed_subtract(bed, sbed)
+        binlens = binlens - bin_features(sbed, sz, binsize)
 
-    bedfile = sort([bedfile, "-i"])
+    values = bin_features(bed, sz, binsize, mode=mode)
+    if mode == "count":
+        values = values.astype(int)
 
-    bed = Bed(bedfile)
-    sbdict = dict(bed.sub_beds())
-    for chr, chr_len in sorted(sizes.items()):
-        chr_len = sizes[chr]
-        subbeds = sbdict.get(chr, [])
-        nbins = chr_len / binsize
-        last_bin = chr_len % binsize
-        if last_bin:
-            nbins += 1
-
-        a = np.zeros(nbins)  # values
-        b = np.zeros(nbins, dtype="int")  # bases
-        c = np.zeros(nbins, dtype="int")  # count
-        b[:-1] = binsize
-        b[-1] = last_bin
-
-        for bb in subbeds:
-
-            start, end = bb.start, bb.end
-            startbin = start / binsize
-            endbin = end / binsize
-
-            assert startbin <= endbin
-            c[startbin:endbin + 1] += 1
-
-            if mode == "score":
-                a[startbin:endbin + 1] += float(bb.score)
-
-            elif mode == "span":
-                if startbin == endbin:
-                    a[startbin] += end - start + 1
-
-                if startbin < endbin:
-                    firstsize = (startbin + 1) * binsize - start + 1
-                    lastsize = end - endbin * binsize
-                    a[startbin] += firstsize
-                    if startbin + 1 < endbin:
-                        a[startbin + 1:endbin] += binsize
-                    a[endbin] += lastsize
-
-        if mode == "count":
-            a = c
-
-        for xa, xb in zip(a, b):
+    fw = open(binfile, "w")
+    for chr, a, b in sorted(zip(sz.ctgs, offsets[:-1], offsets[1:])):
+        for xa, xb in zip(values[a:b], binlens[a:b]):
             print("\t".join(str(x) for x in (chr, xa, xb)), file=fw)
-
     fw.close()
 
-    if subtract:
-        subtractbinfile = bins([subtract, fastafile, "--binsize={0}".format(binsize)])
-        binfile = subtractbins(binfile, subtractbinfile)
-
     return binfile
 
 
+def binstore(args):
+    """
+    %prog binstore fastafile bedfile1 bedfile2 ...
+
+    Bin several bed files into several bin sizes at once, the values are
+    written to a .npz bin store that `graphics.landscape` memory-maps. The
+    store contains `seqids`, `sizes`, `tracks` (the bed files), `binsizes`,
+    `mode`, and for each bin size `offsets_<binsize>` (first bin of each
+    seqid) and `binlens_<binsize>` (bases in each bin, after --subtract), and
+    `values_<i>_<binsize>` for the i-th bed file. An existing store is only
+    reused if it was built from the same files with the same options.
+    """
+    p = OptionParser(binstore.__doc__)
+    p.add_option("--binsize", default="100000",
+                 help="Sizes of the bins, comma separated [default: %default]")
+    p.add_option("--subtract",
+                 help="Subtract bases from window [default: %default]")
+    p.add_option("--mode", default="span", choices=("span", "count", "score"),
+                 help="Accumulate feature based on [default: %default]")
+    p.add_option("--nomerge", default=False, action="store_true",
+                 help="Do not merge features")
+    p.set_outfile(outfile="bins.npz")
+    opts, args = p.parse_args(args)
+
+    if len(args) < 2:
+        sys.exit(not p.print_help())
+
+    fastafile = args[0]
+    bedfiles = args[1:]
+    subtract = opts.subtract
+    mode = opts.mode
+    binsizes = [int(x) for x in opts.binsize.split(",")]
+    storefile = opts.outfile
+    params = {"tracks": bedfiles, "binsizes": binsizes, "mode": mode,
+              "subtract": subtract or "", "merge": not opts.nomerge}
+    depends = [fastafile] + bedfiles + ([subtract] if subtract else [])
+    if not need_update(depends, storefile):
+        stored = np.load(storefile)
+        reuse = all(k in stored and stored[k].tolist() == v
+                    for k, v in params.items())
+        stored.close()
+        if reuse:
+            return storefile
+        logging.debug("Options differ from `{0}`, rebuilding".format(storefile))
+
+    sz = Sizes(fastafile)
+    store = dict((k, np.array(v)) for k, v in params.items())
+    store.update({"seqids": np.array(sz.ctgs), "sizes": np.array(sz.sizes)})
+    sbed = bed_merge(BedArray(subtract)) if subtract else None
+    for binsize in binsizes:
+        nbins, offsets, binlens = get_bin_offsets(sz, binsize)
+        if subtract:
+            binlens = binlens - bin_features(sbed, sz, binsize)
+        store["offsets_{0}".format(binsize)] = offsets
+        store["binlens_{0}".format(binsize)] = binlens
+
+    for i, bedfile in enumerate(bedfiles):
+        bed = load_bins_bed(bedfile, mode=mode, merge=(not opts.nomerge))
+        if subtract:
+            bed = bed_subtract(bed, sbed)
+        for binsize in binsizes:
+            values = bin_features(bed, sz, binsize, mode=mode)
+            store["values_{0}_{1}".format(i, binsize)] = values
+
+    # Uncompressed, so that the arrays can be memory-mapped
+    np.savez(storefile, **store)
+    logging.debug("Bins of {0} tracks x {1} bin sizes written to `{2}`".\
+                  format(len(bedfiles), len(binsizes), storefile))
+    return storefile
+
+
 def pile(args):
     """
     %prog pile abedfile bbedfile > piles
@@ -1449,76 +2146,85 @@ def index(args):
 
 
 def fastaFromBed(bedfile, fastafile, name=False, tab=False, stranded=False):
+    from jcvi.formats.fasta import Fasta
+
     suffix = ".sfa" if tab else ".fasta"
     outfile = op.basename(bedfile).rsplit(".", 1)[0] + suffix
-    cmd = "fastaFromBed -fi {0} -bed {1} -fo {2}".\
-            format(fastafile, bedfile, outfile)
-    if name:
-        cmd += " -name"
-    if tab:
-        cmd += " -tab"
-    if stranded:
-        cmd += " -s"
-
-    if need_update([bedfile, fastafile], outfile):
-        sh(cmd, outfile=outfile)
+    if not need_update([bedfile, fastafile], outfile):
+        return outfile
+
+    f = Fasta(fastafile, index=True)
+    fw = open(outfile, "w")
+    for b in Bed(bedfile, sorted=False):
+        strand = b.strand if stranded else None
+        seq = f.sequence({'chr': b.seqid, 'start': b.start, 'stop': b.end,
+                          'strand': strand})
+        header = b.accn if name else \
+                 "{0}:{1}-{2}".format(b.seqid, b.start - 1, b.end)
+        if stranded:  # same as bedtools -s
+            header += "({0})".format(b.strand or ".")
+        if tab:
+            print("\t".join((header, seq)), file=fw)
+        else:
+            print(">{0}\n{1}".format(header, seq), file=fw)
+    fw.close()
 
     return outfile
 
 
 def mergeBed(bedfile, d=0, sorted=False, nms=False, s=False, scores=None, delim=";"):
-    if not sorted:
-        bedfile = sort([bedfile, "-i"])
-    cmd = "mergeBed -i {0}".format(bedfile)
-    if d:
-        cmd += " -d {0}".format(d)
-    if nms:
-        nargs = len(open(bedfile).readline().split())
-        if nargs <= 3:
-            logging.debug("Only {0} columns detected... set nms=True"\
-                            .format(nargs))
-        else:
-            cmd += " -c 4 -o collapse"
-    if s:
-        cmd += " -s"
+    # merging is done in memory, so `sorted` is no longer needed
+    pf = bedfile.rsplit(".", 1)[0] if bedfile.endswith(".bed") else bedfile
+    mergebedfile = op.basename(pf) + ".merge.bed"
+    if not need_update(bedfile, mergebedfile):
+        return mergebedfile
+
+    bed = BedArray(bedfile)
+    if nms and (not len(bed) or bed.nargs.max() <= 3):
+        logging.debug("Only {0} columns detected... set nms=False"\
+                        .format(bed.nargs.max() if len(bed) else 0))
+        nms = False
     if scores:
         valid_opts = ("sum", "min", "max", "mean", "median",
                 "mode", "antimode", "collapse")
         if not scores in valid_opts:
             scores = "mean"
-        cmd += " -scores {0}".format(scores)
-
-    if delim:
-        cmd += ' -delim "{0}"'.format(delim)
 
-    pf = bedfile.rsplit(".", 1)[0] if bedfile.endswith(".bed") else bedfile
-    mergebedfile = op.basename(pf) + ".merge.bed"
+    merged = bed_merge(bed, d=d, strand=s, nms=nms, scores=scores,
+                       delim=delim or ",")
+    fw = open(mergebedfile, "w")
+    for i in xrange(len(merged)):
+        row = [merged.seqid_names[merged.seqid_codes[i]],
+               merged.starts[i] - 1, merged.ends[i]]
+        if nms:
+            row.append(merged.accns_array[i])
+        if scores and merged.scores is not None:
+            row.append(merged.scores[i])
+        if s:
+            row.append(merged.strands[i])
+        print("\t".join(str(x) for x in row), file=fw)
+    fw.close()
 
-    if need_update(bedfile, mergebedfile):
-        sh(cmd, outfile=mergebedfile)
     return mergebedfile
 
 
 def complementBed(bedfile, sizesfile):
-    cmd = "complementBed"
-    cmd += " -i {0} -g {1}".format(bedfile, sizesfile)
     complementbedfile = "complement_" + op.basename(bedfile)
 
     if need_update([bedfile, sizesfile], complementbedfile):
-        sh(cmd, outfile=complementbedfile)
+        cbed = bed_complement(BedArray(bedfile), Sizes(sizesfile))
+        cbed.print_to_file(complementbedfile)
     return complementbedfile
 
 
 def intersectBed(bedfile1, bedfile2):
-    cmd = "intersectBed"
-    cmd += " -a {0} -b {1}".format(bedfile1, bedfile2)
     suffix = ".intersect.bed"
-
     intersectbedfile = ".".join((op.basename(bedfile1).split(".")[0],
             op.basename(bedfile2).split(".")[0])) + suffix
 
     if need_update([bedfile1, bedfile2], intersectbedfile):
-        sh(cmd, outfile=intersectbedfile)
+        ibed = bed_intersect(BedArray(bedfile1), BedArray(bedfile2))
+        ibed.print_to_file(intersectbedfile)
     return intersectbedfile
 
 
@@ -1597,29 +2303,29 @@ def evaluate(args):
 
 
 def intersectBed_wao(abedfile, bbedfile, minOverlap=0):
-    abed = Bed(abedfile)
-    bbed = Bed(bbedfile)
+    # Same order as `intersectBed -wao`: a and its hits in b in file order
+    abed = BedArray(abedfile, sorted=False)
+    bbed = BedArray(bbedfile, sorted=False)
     print("`{0}` has {1} features.".format(abedfile, len(abed)), file=sys.stderr)
     print("`{0}` has {1} features.".format(bbedfile, len(bbed)), file=sys.stderr)
 
-    cmd = "intersectBed -wao -a {0} -b {1}".format(abedfile, bbedfile)
-    acols = abed[0].nargs
-    bcols = bbed[0].nargs
-    fp = popen(cmd)
-    for row in fp:
-        atoms = row.split()
-        aline = "\t".join(atoms[:acols])
-        bline = "\t".join(atoms[acols:acols + bcols])
-        c = int(atoms[-1])
-        if c < minOverlap:
+    hits = defaultdict(list)
+    for ai, bj in _bed_pairs(abed, bbed):
+        for i, j in zip(ai, bj):
+            hits[i].append(j)
+
+    for i in xrange(len(abed)):
+        a = abed[i]
+        if i not in hits:
+            # features in a without overlap are reported with overlap of 0
+            if minOverlap <= 0:
+                yield a, None
             continue
-        a = BedLine(aline)
-        try:
-            b = BedLine(bline)
-        except AssertionError:
-            b = None
-
-        yield a, b
+        for j in sorted(hits[i]):
+            c = min(a.end, bbed.ends[j]) - max(a.start, bbed.starts[j]) + 1
+            if c < minOverlap:
+                continue
+            yield a, bbed[j]
 
 
 def refine(args):
@@ -2057,8 +2763,8 @@ def sort(args):
     """
     %prog sort bedfile
 
-    Sort bed file to have ascending order of seqid, then start. It uses the
-    `sort` command.
+    Sort bed file to have ascending order of seqid, then start. Sorting is
+    done in memory, same order as `sort -k1,1 -k2,2n -k3,3n -k4,4`.
     """
     p = OptionParser(sort.__doc__)
     p.add_option("-i", "--inplace", dest="inplace",
@@ -2070,7 +2776,6 @@ def sort(args):
     p.add_option("--accn", default=False, action="store_true",
             help="Sort based on the accessions [default: %default]")
     p.set_outfile(outfile=None)
-    p.set_tmpdir()
     opts, args = p.parse_args(args)
 
     if len(args) != 1:
@@ -2089,21 +2794,44 @@ def sort(args):
         pf, sf = op.basename(bedfile).rsplit(".", 1)
         sortedbed = pf + ".sorted." + sf
 
-    sortopt = "-k1,1 -k2,2n -k3,3n -k4,4" if not opts.accn else \
-              "-k4,4 -k1,1 -k2,2n -k3,3n"
-    cmd = "sort"
-    if opts.tmpdir:
-        cmd += " -T {0}".format(opts.tmpdir)
-    if opts.unique:
-        cmd += " -u"
-    cmd += " {0} {1} -o {2}".format(sortopt, bedfile, sortedbed)
-
     if inplace or need_update(bedfile, sortedbed):
-        sh(cmd)
+        sort_lines(bedfile, sortedbed, accn=opts.accn, unique=opts.unique)
 
     return sortedbed
 
 
+def sort_lines(bedfile, sortedbed, accn=False, unique=False):
+    """
+    Sort the lines in bedfile by (seqid, start, end, accn), or by accn first.
+    With unique=True, only the first line of each key is kept, same as
+    `sort -u`. Header lines are kept on top.
+    """
+    header, keyed = [], []
+    for row in must_open(bedfile):
+        if row[0] == "#" or row.startswith("track"):
+            header.append(row)
+            continue
+        atoms = row.split(None, 4)
+        if not atoms:
+            continue
+        key = (atoms[0], int(atoms[1]), int(atoms[2]),
+               atoms[3] if len(atoms) > 3 else "")
+        if accn:
+            key = key[-1:] + key[:-1]
+        keyed.append((key, row))
+
+    keyed.sort(key=lambda x: x[0])
+    fw = must_open(sortedbed, "w")
+    for row in header:
+        fw.write(row)
+    for key, rows in groupby(keyed, key=lambda x: x[0]):
+        for k, row in rows:
+            fw.write(row)
+            if unique:
+                break
+    fw.close()
+
+
 def mates(args):
     """
     %prog mates bedfile
@@ -6,19 +6,22 @@ from __future__ import print_function
 import os.path as op
 import sys
 import logging
+import numpy as np
 
-from itertools import groupby
+from itertools import groupby, islice
 from collections import defaultdict
 
-from jcvi.formats.base import LineFile, BaseFile, must_open
-from jcvi.formats.bed import Bed
+from jcvi.formats.base import LineFile, BaseFile, must_open, npz_memmap, \
+            npz_pack
+from jcvi.formats.bed import Bed, BedArray
 from jcvi.formats.sizes import Sizes
 from jcvi.utils.grouper import Grouper
 from jcvi.utils.orderedcollections import OrderedDict
 from jcvi.utils.range import range_distance
 from jcvi.utils.cbook import percentage, thousands
 from jcvi.assembly.base import calculate_A50
-from jcvi.apps.base import OptionParser, ActionDispatcher, sh, popen
+from jcvi.apps.base import OptionParser, ActionDispatcher, sh, popen, \
+            need_update
 
 
 try:
@@ -30,13 +33,18 @@ except:
 
 class BlastSlow (LineFile):
     """
-    Load entire blastfile into memory
+    Load entire blastfile into memory. With `binary=True`, hits are read from
+    the binary cache (see `BlastBinary`) if it is up to date.
     """
-    def __init__(self, filename, sorted=False):
+    def __init__(self, filename, sorted=False, binary=False):
         super(BlastSlow, self).__init__(filename)
-        fp = must_open(filename)
-        for row in fp:
-            self.append(BlastLine(row))
+        blastbinary = load_binary_blastfile(filename) if binary else None
+        if blastbinary is not None:
+            self.extend(blastbinary)
+        else:
+            fp = must_open(filename)
+            for row in fp:
+                self.append(BlastLine(row))
         self.sorted = sorted
         if not sorted:
             self.sort(key=lambda x: x.query)
@@ -69,13 +77,22 @@ class Blast (BaseFile):
     """
     We can have a Blast class that loads entire file into memory, this is
     not very efficient for big files (BlastSlow); when the BLAST file is
-    generated by BLAST/BLAT, the file is already sorted
+    generated by BLAST/BLAT, the file is already sorted. With `binary=True`,
+    hits are read from the binary cache (see `BlastBinary`) if it is up to
+    date.
     """
-    def __init__(self, filename):
+    def __init__(self, filename, binary=False):
         super(Blast, self).__init__(filename)
-        self.fp = must_open(filename)
+        self.binary = load_binary_blastfile(filename) if binary else None
+        if self.binary is None:
+            self.fp = must_open(filename)
 
     def __iter__(self):
+        if self.binary is not None:
+            for b in self.binary:
+                yield b
+            return
+
         self.fp.seek(0)
         for row in self.fp:
             if row[0] == '#':
@@ -83,6 +100,11 @@ class Blast (BaseFile):
             yield BlastLine(row)
 
     def iter_hits(self):
+        if self.binary is not None:
+            for query, blines in self.binary.iter_hits():
+                yield query, blines
+            return
+
         for query, blines in groupby(self.fp,
                 key=lambda x: BlastLine(x).query):
             blines = [BlastLine(x) for x in blines]
@@ -90,6 +112,11 @@ class Blast (BaseFile):
             yield query, blines
 
     def iter_best_hit(self, N=1, hsps=False, ref="query"):
+        if self.binary is not None:
+            for bref, b in self.binary.iter_best_hit(N=N, hsps=hsps, ref=ref):
+                yield bref, b
+            return
+
         if ref == "query":
             ref, hit = "query", "subject"
         elif ref == "subject":
@@ -132,6 +159,197 @@ class Blast (BaseFile):
         return dict(self.iter_best_hit())
 
 
+BlastBinaryDtype = np.dtype([("query", "i4"), ("subject", "i4"),
+                             ("pctid", "f4"), ("hitlen", "i4"),
+                             ("nmismatch", "i4"), ("ngaps", "i4"),
+                             ("qstart", "i4"), ("qstop", "i4"),
+                             ("sstart", "i4"), ("sstop", "i4"),
+                             ("evalue", "f8"), ("score", "f4")])
+
+
+# `orientation` is a str in pyblast and a char code in cblast
+BLASTLINE_ORIENTATIONS = tuple(BlastLine("q\ts\t0\t0\t0\t0\t1\t1\t1\t{0}\t0\t0".\
+                               format(x)).orientation for x in (1, 0))
+
+
+def get_binary_blastfile(blastfile):
+    return blastfile + ".npz"
+
+
+def load_binary_blastfile(blastfile):
+    """
+    Returns the `BlastBinary` of blastfile if it is up to date, else None.
+    """
+    binfile = get_binary_blastfile(blastfile)
+    if op.isfile(blastfile) and not need_update(blastfile, binfile):
+        return BlastBinary(binfile)
+    return None
+
+
+class BlastBinary (BaseFile):
+    """
+    Columnar binary version of the BLAST tabular file, built with `blast
+    binary`. The file is an uncompressed .npz that contains `ids` (the
+    interned query and subject names) and `hits`, a record array with one
+    row per line (query and subject are indices into `ids`, the other columns
+    are the numeric BLAST columns as in the file). `hits` is memory-mapped,
+    only the rows that are accessed are ever read from disk.
+    """
+    def __init__(self, filename):
+        super(BlastBinary, self).__init__(filename)
+        self.ids = np.load(filename)["ids"].tolist()
+        self.hits = npz_memmap(filename, "hits")
+
+    def __len__(self):
+        return len(self.hits)
+
+    def blastlines(self, rows):
+        """
+        Build `BlastLine` objects for the given row indices straight from the
+        columns, without going through the text format.
+        """
+        ids = self.ids
+        plus, minus = BLASTLINE_ORIENTATIONS
+        blines = []
+        for (query, subject, pctid, hitlen, nmismatch, ngaps, qstart, qstop,
+             sstart, sstop, evalue, score) in self.hits[rows].tolist():
+            b = BlastLine.__new__(BlastLine)
+            b.query, b.subject = ids[query], ids[subject]
+            b.pctid, b.hitlen, b.nmismatch, b.ngaps = \
+                    pctid, hitlen, nmismatch, ngaps
+            b.evalue, b.score = evalue, score
+            b.orientation = plus
+            if qstart > qstop:
+                qstart, qstop = qstop, qstart
+                b.orientation = minus
+            if sstart > sstop:
+                sstart, sstop = sstop, sstart
+                b.orientation = minus
+            b.qstart, b.qstop, b.sstart, b.sstop = qstart, qstop, sstart, sstop
+            blines.append(b)
+        return blines
+
+    def blastline(self, i):
+        return self.blastlines([i])[0]
+
+    def __iter__(self, chunksize=100000):
+        for i in xrange(0, len(self), chunksize):
+            for b in self.blastlines(slice(i, i + chunksize)):
+                yield b
+
+    def iter_runs(self, ref="query"):
+        """
+        Yields (start, end) of consecutive rows that share the same ref,
+        end exclusive. Same grouping as `groupby` on the text file.
+        """
+        refs = self.hits[ref]
+        bounds = np.flatnonzero(refs[1:] != refs[:-1]) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(refs)]))
+        return zip(starts, ends) if len(refs) else []
+
+    def iter_hits(self):
+        scores = self.hits["score"]
+        for a, b in self.iter_runs():
+            order = a + np.argsort(-scores[a:b], kind="mergesort")
+            blines = self.blastlines(order)
+            yield blines[0].query, blines
+
+    def iter_best_hit(self, N=1, hsps=False, ref="query"):
+        if ref == "query":
+            ref, hit = "query", "subject"
+        elif ref == "subject":
+            ref, hit = "subject", "query"
+        else:
+            sys.exit("`ref` must be either `query` or `subject`.")
+
+        if not hsps:
+            for b in self.blastlines(self.best_hit_index(N=N, ref=ref)):
+                yield getattr(b, ref), b
+            return
+
+        scores = self.hits["score"]
+        hits = self.hits[hit]
+        for a, b in self.iter_runs(ref=ref):
+            order = a + np.argsort(-scores[a:b], kind="mergesort")
+            selected = set()
+            rows = []
+            for i in order:
+                if hits[i] not in selected:
+                    if len(selected) >= N:
+                        continue
+                    selected.add(hits[i])
+                rows.append(i)
+            for bl in self.blastlines(rows):
+                yield getattr(bl, ref), bl
+
+    def best_hit_index(self, N=1, ref="query"):
+        """
+        Vectorized selection of the N best scoring rows within each run of
+        the same ref. Returns row indices, runs in file order and score
+        descending within each run.
+        """
+        refs = self.hits[ref]
+        if not len(refs):
+            return np.zeros(0, dtype=int)
+        runs = np.concatenate(([0], np.cumsum(refs[1:] != refs[:-1])))
+        order = np.lexsort((-self.hits["score"], runs))
+        runstarts = np.searchsorted(runs[order], runs[order], side="left")
+        rank = np.arange(len(order)) - runstarts
+        return order[rank < N]
+
+    @property
+    def hits_dict(self):
+        return dict(self.iter_hits())
+
+    @property
+    def best_hits(self):
+        """
+        returns a dict with query => best blasthit
+        """
+        return dict(self.iter_best_hit())
+
+
+def blast_to_binary(blastfile, binfile, chunksize=1000000):
+    """
+    Convert BLAST tabular file to `BlastBinary`, chunk by chunk so that only
+    the ID table is kept in memory.
+    """
+    nrows = sum(1 for row in must_open(blastfile) if row[0] != '#')
+    hitsfile = binfile + ".hits.npy"
+    hits = np.lib.format.open_memmap(hitsfile, mode="w+",
+                                     dtype=BlastBinaryDtype, shape=(nrows,))
+    ids = {}
+    intern = lambda x: ids.setdefault(x, len(ids))
+    fp = must_open(blastfile)
+    i = 0
+    while True:
+        rows = [x.rstrip("\n").split("\t") for x in islice(fp, chunksize)
+                if x[0] != '#']
+        if not rows:
+            break
+        j = i + len(rows)
+        cols = zip(*rows)
+        hits["query"][i:j] = [intern(x) for x in cols[0]]
+        hits["subject"][i:j] = [intern(x) for x in cols[1]]
+        for name, col in zip(BlastBinaryDtype.names[2:], cols[2:12]):
+            hits[name][i:j] = np.array(col).astype(BlastBinaryDtype[name])
+        i = j
+    hits.flush()
+    del hits
+
+    idsfile = binfile + ".ids.npy"
+    idarray = np.empty(len(ids), dtype="S{0}".format(max(len(x) for x in ids)
+                                                      if ids else 1))
+    for x, xid in ids.items():
+        idarray[xid] = x
+    np.save(idsfile, idarray)
+    npz_pack(binfile, {"hits": hitsfile, "ids": idsfile})
+    logging.debug("{0} hits with {1} unique IDs written to `{2}`".\
+                  format(nrows, len(ids), binfile))
+    return binfile
+
+
 class BlastLineByConversion (BlastLine):
     """
     make BlastLine object from tab delimited line objects with
@@ -359,11 +577,35 @@ def main():
         ('score', 'add up the scores for each query seq'),
         ('rbbh', 'find reciprocal-best blast hits'),
         ('gaps', 'find distribution of gap sizes between adjacent HSPs'),
+        ('binary', 'convert BLAST tabular file to binary columnar cache'),
             )
     p = ActionDispatcher(actions)
     p.dispatch(globals())
 
 
+def binary(args):
+    """
+    %prog binary blastfile
+
+    Convert BLAST tabular file to a binary columnar file (blastfile.npz), with
+    interned query/subject IDs and fixed-width numeric columns. `Blast(...,
+    binary=True)` reads from the binary file if it is newer than the blastfile.
+    """
+    p = OptionParser(binary.__doc__)
+    p.add_option("--chunksize", default=1000000, type="int",
+                 help="Number of lines to convert at a time [default: %default]")
+    opts, args = p.parse_args(args)
+
+    if len(args) != 1:
+        sys.exit(not p.print_help())
+
+    blastfile, = args
+    binfile = get_binary_blastfile(blastfile)
+    if need_update(blastfile, binfile):
+        blast_to_binary(blastfile, binfile, chunksize=opts.chunksize)
+    return binfile
+
+
 def collect_gaps(blast, use_subject=False):
     """
     Collect the gaps between adjacent HSPs in the BLAST file.
@@ -690,6 +932,74 @@ def sort(args):
     sh(cmd)
 
 
+def get_cscores(queries, subjects, scores, cutoff=None):
+    """
+    Vectorized C-score. `queries` and `subjects` are integer codes that share
+    the same ID space, `scores` are the bit scores. Best scores per ID are
+    found with `np.maximum.at`. Returns the C-scores and the mask of
+    C-score > cutoff (None if no cutoff).
+
+    >>> cs, mask = get_cscores([0, 0, 1], [1, 2, 2], [10., 5., 8.], cutoff=.6)
+    >>> cs.tolist(), mask.tolist()
+    ([1.0, 0.5, 0.8], [True, False, True])
+    """
+    queries, subjects = np.asarray(queries), np.asarray(subjects)
+    scores = np.asarray(scores, dtype=float)
+    if not len(scores):
+        cs = np.zeros(0)
+        return cs, (None if cutoff is None else cs > cutoff)
+
+    best = np.zeros(max(queries.max(), subjects.max()) + 1)
+    np.maximum.at(best, queries, scores)
+    np.maximum.at(best, subjects, scores)
+
+    cs = scores / np.maximum(best[queries], best[subjects])
+    mask = None if cutoff is None else cs > cutoff
+    return cs, mask
+
+
+def read_blast_columns(blastfile, strip=False, binary=False):
+    """
+    Returns ids, queries, subjects, scores, pctids where queries and subjects
+    are indices into ids. With binary=True, the binary cache is used if it is
+    up to date.
+    """
+    from jcvi.utils.cbook import gene_name
+
+    blast = Blast(blastfile, binary=binary)
+    if blast.binary is not None:
+        hits = blast.binary.hits
+        ids = blast.binary.ids
+        queries, subjects = np.array(hits["query"]), np.array(hits["subject"])
+        scores, pctids = np.array(hits["score"]), np.array(hits["pctid"])
+        if strip:
+            names = {}
+            recode = np.array([names.setdefault(gene_name(x), len(names))
+                               for x in ids], dtype=int)
+            queries, subjects = recode[queries], recode[subjects]
+            ids = sorted(names, key=names.get)
+    else:
+        names = {}
+        intern = lambda x: names.setdefault(gene_name(x) if strip else x,
+                                            len(names))
+        queries, subjects, scores, pctids = [], [], [], []
+        for row in must_open(blastfile):
+            if row[0] == '#':
+                continue
+            atoms = row.split("\t", 12)
+            queries.append(intern(atoms[0]))
+            subjects.append(intern(atoms[1]))
+            pctids.append(atoms[2])
+            scores.append(atoms[11])
+        ids = sorted(names, key=names.get)
+        queries, subjects = np.array(queries), np.array(subjects)
+        # Same precision as BlastLine
+        scores = np.array(scores, dtype="f4")
+        pctids = np.array(pctids, dtype="f4")
+
+    return ids, queries, subjects, scores.astype(float), pctids.astype(float)
+
+
 def cscore(args):
     """
     %prog cscore blastfile > cscoreOut
@@ -704,8 +1014,6 @@ def cscore(args):
     Output file will be 3-column (query, subject, cscore). Use --cutoff to
     select a different cutoff.
     """
-    from jcvi.utils.cbook import gene_name
-
     p = OptionParser(cscore.__doc__)
     p.add_option("--cutoff", default=.9999, type="float",
             help="Minimum C-score to report [default: %default]")
@@ -713,6 +1021,9 @@ def cscore(args):
             help="Also include pct as last column [default: %default]")
     p.add_option("--writeblast", default=False, action="store_true",
             help="Also write filtered blast file [default: %default]")
+    p.add_option("--binary", default=False, action="store_true",
+            help="Read from the `blast binary` file if it is up to date "
+                 "[default: %default]")
     p.set_stripnames()
     p.set_outfile()
 
@@ -726,52 +1037,47 @@ def cscore(args):
 
     blastfile, = args
 
-    blast = Blast(blastfile)
     logging.debug("Register best scores ..")
-    best_score = defaultdict(float)
-    for b in blast:
-        query, subject = b.query, b.subject
-        if ostrip:
-            query, subject = gene_name(query), gene_name(subject)
-
-        score = b.score
-        if score > best_score[query]:
-            best_score[query] = score
-        if score > best_score[subject]:
-            best_score[subject] = score
-
-    blast = Blast(blastfile)
-    pairs = {}
-    cutoff = opts.cutoff
-    for b in blast:
-        query, subject = b.query, b.subject
-        if ostrip:
-            query, subject = gene_name(query), gene_name(subject)
-
-        score = b.score
-        pctid = b.pctid
-        s = score / max(best_score[query], best_score[subject])
-        if s > cutoff:
-            pair = (query, subject)
-            if pair not in pairs or s > pairs[pair][0]:
-                pairs[pair] = (s, pctid, b)
+    ids, queries, subjects, scores, pctids = \
+            read_blast_columns(blastfile, strip=ostrip, binary=opts.binary)
+    cs, mask = get_cscores(queries, subjects, scores, cutoff=opts.cutoff)
+
+    # Best C-score for each pair, first one in file if tied
+    rows = np.flatnonzero(mask)
+    order = np.lexsort((rows, -cs[rows], subjects[rows], queries[rows]))
+    rows = rows[order]
+    pq, ps = queries[rows], subjects[rows]
+    first = np.concatenate(([True], (pq[1:] != pq[:-1]) |
+                                    (ps[1:] != ps[:-1])))
+    rows = rows[first]
+    pairs = sorted((ids[queries[i]], ids[subjects[i]], i) for i in rows)
 
     fw = must_open(outfile, "w")
     if writeblast:
         fwb = must_open(outfile + ".filtered.blast", "w")
+        blines = dict(iter_blastlines(blastfile, set(rows)))
     pct = opts.pct
-    for (query, subject), (s, pctid, b) in sorted(pairs.items()):
-        args = [query, subject, "{0:.2f}".format(s)]
+    for query, subject, i in pairs:
+        args = [query, subject, "{0:.2f}".format(cs[i])]
         if pct:
-            args.append("{0:.1f}".format(pctid))
+            args.append("{0:.1f}".format(pctids[i]))
         print("\t".join(args), file=fw)
         if writeblast:
-            print(b, file=fwb)
+            print(blines[i], file=fwb)
     fw.close()
     if writeblast:
         fwb.close()
 
 
+def iter_blastlines(blastfile, rows):
+    """
+    Yields (index, BlastLine) for selected row indices.
+    """
+    for i, b in enumerate(Blast(blastfile)):
+        if i in rows:
+            yield i, b
+
+
 def get_distance(a, b, xaxis=True):
     """
     Returns the distance between two blast HSPs.
@@ -1002,7 +1308,7 @@ def covfilter(args):
     alignlen = 0
     queries = set()
     valid = set()
-    blast = BlastSlow(blastfile)
+    blast = BlastSlow(blastfile, binary=True)
     iterator = blast.iter_hits_pair if qspair else blast.iter_hits
 
     covidstore = {}
@@ -1311,22 +1617,24 @@ def subset(args):
     assert qchrs or schrs, p.print_help()
     convert = opts.convert
 
+    qbed = BedArray(qbedfile)
+    sbed = BedArray(sbedfile)
     outfile = blastfile + "."
     if qchrs:
         outfile += qchrs + "."
         qchrs = set(qchrs.split(","))
     else:
-        qchrs = set(Bed(qbedfile).seqids)
+        qchrs = set(qbed.seqids)
     if schrs:
         schrs = set(schrs.split(","))
         if qbedfile != sbedfile or qchrs != schrs:
             outfile += ",".join(schrs) + "."
     else:
-        schrs = set(Bed(sbedfile).seqids)
+        schrs = set(sbed.seqids)
     outfile += "blast"
 
-    qo = Bed(qbedfile).order
-    so = Bed(sbedfile).order
+    qo = qbed.order
+    so = sbed.order
 
     fw = must_open(outfile, "w")
     for b in Blast(blastfile):
@@ -11,7 +11,12 @@ import shutil
 import logging
 import string
 
+import numpy as np
+
 from itertools import groupby
+from collections import Counter, OrderedDict
+from functools import partial
+from six import StringIO
 from six.moves import zip_longest
 
 from Bio import SeqIO
@@ -21,12 +26,168 @@ from Bio.SeqUtils.CheckSum import seguid
 
 from hashlib import md5
 
-from jcvi.formats.base import BaseFile, DictFile, must_open
+from jcvi.formats.base import BaseFile, DictFile, must_open, \
+        iter_record_chunks, iter_chunk_records
 from jcvi.formats.bed import Bed
 from jcvi.utils.cbook import percentage
 from jcvi.utils.table import write_csv
 from jcvi.apps.console import red, green
 from jcvi.apps.base import OptionParser, ActionDispatcher, need_update
+from jcvi.apps.grid import parallel_map, pipeline_map
+
+
+class FastaIndex (BaseFile):
+    """
+    Random access to an uncompressed FASTA file through a samtools-compatible
+    `.fai` index. Each record is stored as name, length, offset of the first
+    base, bases per line and bytes per line, so a subsequence is read by
+    seeking to its byte offset rather than parsing the whole record. The
+    index is built (and cached next to the FASTA file) if missing or stale.
+
+    >>> import tempfile
+    >>> fastafile = tempfile.mkstemp(suffix=".fasta")[1]
+    >>> print(">chr1 first\\nACGT\\nAC\\n>chr2\\nGG", file=open(fastafile, "w"))
+    >>> fi = FastaIndex(fastafile)
+    >>> fi.fetch('chr1', 3, 5), fi.description('chr1')
+    ('TA', 'chr1 first')
+    >>> fi.close()
+    """
+    def __init__(self, filename):
+        super(FastaIndex, self).__init__(filename)
+        self.faifile = filename + ".fai"
+        self.index = OrderedDict()
+        self.fp = None
+        if need_update(filename, self.faifile):
+            self.build()
+        else:
+            self.load()
+
+    @classmethod
+    def supports(cls, filename):
+        return bool(filename) and op.isfile(filename) and \
+               not filename.endswith(".gz")
+
+    def load(self):
+        for row in open(self.faifile):
+            name, length, offset, linebases, linewidth = row.split()[:5]
+            self.index[name] = (int(length), int(offset),
+                                int(linebases), int(linewidth))
+
+    def add(self, name, length, offset, linebases, linewidth):
+        if name in self.index:
+            logging.error("Duplicate sequence name `{0}` in `{1}`, ignored".\
+                            format(name, self.filename))
+            return
+        self.index[name] = (length, offset, linebases, linewidth)
+
+    def build(self):
+        """
+        Scan the FASTA file once, checking that all lines in a record except
+        the last have the same length (as required by samtools faidx).
+        """
+        name = None
+        offset = 0
+        fp = open(self.filename, "rb")
+        for line in fp:
+            nbytes = len(line)
+            if line[:1] == b">":
+                if name is not None:
+                    self.add(name, length, start, linebases, linewidth)
+                name = line[1:].split(None, 1)[0]
+                if not isinstance(name, str):
+                    name = name.decode()
+                start = offset + nbytes
+                length = linebases = linewidth = 0
+                short = False
+            elif name is not None:
+                nbases = len(line.rstrip(b"\r\n"))
+                if nbases:
+                    if short or (linebases and nbases > linebases):
+                        fp.close()
+                        raise ValueError("Different line length in `{0}` of `{1}`".\
+                                            format(name, self.filename))
+                    if not linebases:
+                        linebases, linewidth = nbases, nbytes
+                if nbases < linebases or nbytes != linewidth:
+                    short = True
+                length += nbases
+            offset += nbytes
+        if name is not None:
+            self.add(name, length, start, linebases, linewidth)
+        fp.close()
+
+        try:
+            fw = open(self.faifile, "w")
+            for name, fields in self.index.items():
+                print("\t".join(str(x) for x in (name,) + fields), file=fw)
+            fw.close()
+            logging.debug("Index written to `{0}`".format(self.faifile))
+        except IOError as e:
+            logging.error("Cannot write `{0}`: {1}".format(self.faifile, e))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def keys(self):
+        return list(self.index.keys())
+
+    def itersizes(self):
+        for name, fields in self.index.items():
+            yield name, fields[0]
+
+    def size(self, name):
+        return self.index[name][0]
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+    __del__ = close
+
+    def read(self, start, end):
+        if self.fp is None:
+            self.fp = open(self.filename, "rb")
+        self.fp.seek(start)
+        data = self.fp.read(end - start)
+        if not isinstance(data, str):
+            data = data.decode()
+        return data
+
+    def fetch(self, name, start=0, stop=None):
+        """
+        Sequence of `name` in the 0-based, half-open interval [start, stop).
+        """
+        length, offset, linebases, linewidth = self.index[name]
+        start = max(start, 0)
+        stop = length if stop is None else min(stop, length)
+        if start >= stop:
+            return ""
+        a = offset + start // linebases * linewidth + start % linebases
+        b = offset + (stop - 1) // linebases * linewidth + \
+                     (stop - 1) % linebases + 1
+        data = self.read(a, b)
+        return data.replace("\n", "").replace("\r", "")
+
+    def description(self, name):
+        """
+        Full header line of `name`, found by reading backwards from the first
+        base of the record.
+        """
+        offset = self.index[name][1]
+        chunk = 256
+        while True:
+            start = max(offset - chunk, 0)
+            header = self.read(start, offset).rstrip("\r\n")
+            i = header.rfind("\n>")
+            if i >= 0:
+                return header[i + 2:]
+            if start == 0:
+                return header[1:]
+            chunk *= 2
 
 
 class Fasta (BaseFile, dict):
@@ -34,11 +195,19 @@ class Fasta (BaseFile, dict):
     def __init__(self, filename, index=False, key_function=None, lazy=False):
         super(Fasta, self).__init__(filename)
         self.key_function = key_function
+        self.faidx = None
 
         if lazy:  # do not incur the overhead
             return
 
         if index:
+            # Plain FASTA files are read through .fai byte offsets
+            if key_function is None and FastaIndex.supports(filename):
+                try:
+                    self.faidx = FastaIndex(filename)
+                    return
+                except ValueError as e:
+                    logging.warning("{0}, fall back to SeqIO.index".format(e))
             self.index = SeqIO.index(filename, "fasta",
                     key_function=key_function)
         else:
@@ -53,22 +222,31 @@ class Fasta (BaseFile, dict):
         return self.key_function(key) if self.key_function else key
 
     def __len__(self):
+        if self.faidx is not None:
+            return len(self.faidx)
         return len(self.index)
 
     def __contains__(self, key):
         key = self._key_function(key)
+        if self.faidx is not None:
+            return key in self.faidx
         return key in self.index
 
     def __getitem__(self, key):
         key = self._key_function(key)
+        if self.faidx is not None:
+            return SeqRecord(Seq(self.faidx.fetch(key)), id=key, name=key,
+                             description=self.faidx.description(key))
         rec = self.index[key]
         return rec
 
     def keys(self):
+        if self.faidx is not None:
+            return self.faidx.keys()
         return self.index.keys()
 
     def iterkeys(self):
-        for k in self.index.keys():
+        for k in self.keys():
             yield k
 
     def iteritems(self):
@@ -76,6 +254,10 @@ class Fasta (BaseFile, dict):
             yield k, self[k]
 
     def itersizes(self):
+        if self.faidx is not None:
+            for k, size in self.faidx.itersizes():
+                yield k, size
+            return
         for k in self.iterkeys():
             yield k, len(self[k])
 
@@ -133,6 +315,34 @@ class Fasta (BaseFile, dict):
 
         return seq
 
+    def faidx_subseq(self, name, start=None, stop=None, strand=None):
+        """
+        Same as subseq(), but only reads the requested bases from disk
+        """
+        name = self._key_function(name)
+        size = self.faidx.size(name)
+        start = start - 1 if start is not None else 0
+        stop = stop if stop is not None else size
+
+        if start < 0:
+            msg = "start ({0}) must > 0 of `{1}`. Reset to 1".\
+                        format(start + 1, name)
+            logging.error(msg)
+            start = 0
+
+        if stop > size:
+            msg = "stop ({0}) must be <= length of `{1}` ({2}). Reset to {2}.".\
+                        format(stop, name, size)
+            logging.error(msg)
+            stop = size
+
+        seq = Seq(self.faidx.fetch(name, start, stop))
+
+        if strand in (-1, '-1', '-'):
+            seq = seq.reverse_complement()
+
+        return seq
+
     def sequence(self, f, asstring=True):
         """
         Emulate brentp's pyfasta/fasta.py sequence() methods
@@ -157,10 +367,13 @@ class Fasta (BaseFile, dict):
         assert name in self, "feature: %s not in `%s`" % \
                 (f, self.filename)
 
-        fasta = self[f['chr']]
-
-        seq = Fasta.subseq(fasta,
-                f.get('start'), f.get('stop'), f.get('strand'))
+        if self.faidx is not None:
+            seq = self.faidx_subseq(name,
+                    f.get('start'), f.get('stop'), f.get('strand'))
+        else:
+            fasta = self[f['chr']]
+            seq = Fasta.subseq(fasta,
+                    f.get('start'), f.get('stop'), f.get('strand'))
 
         if asstring:
             return str(seq)
@@ -264,6 +477,82 @@ class ORFFinder (object):
         return orf
 
 
+class SequenceComposition (object):
+    """
+    Base composition of one sequence. The sequence is turned into an uint8
+    array once, all character counts come from a single np.bincount and the
+    window and run statistics from cumulative sums over that array.
+
+    >>> c = SequenceComposition("s", "ACGTNNnacg")
+    >>> c.real, c.nn, c.masked, c.count("GC")
+    (7, 3, 4, 4)
+    >>> list(c.gap_lengths(mingap=2))
+    [3]
+    """
+    def __init__(self, name, seq):
+        if not isinstance(seq, np.ndarray):
+            seq = str(seq).encode()
+            seq = np.frombuffer(seq, dtype=np.uint8)
+        self.name = name
+        self.array = seq
+        self.size = len(seq)
+        self.counts = np.bincount(seq, minlength=256)
+
+    def __len__(self):
+        return self.size
+
+    def count(self, chars, ignore_case=True):
+        if ignore_case:
+            chars = chars.upper() + chars.lower()
+        return int(self.counts[[ord(x) for x in set(chars)]].sum())
+
+    @property
+    def real(self):
+        return self.count("ACGT")
+
+    @property
+    def nn(self):
+        return self.count("N")
+
+    @property
+    def masked(self):
+        return int(self.counts[ord('a'): ord('z') + 1].sum())
+
+    def gap_lengths(self, mingap=1):
+        from jcvi.formats.twobit import runs
+
+        isN = (self.array | 32) == ord('n')
+        starts, sizes = runs(isN)
+        return sizes[sizes >= mingap]
+
+    def gc_windows(self, window, step=None):
+        """
+        Counts of A/T and G/C in windows of `window` bp, every `step` bp, that
+        fall completely within the sequence.
+        """
+        step = step or window
+        upper = self.array & 0xDF
+        isat = (upper == ord('A')) | (upper == ord('T'))
+        isgc = (upper == ord('G')) | (upper == ord('C'))
+        at = np.concatenate(([0], np.cumsum(isat)))
+        gc = np.concatenate(([0], np.cumsum(isgc)))
+        starts = np.arange(0, self.size - window + 1, step)
+        ends = starts + window
+        return at[ends] - at[starts], gc[ends] - gc[starts]
+
+
+def iter_composition(fastafile):
+    """
+    SequenceComposition of each record, read from the memory-mapped .2bit
+    store of the FASTA file.
+    """
+    from jcvi.formats.twobit import get_twobit
+
+    tb = get_twobit(fastafile)
+    for name in tb.keys():
+        yield SequenceComposition(name, tb.array(name))
+
+
 class SequenceInfo (object):
     """
     Emulate output from `sequence_info`:
@@ -290,26 +579,21 @@ class SequenceInfo (object):
         from jcvi.utils.cbook import SummaryStats
         from jcvi.assembly.base import calculate_A50
 
-        f = Fasta(filename)
         self.filename = filename
         self.header = \
         "File|#_seqs|#_reals|#_Ns|Total|Min|Max|N50".split("|")
         if gapstats:
             self.header += ["Gaps"]
-        self.nseqs = len(f)
         sizes = []
         gaps = []
-        na = nc = ng = nt = 0
-        for k, s in f.iteritems():
-            s = str(s.seq).upper()
-            sizes.append(len(s))
-            na += s.count('A')
-            nc += s.count('C')
-            ng += s.count('G')
-            nt += s.count('T')
+        real = 0
+        for c in iter_composition(filename):
+            sizes.append(c.size)
+            real += c.real
             if gapstats:
-                gaps += list(self.iter_gap_len(s))
-        self.real = real = na + nc + ng + nt
+                gaps += list(self.iter_gap_len(c))
+        self.nseqs = len(sizes)
+        self.real = real
         s = SummaryStats(sizes)
         self.sum = s.sum
         if gapstats:
@@ -328,12 +612,10 @@ class SequenceInfo (object):
         assert len(self.header) == len(self.data)
 
     def iter_gap_len(self, seq, mingap=10):
-        for gap, seq in groupby(seq, lambda x: x == 'N'):
-            if not gap:
-                continue
-            gap_len = len(list(seq))
-            if gap_len >= mingap:
-                yield len(list(seq))
+        if not isinstance(seq, SequenceComposition):
+            seq = SequenceComposition(None, seq)
+        for gap_len in seq.gap_lengths(mingap=mingap):
+            yield int(gap_len)
 
 
 def rc(s):
@@ -420,37 +702,28 @@ def simulate(args):
 
 def gc(args):
     """
-    %prog gc fastafile
+    %prog gc fastafile [fastafile ...]
 
     Plot G+C content distribution.
     """
     p = OptionParser(gc.__doc__)
     p.add_option("--binsize", default=500, type="int",
                  help="Bin size to use")
+    p.add_option("--step", type="int",
+                 help="Slide bins by this many bp [default: binsize]")
+    p.set_cpus(cpus=1)
     opts, args = p.parse_args(args)
 
-    if len(args) != 1:
+    if len(args) == 0:
         sys.exit(not p.print_help())
 
-    fastafile, = args
-    binsize = opts.binsize
+    fastafiles = args
+    worker = partial(gc_bins, binsize=opts.binsize, step=opts.step)
     allbins = []
-    for name, seq in parse_fasta(fastafile):
-        for i in range(len(seq) / binsize):
-            atcnt = gccnt = 0
-            for c in seq[i * binsize: (i + 1) * binsize].upper():
-                if c in "AT":
-                    atcnt += 1
-                elif c in "GC":
-                    gccnt += 1
-            totalcnt = atcnt + gccnt
-            if totalcnt == 0:
-                continue
-            gcpct = gccnt * 100 / totalcnt
-            allbins.append(gcpct)
+    for bins in parallel_map(worker, fastafiles, cpus=opts.cpus):
+        allbins.extend(bins)
 
     from jcvi.graphics.base import asciiplot
-    from collections import Counter
 
     title = "Total number of bins={}".format(len(allbins))
     c = Counter(allbins)
@@ -458,6 +731,19 @@ def gc(args):
     asciiplot(x, y, title=title)
 
 
+def gc_bins(fastafile, binsize=500, step=None):
+    """
+    Integer G+C percentages of all bins with at least one A/C/G/T base.
+    """
+    allbins = []
+    for c in iter_composition(fastafile):
+        at, gc = c.gc_windows(binsize, step=step)
+        total = at + gc
+        keep = total > 0
+        allbins.extend((gc[keep] * 100 // total[keep]).tolist())
+    return allbins
+
+
 def trimsplit(args):
     """
     %prog trimsplit fastafile
@@ -553,6 +839,7 @@ def info(args):
     p.add_option("--gaps", default=False, action="store_true",
                  help="Count number of gaps [default: %default]")
     p.set_table()
+    p.set_cpus(cpus=1)
     p.set_outfile()
     opts, args = p.parse_args(args)
 
@@ -560,11 +847,10 @@ def info(args):
         sys.exit(not p.print_help())
 
     fastafiles = args
-    data = []
-    for f in fastafiles:
-        s = SequenceInfo(f, gapstats=opts.gaps)
-        data.append(s.data)
-    write_csv(s.header, data, sep=opts.sep,
+    infos = parallel_map(partial(SequenceInfo, gapstats=opts.gaps),
+                         fastafiles, cpus=opts.cpus)
+    data = [s.data for s in infos]
+    write_csv(infos[0].header, data, sep=opts.sep,
               filename=opts.outfile, align=opts.align)
 
 
@@ -808,6 +1094,7 @@ def translate(args):
     p.add_option("--table", default=1, choices=transl_tables,
             help="Specify translation table to use [default: %default]")
     p.set_outfile()
+    p.set_cpus(cpus=1)
 
     opts, args = p.parse_args(args)
 
@@ -818,7 +1105,6 @@ def translate(args):
     if opts.longest:
         cdsfasta = longestorf([cdsfasta])
 
-    f = Fasta(cdsfasta, lazy=True)
     outfile = opts.outfile
     fw = must_open(outfile, "w")
 
@@ -828,27 +1114,68 @@ def translate(args):
     else:
         ids = None
 
-    five_prime_missing = three_prime_missing = 0
-    contain_ns = complete = cannot_translate = total = 0
+    counts = Counter()
+    worker = partial(translate_chunk, table=opts.table)
+    chunks = iter_record_chunks(cdsfasta)
+    for text, labels, c in pipeline_map(worker, chunks, cpus=opts.cpus):
+        fw.write(text)
+        if ids:
+            for name, label in labels:
+                print("\t".join((name, label)), file=ids)
+        counts.update(c)
 
-    for name, rec in f.iteritems_ordered():
+    total = counts["total"]
+    complete = counts["complete"]
+    five_prime_missing = counts["five_prime_missing"]
+    three_prime_missing = counts["three_prime_missing"]
+    contain_ns = counts["contain_ns"]
+    cannot_translate = counts["cannot_translate"]
+
+    print("Complete gene models: {0}".\
+                        format(percentage(complete, total)), file=sys.stderr)
+    print("Missing 5`-end: {0}".\
+                        format(percentage(five_prime_missing, total)), file=sys.stderr)
+    print("Missing 3`-end: {0}".\
+                        format(percentage(three_prime_missing, total)), file=sys.stderr)
+    print("Contain Ns: {0}".\
+                        format(percentage(contain_ns, total)), file=sys.stderr)
+
+    if cannot_translate:
+        print("Cannot translate: {0}".\
+                        format(percentage(cannot_translate, total)), file=sys.stderr)
+
+    fw.close()
+
+    return cdsfasta, outfile
+
+
+def translate_chunk(item, table=1):
+    """
+    Translate one chunk from iter_record_chunks(), for `translate`. Returns
+    the protein FASTA text, the (name, labels) pairs and the label counts.
+    """
+    start, n, chunk = item
+    fw = StringIO()
+    labelled = []
+    counts = Counter()
+    for rec in iter_chunk_records(chunk):
+        name = rec.name
         cds = rec.seq
         cdslen = len(cds)
-        peplen = cdslen / 3
-        total += 1
+        peplen = cdslen // 3
+        counts["total"] += 1
 
         # Try all three frames
         pep = ""
         for i in xrange(3):
             newcds = cds[i: i + peplen * 3]
-            newpep = newcds.translate(table=opts.table)
+            newpep = newcds.translate(table=table)
             if len(newpep.split("*")[0]) > len(pep.split("*")[0]):
                 pep = newpep
 
         labels = []
         if "*" in pep.rstrip("*"):
             logging.error("{0} cannot translate".format(name))
-            cannot_translate += 1
             labels.append("cannot_translate")
 
         contains_start = pep.startswith("M")
@@ -858,45 +1185,25 @@ def translate(args):
         end_ns = pep.endswith("X")
 
         if not contains_start:
-            five_prime_missing += 1
             labels.append("five_prime_missing")
         if not contains_stop:
-            three_prime_missing += 1
             labels.append("three_prime_missing")
         if contains_ns:
-            contain_ns += 1
             labels.append("contain_ns")
         if contains_start and contains_stop:
-            complete += 1
             labels.append("complete")
         if start_ns:
             labels.append("start_ns")
         if end_ns:
             labels.append("end_ns")
 
-        if ids:
-            print("\t".join((name, ",".join(labels))), file=ids)
+        counts.update(labels)
+        labelled.append((name, ",".join(labels)))
 
         peprec = SeqRecord(pep, id=name, description=rec.description)
         SeqIO.write([peprec], fw, "fasta")
-        fw.flush()
-
-    print("Complete gene models: {0}".\
-                        format(percentage(complete, total)), file=sys.stderr)
-    print("Missing 5`-end: {0}".\
-                        format(percentage(five_prime_missing, total)), file=sys.stderr)
-    print("Missing 3`-end: {0}".\
-                        format(percentage(three_prime_missing, total)), file=sys.stderr)
-    print("Contain Ns: {0}".\
-                        format(percentage(contain_ns, total)), file=sys.stderr)
 
-    if cannot_translate:
-        print("Cannot translate: {0}".\
-                        format(percentage(cannot_translate, total)), file=sys.stderr)
-
-    fw.close()
-
-    return cdsfasta, outfile
+    return fw.getvalue(), labelled, counts
 
 
 def filter(args):
@@ -1118,6 +1425,13 @@ def join(args):
     return joinedfastafile
 
 
+def summary_counts(fastafile):
+    """
+    Name, number of N's and length of each record.
+    """
+    return [(c.name, c.nn, c.size) for c in iter_composition(fastafile)]
+
+
 def summary(args):
     """
     %prog summary *.fasta
@@ -1131,6 +1445,7 @@ def summary(args):
             help="make the base pair counts human readable [default: %default]")
     p.add_option("--ids",
             help="write the ids that have >= 50% N's [default: %default]")
+    p.set_cpus(cpus=1)
     p.set_outfile()
 
     opts, args = p.parse_args(args)
@@ -1145,18 +1460,16 @@ def summary(args):
         nids = 0
 
     data = []
-    for fastafile in args:
-        for rec in SeqIO.parse(fastafile, "fasta"):
-            seqlen = len(rec)
-            nns = rec.seq.count('n') + rec.seq.count('N')
+    for counts in parallel_map(summary_counts, args, cpus=opts.cpus):
+        for name, nns, seqlen in counts:
             reals = seqlen - nns
             pct = reals * 100. / seqlen
             pctreal = "{0:.1f}%".format(pct)
             if idsfile and pct < 50:
                 nids += 1
-                print(rec.id, file=idsfile)
+                print(name, file=idsfile)
 
-            data.append((rec.id, reals, nns, seqlen, pctreal))
+            data.append((name, reals, nns, seqlen, pctreal))
 
     data.sort(key=natsort_key)
     ids, reals, nns, seqlen, pctreal = zip(*data)
@@ -1211,89 +1524,103 @@ def format(args):
             help="Convert sequence to upper case [default: %default]")
     p.add_option("--nodesc", default=False, action="store_true",
             help="Remove description after identifier")
+    p.set_cpus(cpus=1)
     opts, args = p.parse_args(args)
 
     if len(args) != 2:
         sys.exit(not p.print_help())
 
     infasta, outfasta = args
-    gb = opts.gb
-    pairs = opts.pairs
-    prefix = opts.prefix
-    suffix = opts.suffix
-    noversion = opts.noversion
-    sequential = opts.sequential
-    sequentialoffset = opts.sequentialoffset
-    sep = opts.sep
-    idx = opts.index
     mapfile = opts.switch
     annotfile = opts.annotation
-    desc = not opts.nodesc
     idsfile = opts.ids
     idsfile = open(idsfile, "w") if idsfile else None
-    upper = opts.upper
 
-    if mapfile:
-        mapping = DictFile(mapfile, delimiter="\t")
-    if annotfile:
-        annotation = DictFile(annotfile, delimiter="\t")
+    mapping = DictFile(mapfile, delimiter="\t") if mapfile else None
+    annotation = DictFile(annotfile, delimiter="\t") if annotfile else None
 
-    fp = SeqIO.parse(must_open(infasta), "fasta")
     fw = must_open(outfasta, "w")
-    for i, rec in enumerate(fp):
+    worker = partial(format_chunk, opts=opts, mapping=mapping,
+                     annotation=annotation)
+    chunks = iter_record_chunks(infasta)
+    for text, ids in pipeline_map(worker, chunks, cpus=opts.cpus):
+        fw.write(text)
+        if idsfile:
+            for origid, newid in ids:
+                print("\t".join((origid, newid)), file=idsfile)
+    fw.close()
+
+    if idsfile:
+        logging.debug("Conversion table written to `{0}`.".\
+                      format(idsfile.name))
+        idsfile.close()
+
+
+def format_chunk(item, opts, mapping=None, annotation=None):
+    """
+    Reformat one chunk from iter_record_chunks(), for `format`. Record
+    index and sequential IDs are global, so that chunks can be processed in
+    any process. Returns the FASTA text and the (old, new) ID pairs.
+    """
+    start, n, chunk = item
+    sequential = opts.sequential
+    sep = opts.sep
+    idx = opts.index
+    prefix = opts.prefix
+    suffix = opts.suffix
+    desc = not opts.nodesc
+
+    fw = StringIO()
+    ids = []
+    for i, rec in enumerate(iter_chunk_records(chunk), start):
         origid = rec.id
         description = rec.description.replace(origid, "").strip()
         if sep:
             rec.id = rec.description.split(sep)[idx].strip()
-        if gb:
+        if opts.gb:
             # gi|262233616|gb|GU123895.1| Coffea arabica clone BAC
             atoms = rec.id.split("|")
             if len(atoms) >= 3:
                 rec.id = atoms[3]
             elif len(atoms) == 2:
                 rec.id = atoms[1]
-        if pairs:
+        if opts.pairs:
             id = "/1" if (i % 2 == 0) else "/2"
             rec.id += id
-        if noversion:
+        if opts.noversion:
             rec.id = rec.id.rsplit(".", 1)[0]
         if sequential:
-            rec.id = "{0:0{1}d}".format(sequentialoffset, opts.pad0)
+            rec.id = "{0:0{1}d}".format(opts.sequentialoffset + i, opts.pad0)
             if sequential == "prefix":
                 rec.id = "{0}-{1}".format(rec.id, origid)
             elif sequential == "suffix":
                 rec.id = "{0}-{1}".format(origid, rec.id)
-            sequentialoffset += 1
         if opts.template:
             template, dir, lib = [x.split("=")[-1] for x in
                     rec.description.split()[1:4]]
             rec.id = "{0}-{1}/{2}".format(lib, template, dir)
-        if mapfile:
+        if mapping is not None:
             if origid in mapping:
                 rec.id = mapping[origid]
             else:
                 logging.error("{0} not found in `{1}`. ID unchanged.".\
-                        format(origid, mapfile))
+                        format(origid, opts.switch))
         if prefix:
             rec.id = prefix + rec.id
         if suffix:
             rec.id += suffix
-        if annotfile:
-            rec.description = annotation.get(origid, "") if not mapfile \
+        if annotation is not None:
+            rec.description = annotation.get(origid, "") if mapping is None \
                     else annotation.get(rec.id, "")
         else:
             rec.description = description if desc else ""
-        if idsfile:
-            print("\t".join((origid, rec.id)), file=idsfile)
-        if upper:
+        ids.append((origid, rec.id))
+        if opts.upper:
             rec.seq = rec.seq.upper()
 
         SeqIO.write(rec, fw, "fasta")
 
-    if idsfile:
-        logging.debug("Conversion table written to `{0}`.".\
-                      format(idsfile.name))
-        idsfile.close()
+    return fw.getvalue(), ids
 
 
 def print_first_difference(arec, brec, ignore_case=False, ignore_N=False,
@@ -1591,25 +1918,27 @@ def some(args):
     qualfile = get_qual(fastafile)
 
     names = set(x.strip() for x in open(listfile))
+
+    def selected(name):
+        if opts.uniprot:
+            name = name.split("|")[-1]
+        return (name in names) != opts.exclude
+
     if qualfile:
         outqualfile = outfastafile + ".qual"
         outqualhandle = open(outqualfile, "w")
         parser = iter_fasta_qual(fastafile, qualfile)
+    elif FastaIndex.supports(fastafile):
+        # Only read the selected records, in file order
+        f = Fasta(fastafile, index=True)
+        parser = (f[x] for x in f.keys() if selected(x))
     else:
         parser = SeqIO.parse(fastafile, "fasta")
 
     num_records = 0
     for rec in parser:
-        name = rec.id
-        if opts.uniprot:
-            name = name.split("|")[-1]
-
-        if opts.exclude:
-            if name in names:
-                continue
-        else:
-            if name not in names:
-                continue
+        if not selected(rec.id):
+            continue
 
         SeqIO.write([rec], outfastahandle, "fasta")
         if qualfile:
@@ -1836,7 +2165,7 @@ def extract(args):
 
     if opts.bed:
         fw = must_open(opts.outfile, "w")
-        f = Fasta(fastafile)
+        f = Fasta(fastafile, index=True)
         for accn in bedaccns:
             try:
                 rec = f[accn]
@@ -1903,7 +2232,7 @@ def extract(args):
             rec = SeqRecord(seq, id=newid, description=k)
             SeqIO.write([rec], fw, "fasta")
     else:
-        f = Fasta(fastafile)
+        f = Fasta(fastafile, index=True)
         try:
             seq = f.sequence(feature, asstring=False)
         except AssertionError as e:
@@ -2217,6 +2546,7 @@ def tidy(args):
             help="Set all gaps to the same size [default: %default]")
     p.add_option("--minlen", dest="minlen", default=100, type="int",
             help="Minimum component size [default: %default]")
+    p.set_cpus(cpus=1)
 
     opts, args = p.parse_args(args)
 
@@ -2231,19 +2561,12 @@ def tidy(args):
     fw = must_open(tidyfastafile, "w")
 
     removed = normalized = 0
-    fasta = Fasta(fastafile, lazy=True)
-    for name, rec in fasta.iteritems_ordered():
-        rec.seq = rec.seq.upper()
-        if minlen:
-            removed += remove_small_components(rec, minlen)
-        trim_terminal_Ns(rec)
-        if gapsize:
-            normalized += normalize_gaps(rec, gapsize)
-
-        if len(rec) == 0:
-            logging.debug("Drop seq {0}".format(rec.id))
-            continue
-        SeqIO.write([rec], fw, "fasta")
+    worker = partial(tidy_chunk, gapsize=gapsize, minlen=minlen)
+    chunks = iter_record_chunks(fastafile)
+    for text, r, g in pipeline_map(worker, chunks, cpus=opts.cpus):
+        fw.write(text)
+        removed += r
+        normalized += g
 
     # Print statistics
     if removed:
@@ -2257,33 +2580,43 @@ def tidy(args):
     return tidyfastafile
 
 
-def write_gaps_worker(rec):
-    start = 0
-    seq = rec.seq.upper()
-    output = []
-    for gap, seq in groupby(seq, lambda x: x == 'N'):
-        seq = "".join(seq)
-        current_length = len(seq)
-        object_beg = start + 1
-        object_end = start + current_length
-        if gap:
-            s = "\t".join(str(x) for x in (rec.id,
-                object_beg - 1, object_end))
-            output.append(s)
-        start += current_length
+def tidy_chunk(item, gapsize=0, minlen=100):
+    """
+    Tidy one chunk from iter_record_chunks(), for `tidy`. Returns the FASTA
+    text, bases removed and gaps normalized.
+    """
+    start, n, chunk = item
+    fw = StringIO()
+    removed = normalized = 0
+    for rec in iter_chunk_records(chunk):
+        rec.seq = rec.seq.upper()
+        if minlen:
+            removed += remove_small_components(rec, minlen)
+        trim_terminal_Ns(rec)
+        if gapsize:
+            normalized += normalize_gaps(rec, gapsize)
 
-    return "\n".join(output)
+        if len(rec) == 0:
+            logging.debug("Drop seq {0}".format(rec.id))
+            continue
+        SeqIO.write([rec], fw, "fasta")
+
+    return fw.getvalue(), removed, normalized
 
 
-def write_gaps_bed(inputfasta, prefix, mingap, cpus):
-    from jcvi.apps.grid import WriteJobs
+def write_gaps_bed(inputfasta, prefix, mingap):
     from jcvi.formats.bed import sort
+    from jcvi.formats.twobit import get_twobit
 
     bedfile = prefix + ".gaps.bed"
-    f = Fasta(inputfasta)
-    recs = list(rec for k, rec in f.iteritems())
-    pool = WriteJobs(write_gaps_worker, recs, bedfile, cpus=cpus)
-    pool.run()
+    tb = get_twobit(inputfasta)
+    fw = open(bedfile, "w")
+    for name in tb.keys():
+        starts, sizes = tb.nruns(name)
+        for start, size in zip(starts, sizes):
+            print("\t".join(str(x) for x in (name, start, start + size)),
+                  file=fw)
+    fw.close()
 
     sort([bedfile, "-i"])
 
@@ -2317,7 +2650,6 @@ def gaps(args):
     p.add_option("--split", default=False, action="store_true",
             help="Generate .split.fasta [default: %default]")
     p.set_mingap(default=100)
-    p.set_cpus()
     opts, args = p.parse_args(args)
 
     if len(args) != 1:
@@ -2330,7 +2662,7 @@ def gaps(args):
     bedfile = prefix + ".gaps.bed"
 
     if need_update(inputfasta, bedfile):
-        write_gaps_bed(inputfasta, prefix, mingap, opts.cpus)
+        write_gaps_bed(inputfasta, prefix, mingap)
 
     if split:
         splitfile = prefix + ".split.fasta"
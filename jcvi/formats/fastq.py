@@ -11,17 +11,24 @@ import sys
 import re
 import logging
 import json
+import zlib
 
-from itertools import islice
+import numpy as np
+
+from itertools import chain, islice, repeat
+from functools import partial
+from six import StringIO
+from six.moves import zip
 
 from Bio import SeqIO
 from Bio.SeqIO.QualityIO import FastqGeneralIterator
 
 from jcvi.formats.fasta import must_open, rc
-from jcvi.formats.base import DictFile
+from jcvi.formats.base import DictFile, iter_record_chunks
 from jcvi.utils.cbook import percentage
 from jcvi.apps.base import OptionParser, ActionDispatcher, sh, \
         which, mkdir, need_update
+from jcvi.apps.grid import pipeline_map
 
 
 qual_offset = lambda x: 33 if x == "sanger" else 64
@@ -46,19 +53,20 @@ class FastqLite (object):
 
 
 class FastqRecord (object):
-    def __init__(self, fh, offset=0, key=None):
-        self.name = self.header = fh.readline()
-        if not self.name:
-            return
-        self.name = self.name.split()[0]
-        self.seq = fh.readline().rstrip()
-        self.l3 = fh.readline().rstrip()
-        self.qual = fh.readline().rstrip()
-        if offset != 0:
-            self.qual = "".join(chr(ord(x) + offset) for x in self.qual)
-        self.length = len(self.seq)
-        assert self.length == len(self.qual), \
-                "length mismatch: seq(%s) and qual(%s)" % (self.seq, self.qual)
+    """
+    View of one read parsed by iter_fastq(). `header` is the full title line,
+    `name` its first word (after `key`, if given).
+    """
+    __slots__ = ("header", "name", "seq", "qual", "length")
+
+    def __init__(self, header, seq, qual, key=None):
+        self.header = header
+        self.name = header.split()[0] if header.strip() else header
+        self.seq = seq
+        self.qual = qual
+        self.length = len(seq)
+        assert self.length == len(qual), \
+                "length mismatch: seq(%s) and qual(%s)" % (seq, qual)
         if key:
             self.name = key(self.name)
 
@@ -70,7 +78,7 @@ class FastqRecord (object):
 
     @property
     def quality(self):
-        return [ord(x) for x in self.qual]
+        return decode_qualities([self.qual])
 
 
 class FastqHeader(object):
@@ -194,19 +202,117 @@ def pairspf(pp, commonprefix=True):
     return pf
 
 
-def iter_fastq(filename, offset=0, key=None):
+def _to_bytes(s):
+    return s if isinstance(s, bytes) else s.encode("latin-1")
+
+
+def _to_str(s):
+    return s if isinstance(s, str) else s.decode("latin-1")
+
+
+def decode_qualities(quals):
+    """
+    Character codes of the concatenated quality strings as one uint8 array.
+    """
+    return np.frombuffer(_to_bytes("".join(quals)), dtype=np.uint8)
+
+
+def shift_qualities(quals, offset):
+    """
+    Add `offset` to every quality character, in one pass over all strings.
+    Results are clipped to the printable range.
+
+    >>> shift_qualities(["hh", "B"], -31)
+    ['II', '#']
+    """
+    buf = np.frombuffer(_to_bytes("\n".join(quals)), dtype=np.uint8)
+    buf = buf.astype(np.int16)
+    isqual = buf != ord("\n")
+    buf[isqual] = np.clip(buf[isqual] + offset, 33, 126)
+    return _to_str(buf.astype(np.uint8).tostring()).split("\n")
+
+
+def high_qv(quals, qvchar, pct=90):
+    """
+    Boolean array, whether at least `pct` percent of each quality string is
+    >= qvchar.
+    """
+    lengths = np.array([len(x) for x in quals], dtype=int)
+    ishigh = decode_qualities(quals) >= ord(qvchar)
+    cumhigh = np.concatenate(([0], np.cumsum(ishigh)))
+    ends = np.cumsum(lengths)
+    highs = cumhigh[ends] - cumhigh[ends - lengths]
+    return highs >= lengths * pct / 100
+
+
+def iter_blocks(filename, blocksize=1 << 22):
+    """
+    Read a file in blocks of about `blocksize`. Gzipped files are
+    decompressed in-process with zlib, including multi-member files.
+    """
+    gz = False
     if isinstance(filename, str):
         logging.debug("Read file `{0}`".format(filename))
-        fh = must_open(filename)
+        gz = filename.endswith(".gz")
+        fh = open(filename, "rb") if gz else must_open(filename)
     else:
         fh = filename
 
+    if not gz:
+        while True:
+            block = fh.read(blocksize)
+            if not block:
+                break
+            yield block
+        return
+
+    wbits = 16 + zlib.MAX_WBITS
+    d = zlib.decompressobj(wbits)
     while True:
-        rec = FastqRecord(fh, offset=offset, key=key)
-        if not rec.name:
+        data = fh.read(blocksize)
+        if not data:
             break
+        while data:
+            block = d.decompress(data)
+            if block:
+                yield block
+            data = d.unused_data
+            if data:  # Next gzip member
+                d = zlib.decompressobj(wbits)
+    block = d.flush()
+    if block:
+        yield block
+    fh.close()
+
+
+def iter_fastq(filename, offset=0, key=None, blocksize=1 << 22):
+    """
+    Parse FASTQ records from file name or handle, a block at a time. Quality
+    offset conversion is done on the whole block.
+    """
+    carry = ""
+    for block in iter_blocks(filename, blocksize=blocksize):
+        block = carry + _to_str(block)
+        if "\r" in block:
+            block = block.replace("\r", "")
+        lines = block.split("\n")
+        n = (len(lines) - 1) // 4 * 4
+        carry = "\n".join(lines[n:])
+        for rec in _parse_fastq_lines(lines[:n], offset=offset, key=key):
+            yield rec
+
+    lines = carry.rstrip("\n").split("\n") if carry.strip() else []
+    assert len(lines) % 4 == 0, "Truncated FASTQ record: {0}".format(lines[0])
+    for rec in _parse_fastq_lines(lines, offset=offset, key=key):
         yield rec
-    yield None  # sentinel
+
+
+def _parse_fastq_lines(lines, offset=0, key=None):
+    quals = lines[3::4]
+    if offset != 0 and quals:
+        quals = shift_qualities(quals, offset)
+    for header, seq, qual in zip(lines[0::4], lines[1::4], quals):
+        yield FastqRecord(header, seq, qual, key=key)
 
 
 def main():
@@ -222,7 +328,7 @@ def main():
         ('first', 'get first N reads from file'),
         ('filter', 'filter to get high qv reads'),
         ('suffix', 'filter reads based on suffix'),
-        ('trim', 'trim reads using fastx_trimmer'),
+        ('trim', 'trim from begin or end of reads'),
         ('some', 'select a subset of fastq reads'),
         ('guessoffset', 'guess the quality offset of the fastq records'),
         ('readlen', 'calculate read length'),
@@ -255,8 +361,6 @@ def uniq(args):
     seen = set()
     for rec in iter_fastq(fastqfile):
         nreads += 1
-        if rec is None:
-            break
         name = rec.name
         if name in seen:
             nduplicates += 1
@@ -285,8 +389,6 @@ def suffix(args):
     nreads = nselected = 0
     for rec in iter_fastq(fastqfile):
         nreads += 1
-        if rec is None:
-            break
         if rec.seq.endswith(sf):
             print(rec, file=fw)
             nselected += 1
@@ -297,14 +399,7 @@ def suffix(args):
 def calc_readlen(f, first):
     from jcvi.utils.cbook import SummaryStats
 
-    L = []
-    ai = iter_fastq(f)
-    rec = next(ai)
-    while rec:
-        L.append(rec.length)
-        if len(L) > first:
-            break
-        rec = next(ai)
+    L = [rec.length for rec in islice(iter_fastq(f), first + 1)]
     s = SummaryStats(L)
 
     return s
@@ -356,6 +451,7 @@ def fasta(args):
                  help="Use seqtk to convert")
     p.set_outdir()
     p.set_outfile(outfile=None)
+    p.set_cpus(cpus=1)
     opts, args = p.parse_args(args)
 
     if len(args) < 1:
@@ -390,13 +486,30 @@ def fasta(args):
             logging.debug("Outfile `{0}` already exists.".format(outfile))
         return outfile, None
 
+    fw = open(fastafile, "w")
+    fwq = open(qualfile, "w")
     for fastqfile in fastqfiles:
-        SeqIO.convert(fastqfile, "fastq", fastafile, "fasta")
-        SeqIO.convert(fastqfile, "fastq", qualfile, "qual")
+        chunks = iter_record_chunks(fastqfile, format="fastq")
+        for fa, qual in pipeline_map(fasta_chunk, chunks, cpus=opts.cpus):
+            fw.write(fa)
+            fwq.write(qual)
+    fw.close()
+    fwq.close()
 
     return fastafile, qualfile
 
 
+def fasta_chunk(item):
+    """
+    Convert one chunk from iter_record_chunks() to FASTA and QUAL text.
+    """
+    start, n, chunk = item
+    fw, fwq = StringIO(), StringIO()
+    SeqIO.convert(StringIO(chunk), "fastq", fw, "fasta")
+    SeqIO.convert(StringIO(chunk), "fastq", fwq, "qual")
+    return fw.getvalue(), fwq.getvalue()
+
+
 def first(args):
     """
     %prog first N fastqfile(s)
@@ -442,9 +555,7 @@ def FastqPairedIterator(read1, read2):
 
 
 def isHighQv(qs, qvchar, pct=90):
-    cutoff = len(qs) * pct / 100
-    highs = sum(1 for x in qs if x >= qvchar)
-    return highs >= cutoff
+    return bool(high_qv([qs], qvchar, pct=pct)[0])
 
 
 def filter(args):
@@ -460,6 +571,7 @@ def filter(args):
     p.add_option("-p", dest="pct", default=95, type="int",
                  help="Minimum percent of bases that have [-q] quality "\
                  "[default: %default]")
+    p.set_cpus(cpus=1)
 
     opts, args = p.parse_args(args)
 
@@ -480,19 +592,52 @@ def filter(args):
     outfile = r1.rsplit(".", 1)[0] + ".q{0}.paired.fastq".format(qv)
     fw = open(outfile, "w")
 
-    p1fp, p2fp = FastqPairedIterator(r1, r2)
-    while True:
-        a = list(islice(p1fp, 4))
-        if not a:
-            break
+    if r1 == r2:
+        chunks = iter_record_chunks(r1, format="fastq", group=2)
+    else:
+        chunks = iter_paired_chunks(r1, r2)
+    worker = partial(filter_chunk, qvchar=qvchar, pct=pct)
+    for text in pipeline_map(worker, chunks, cpus=opts.cpus):
+        fw.write(text)
+    fw.close()
 
-        b = list(islice(p2fp, 4))
-        q1 = a[-1].rstrip()
-        q2 = b[-1].rstrip()
 
-        if isHighQv(q1, qvchar, pct=pct) and isHighQv(q2, qvchar, pct=pct):
-            fw.writelines(a)
-            fw.writelines(b)
+def iter_paired_chunks(read1, read2):
+    """
+    Chunk two paired FASTQ files in step, yielding (index, n, (chunk1, chunk2)).
+    """
+    p2fp = must_open(read2)
+    for index, n, chunk in iter_record_chunks(read1, format="fastq"):
+        yield index, n, (chunk, "".join(islice(p2fp, 4 * n)))
+
+
+def filter_chunk(item, qvchar, pct=90):
+    """
+    Keep the pairs in one chunk where both reads pass isHighQv(). The chunk
+    is either interleaved text or a tuple from iter_paired_chunks().
+    """
+    start, n, chunk = item
+    if isinstance(chunk, tuple):
+        lines1, lines2 = [x.splitlines(True) for x in chunk]
+        step = 4
+    else:
+        lines1 = lines2 = chunk.splitlines(True)
+        step = 8
+
+    q1 = [x.rstrip() for x in lines1[3::step]]
+    q2 = [x.rstrip() for x in lines2[step - 1::step]]
+    npairs = min(len(q1), len(q2))
+    keep = high_qv(q1[:npairs], qvchar, pct=pct) & \
+           high_qv(q2[:npairs], qvchar, pct=pct)
+
+    out = []
+    for k in np.flatnonzero(keep):
+        i = k * step
+        j = i + step - 4
+        out.extend(lines1[i: i + 4])
+        out.extend(lines2[j: j + 4])
+
+    return "".join(out)
 
 
 def checkShuffleSizes(p1, p2, pairsfastq, extra=0):
@@ -624,20 +769,17 @@ def guessoffset(args):
         sys.exit(not p.print_help())
 
     fastqfile, = args
-    ai = iter_fastq(fastqfile)
-    rec = next(ai)
     offset = 64
-    while rec:
+    for rec in iter_fastq(fastqfile):
         quality = rec.quality
-        lowcounts = len([x for x in quality if x < 59])
-        highcounts = len([x for x in quality if x > 74])
+        lowcounts = np.count_nonzero(quality < 59)
+        highcounts = np.count_nonzero(quality > 74)
         diff = highcounts - lowcounts
         if diff > 10:
             break
         elif diff < -10:
             offset = 33
             break
-        rec = next(ai)
 
     if offset == 33:
         print("Sanger encoding (offset=33)", file=sys.stderr)
@@ -666,10 +808,8 @@ def format(args):
         sys.exit(not p.print_help())
 
     fastqfile, = args
-    ai = iter_fastq(fastqfile)
-    rec = next(ai)
     dialect = None
-    while rec:
+    for rec in iter_fastq(fastqfile):
         h = FastqHeader(rec.header)
         if not dialect:
             dialect = h.dialect
@@ -680,7 +820,6 @@ def format(args):
         rec.name = h.format_header(dialect=opts.convert, tag=opts.tag)
 
         print(rec)
-        rec = next(ai)
 
 
 def some(args):
@@ -701,28 +840,20 @@ def some(args):
 
     ids = DictFile(idsfile, valuepos=None)
 
-    ai = iter_fastq(open(afastq))
-    arec = next(ai)
-    if bfastq:
-        bi = iter_fastq(open(bfastq))
-        brec = next(bi)
-
-    while arec:
+    ai = iter_fastq(afastq)
+    bi = iter_fastq(bfastq) if bfastq else repeat(None)
+    for arec, brec in zip(ai, bi):
         if arec.name[1:] in ids:
             print(arec)
             if bfastq:
                 print(brec)
 
-        arec = next(ai)
-        if bfastq:
-            brec = next(bi)
-
 
 def trim(args):
     """
     %prog trim fastqfile
 
-    Wraps `fastx_trimmer` to trim from begin or end of reads.
+    Trim from begin or end of reads, as `fastx_trimmer`.
     """
     p = OptionParser(trim.__doc__)
     p.add_option("-f", dest="first", default=0, type="int",
@@ -740,13 +871,15 @@ def trim(args):
     if fastqfile.endswith(".gz"):
         fq = obfastqfile.rsplit(".", 2)[0] + ".ntrimmed.fastq.gz"
 
-    cmd = "fastx_trimmer -Q33 "
-    if opts.first:
-        cmd += "-f {0.first} ".format(opts)
-    if opts.last:
-        cmd += "-l {0.last} ".format(opts)
-
-    sh(cmd, infile=fastqfile, outfile=fq)
+    start = max(opts.first - 1, 0)
+    end = opts.last or None
+    fw = must_open(fq, "w")
+    for rec in iter_fastq(fastqfile):
+        seq, qual = rec.seq[start: end], rec.qual[start: end]
+        if not seq:
+            continue
+        print("\n".join((rec.header, seq, "+", qual)), file=fw)
+    fw.close()
 
 
 def catread(args):
@@ -839,8 +972,6 @@ def size(args):
     for f in args:
         cur_size = cur_numrecords = 0
         for rec in iter_fastq(f):
-            if not rec:
-                break
             cur_numrecords += 1
             cur_size += len(rec)
 
@@ -880,19 +1011,11 @@ def convert(args):
     if gz:
         outfastq += ".gz"
 
-    fin = "illumina" if phred == "64" else "sanger"
-    fout = "sanger" if phred == "64" else "illumina"
-
-    seqret = "seqret"
-    if infastq.endswith(".gz"):
-        cmd = "zcat {0} | ".format(infastq)
-        cmd += seqret + " fastq-{0}::stdin fastq-{1}::stdout".\
-                format(fin, fout)
-    else:
-        cmd = seqret + " fastq-{0}::{1} fastq-{2}::stdout".\
-                format(fin, infastq, fout)
-
-    sh(cmd, outfile=outfastq)
+    offset = int(ophred) - int(phred)
+    fw = must_open(outfastq, "w")
+    for rec in iter_fastq(infastq, offset=offset):
+        print("\n".join((rec.header, rec.seq, "+", rec.qual)), file=fw)
+    fw.close()
 
     return outfastq
 
@@ -933,7 +1056,7 @@ def pairinplace(args):
     tag = opts.tag
     strip_name = (lambda x: x[:-N]) if N else None
 
-    fh_iter = iter_fastq(fastqfile, key=strip_name)
+    fh_iter = chain(iter_fastq(fastqfile, key=strip_name), [None])
     skipflag = False  # controls the iterator skip
     for a, b in pairwise(fh_iter):
         if b is None:  # hit the eof
@@ -2747,7 +2747,7 @@ def load(args):
 
     import gffutils
     g = make_index(gff_file)
-    f = Fasta(fasta_file, index=False)
+    f = Fasta(fasta_file, index=True)
     seqlen = {}
     for seqid, size in f.itersizes():
         seqlen[seqid] = size
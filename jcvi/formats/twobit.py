@@ -0,0 +1,450 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Packed genome store in UCSC .2bit format. Bases are stored at 2 bits each,
+N runs and soft-masked (lower case) runs as block lists, so the file can be
+memory-mapped and any region decoded into a NumPy uint8 array without
+parsing FASTA.
+
+Format: <http://genome.ucsc.edu/FAQ/FAQformat.html#format7>
+
+Ambiguity codes other than N are covered by the N blocks, as in UCSC, and
+the actual characters are kept in an extension after the last record, so
+that the FASTA is restored exactly. UCSC tools ignore the extension since
+they only read records through the index.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import logging
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+
+from Bio import SeqIO
+
+from jcvi.formats.base import BaseFile, must_open
+from jcvi.apps.base import OptionParser, ActionDispatcher, need_update
+
+
+TWOBIT_MAGIC = 0x1A412743
+IUPAC_SIGNATURE = b"JCVIIUPC"
+BASES = np.frombuffer(b"TCAGN", dtype=np.uint8)  # Code 0-3, plus 4 for N
+SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+
+ENCODE = np.zeros(256, dtype=np.uint8)
+ISACGT = np.zeros(256, dtype=bool)
+for i, b in enumerate("TCAG"):
+    for c in (b, b.lower()):
+        ENCODE[ord(c)] = i
+        ISACGT[ord(c)] = True
+ISN = np.zeros(256, dtype=bool)
+ISN[[ord('N'), ord('n')]] = True
+ISLOWER = np.zeros(256, dtype=bool)
+ISLOWER[ord('a'): ord('z') + 1] = True
+
+
+def runs(mask):
+    """
+    Starts and sizes of the runs of True in a boolean array.
+
+    >>> runs(np.array([1, 1, 0, 0, 1, 0], dtype=bool))
+    (array([0, 4]), array([2, 1]))
+    """
+    d = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts, = np.nonzero(d == 1)
+    ends, = np.nonzero(d == -1)
+    return starts, ends - starts
+
+
+def blocks_mask(starts, sizes, start, stop):
+    """
+    Boolean mask over [start, stop) of the positions covered by the
+    (sorted, non-overlapping) blocks.
+    """
+    ends = starts + sizes
+    i = np.searchsorted(ends, start, side="right")
+    j = np.searchsorted(starts, stop, side="left")
+    a = np.clip(starts[i:j], start, stop) - start
+    b = np.clip(ends[i:j], start, stop) - start
+    delta = np.zeros(stop - start + 1, dtype=np.int32)
+    np.add.at(delta, a, 1)
+    np.add.at(delta, b, -1)
+    return np.cumsum(delta[:-1]) > 0
+
+
+NO_EXCEPTIONS = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint8))
+
+
+class TwoBitRecord (object):
+
+    def __init__(self, name, size, nblocks, maskblocks, offset,
+                 exceptions=None):
+        self.name = name
+        self.size = size
+        self.nblocks = nblocks          # (starts, sizes)
+        self.maskblocks = maskblocks    # (starts, sizes)
+        self.offset = offset            # Byte offset of the packed bases
+        self.exceptions = exceptions or NO_EXCEPTIONS  # (positions, chars)
+
+    def __len__(self):
+        return self.size
+
+
+class TwoBit (BaseFile):
+    """
+    Memory-mapped reader of a .2bit file. Only the index is read upfront,
+    record headers are parsed on first access.
+    """
+    def __init__(self, filename):
+        super(TwoBit, self).__init__(filename)
+        self.data = np.memmap(filename, dtype=np.uint8, mode="r")
+        magic, = struct.unpack("<I", self.data[:4].tobytes())
+        self.endian = "<" if magic == TWOBIT_MAGIC else ">"
+        magic, version, count, reserved = self.unpack("IIII", 0)
+        assert magic == TWOBIT_MAGIC, \
+                "`{0}` is not a .2bit file".format(filename)
+        offset_format = "Q" if version == 1 else "I"
+
+        self.offsets = {}
+        self.names = []
+        index = []  # Record offsets in index order
+        pos = 16
+        for i in range(count):
+            namesize = int(self.data[pos])
+            name = self.data[pos + 1: pos + 1 + namesize].tobytes()
+            if not isinstance(name, str):
+                name = name.decode()
+            pos += 1 + namesize
+            offset, = self.unpack(offset_format, pos)
+            pos += struct.calcsize(offset_format)
+            if name in self.offsets:
+                logging.warning("Duplicate sequence name `{0}` in `{1}`, "
+                                "only the last one is used".\
+                                format(name, filename))
+                self.names.remove(name)
+            index.append(offset)
+            self.names.append(name)
+            self.offsets[name] = offset
+        self.records = {}
+        self.iupac = self.read_iupac_index(index)
+
+    def unpack(self, fmt, pos):
+        fmt = self.endian + fmt
+        size = struct.calcsize(fmt)
+        return struct.unpack(fmt, self.data[pos: pos + size].tobytes())
+
+    def read_iupac_index(self, index):
+        """
+        Positions in the file of the ambiguity code lists, by record offset.
+        `index` lists the record offsets in index order.
+        """
+        iupac = {}
+        if len(self.data) < 16 or \
+                self.data[-8:].tobytes() != IUPAC_SIGNATURE:
+            return iupac
+        pos, = self.unpack("Q", len(self.data) - 16)
+        count, = self.unpack("I", pos)
+        pos += 4
+        for i in range(count):
+            j, k = self.unpack("II", pos)
+            iupac[index[j]] = (pos + 8, k)
+            pos += 8 + 5 * k
+        return iupac
+
+    def exceptions(self, name):
+        offset = self.offsets[name]
+        if offset not in self.iupac:
+            return None
+        pos, k = self.iupac[offset]
+        dtype = np.dtype(self.endian + "u4")
+        positions = np.frombuffer(self.data, dtype=dtype, count=k, offset=pos)
+        chars = np.frombuffer(self.data, dtype=np.uint8, count=k,
+                              offset=pos + 4 * k)
+        return positions.astype(np.int64), chars
+
+    def blocks(self, pos):
+        count, = self.unpack("I", pos)
+        dtype = np.dtype(self.endian + "u4")
+        pos += 4
+        starts = np.frombuffer(self.data, dtype=dtype, count=count, offset=pos)
+        pos += 4 * count
+        sizes = np.frombuffer(self.data, dtype=dtype, count=count, offset=pos)
+        pos += 4 * count
+        return (starts.astype(np.int64), sizes.astype(np.int64)), pos
+
+    def __getitem__(self, name):
+        if name not in self.records:
+            pos = self.offsets[name]
+            size, = self.unpack("I", pos)
+            nblocks, pos = self.blocks(pos + 4)
+            maskblocks, pos = self.blocks(pos)
+            self.records[name] = TwoBitRecord(name, size, nblocks, maskblocks,
+                                              pos + 4, self.exceptions(name))
+        return self.records[name]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.offsets
+
+    def keys(self):
+        return self.names[:]
+
+    def itersizes(self):
+        for name in self.names:
+            yield name, len(self[name])
+
+    def _region(self, name, start, stop):
+        rec = self[name]
+        start = max(start or 0, 0)
+        stop = rec.size if stop is None else min(stop, rec.size)
+        return rec, start, max(start, stop)
+
+    def codes(self, name, start=0, stop=None):
+        """
+        Base codes in the 0-based, half-open interval [start, stop), with
+        T=0, C=1, A=2, G=3 and N=4 (N or any other non-ACGT).
+        """
+        rec, start, stop = self._region(name, start, stop)
+        a, b = start // 4, (stop + 3) // 4
+        packed = self.data[rec.offset + a: rec.offset + b]
+        codes = np.asarray((packed[:, None] >> SHIFTS) & 3).ravel()
+        codes = codes[start - 4 * a: stop - 4 * a]
+        nstarts, nsizes = rec.nblocks
+        if len(nstarts):
+            codes[blocks_mask(nstarts, nsizes, start, stop)] = 4
+        return codes
+
+    def array(self, name, start=0, stop=None, mask=True):
+        """
+        Sequence as an uint8 array of ASCII characters, soft-masked runs in
+        lower case unless mask=False.
+        """
+        rec, start, stop = self._region(name, start, stop)
+        seq = BASES[self.codes(name, start, stop)]
+        positions, chars = rec.exceptions
+        if len(positions):
+            i, j = np.searchsorted(positions, [start, stop])
+            seq[positions[i:j] - start] = chars[i:j]
+        mstarts, msizes = rec.maskblocks
+        if mask and len(mstarts):
+            seq[blocks_mask(mstarts, msizes, start, stop)] += 32
+        return seq
+
+    def fetch(self, name, start=0, stop=None, mask=True):
+        seq = self.array(name, start, stop, mask=mask).tobytes()
+        if not isinstance(seq, str):
+            seq = seq.decode()
+        return seq
+
+    def nruns(self, name, start=0, stop=None):
+        """
+        Starts and sizes of the N runs that fall within [start, stop). Other
+        ambiguity codes do not count.
+        """
+        rec, start, stop = self._region(name, start, stop)
+        starts, sizes = rec.nblocks
+        positions, chars = rec.exceptions
+        i, j = np.searchsorted(positions, [start, stop])
+        if j > i:
+            isN = blocks_mask(starts, sizes, start, stop)
+            isN[positions[i:j] - start] = False
+            starts, sizes = runs(isN)
+            return starts + start, sizes
+
+        ends = starts + sizes
+        keep = (ends > start) & (starts < stop)
+        a = np.maximum(starts[keep], start)
+        b = np.minimum(ends[keep], stop)
+        return a, b - a
+
+
+def as_array(seq):
+    if isinstance(seq, np.ndarray):
+        return seq
+    if not isinstance(seq, bytes):
+        seq = seq.encode()
+    return np.frombuffer(seq, dtype=np.uint8)
+
+
+def iupac_exceptions(seq):
+    """
+    Positions and upper case characters of the non-ACGTN bases, which .2bit
+    stores as N.
+
+    >>> iupac_exceptions("ACrNNYa")
+    (array([2, 5]), array([82, 89], dtype=uint8))
+    """
+    a = as_array(seq)
+    positions = np.flatnonzero(~(ISACGT[a] | ISN[a]))
+    chars = a[positions]
+    chars = np.where(ISLOWER[chars], chars - 32, chars).astype(np.uint8)
+    return positions, chars
+
+
+def pack_record(seq):
+    """
+    Encode one sequence into .2bit record bytes.
+    """
+    a = as_array(seq)
+    size = len(a)
+    nstarts, nsizes = runs(~ISACGT[a])
+    mstarts, msizes = runs(ISLOWER[a])
+
+    codes = ENCODE[a]
+    pad = (-size) % 4
+    if pad:
+        codes = np.concatenate((codes, np.zeros(pad, dtype=np.uint8)))
+    codes = codes.reshape(-1, 4)
+    packed = (codes[:, 0] << 6) | (codes[:, 1] << 4) | \
+             (codes[:, 2] << 2) | codes[:, 3]
+
+    header = [np.array([size, len(nstarts)], dtype="<u4"),
+              nstarts.astype("<u4"), nsizes.astype("<u4"),
+              np.array([len(mstarts)], dtype="<u4"),
+              mstarts.astype("<u4"), msizes.astype("<u4"),
+              np.array([0], dtype="<u4")]
+    return b"".join(x.tobytes() for x in header) + packed.astype(np.uint8).tobytes()
+
+
+def write_twobit(fastafile, twobitfile):
+    """
+    Convert FASTA to .2bit, one record in memory at a time. Ambiguity codes
+    are stored as N, same as UCSC faToTwoBit, and listed in the extension.
+    Raises ValueError on duplicate ids or ids longer than 255 bytes, which
+    the index cannot hold.
+    """
+    names, sizes, iupac = [], [], []
+    seen = set()
+    tmp = tempfile.TemporaryFile()
+    for i, rec in enumerate(SeqIO.parse(must_open(fastafile), "fasta")):
+        name = rec.id.encode()
+        if len(name) > 255:
+            raise ValueError("Sequence id `{0}...` in `{1}` is longer than "
+                             "255 bytes".format(rec.id[:20], fastafile))
+        if name in seen:
+            raise ValueError("Duplicate sequence id `{0}` in `{1}`".\
+                             format(rec.id, fastafile))
+        seen.add(name)
+        a = as_array(str(rec.seq))
+        record = pack_record(a)
+        tmp.write(record)
+        names.append(name)
+        sizes.append(len(record))
+        positions, chars = iupac_exceptions(a)
+        if len(positions):
+            iupac.append((i, positions, chars))
+
+    index_size = sum(1 + len(x) for x in names)
+    version, offset_size = 0, 4
+    if 16 + index_size + 4 * len(names) + sum(sizes) >= 2 ** 32:
+        version, offset_size = 1, 8
+    offset = 16 + index_size + offset_size * len(names)
+    offset_format = "<Q" if version == 1 else "<I"
+
+    fw = open(twobitfile, "wb")
+    fw.write(struct.pack("<IIII", TWOBIT_MAGIC, version, len(names), 0))
+    for name, size in zip(names, sizes):
+        fw.write(struct.pack("<B", len(name)) + name)
+        fw.write(struct.pack(offset_format, offset))
+        offset += size
+    tmp.seek(0)
+    shutil.copyfileobj(tmp, fw)
+    tmp.close()
+    if iupac:
+        fw.write(struct.pack("<I", len(iupac)))
+        for i, positions, chars in iupac:
+            fw.write(struct.pack("<II", i, len(positions)))
+            fw.write(positions.astype("<u4").tobytes())
+            fw.write(chars.tobytes())
+        fw.write(struct.pack("<Q", offset) + IUPAC_SIGNATURE)
+    fw.close()
+    logging.debug("{0} records written to `{1}`".format(len(names), twobitfile))
+
+
+def get_twobit(filename):
+    """
+    Open `filename` as .2bit, converting from FASTA to `filename.2bit` first
+    if it is not already packed. If that file cannot be written, the FASTA
+    is packed into a temporary file instead, removed once it is mapped.
+    """
+    if filename.endswith(".2bit"):
+        return TwoBit(filename)
+    twobitfile = filename + ".2bit"
+    if not need_update(filename, twobitfile):
+        return TwoBit(twobitfile)
+    try:
+        write_twobit(filename, twobitfile)
+    except (IOError, OSError):
+        logging.debug("Cannot write `{0}`, pack into a temporary file".\
+                      format(twobitfile))
+        fd, tmpfile = tempfile.mkstemp(suffix=".2bit")
+        os.close(fd)
+        try:
+            write_twobit(filename, tmpfile)
+            return TwoBit(tmpfile)
+        finally:
+            os.remove(tmpfile)
+    return TwoBit(twobitfile)
+
+
+def main():
+
+    actions = (
+        ('fromfasta', 'convert FASTA to .2bit'),
+        ('tofasta', 'convert .2bit to FASTA'),
+            )
+    p = ActionDispatcher(actions)
+    p.dispatch(globals())
+
+
+def fromfasta(args):
+    """
+    %prog fromfasta fastafile twobitfile
+
+    Pack FASTA into .2bit, compatible with UCSC twoBitToFa.
+    """
+    p = OptionParser(fromfasta.__doc__)
+    opts, args = p.parse_args(args)
+
+    if len(args) != 2:
+        sys.exit(not p.print_help())
+
+    fastafile, twobitfile = args
+    write_twobit(fastafile, twobitfile)
+
+
+def tofasta(args):
+    """
+    %prog tofasta twobitfile
+
+    Unpack .2bit into FASTA.
+    """
+    p = OptionParser(tofasta.__doc__)
+    p.add_option("--nomask", default=False, action="store_true",
+                 help="Output soft-masked bases in upper case")
+    p.set_outfile()
+    opts, args = p.parse_args(args)
+
+    if len(args) != 1:
+        sys.exit(not p.print_help())
+
+    twobitfile, = args
+    tb = TwoBit(twobitfile)
+    fw = must_open(opts.outfile, "w")
+    for name in tb.keys():
+        seq = tb.fetch(name, mask=not opts.nomask)
+        print(">{0}".format(name), file=fw)
+        for i in range(0, len(seq), 60):
+            print(seq[i: i + 60], file=fw)
+    fw.close()
+
+
+if __name__ == '__main__':
+    main()
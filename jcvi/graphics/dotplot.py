@@ -61,7 +61,7 @@ class Palette (dict):
 def draw_box(clusters, ax, color="b"):
 
     for cluster in clusters:
-        xrect, yrect = zip(*cluster)
+        xrect, yrect = list(zip(*cluster))[:2]
         xmin, xmax, ymin, ymax = min(xrect), max(xrect), \
                                 min(yrect), max(yrect)
         ax.add_patch(Rectangle((xmin, ymin), xmax - xmin, ymax - ymin,\
@@ -220,7 +220,7 @@ def dotplot(anchorfile, qbed, sbed, fig, root, ax, vmin=0, vmax=1,
                 vmin=vmin, vmax=vmax)
 
     if synteny:
-        clusters = batch_scan(data, qbed, sbed)
+        clusters = batch_scan(data)
         draw_box(clusters, ax)
 
     if cmap_text:
@@ -260,6 +260,10 @@ def dotplot(anchorfile, qbed, sbed, fig, root, ax, vmin=0, vmax=1,
 
 def subset_bed(bed, seqids):
     from copy import deepcopy
+    from jcvi.formats.bed import BedArray
+
+    if isinstance(bed, BedArray):
+        return bed.subset(seqids)
 
     newbed = deepcopy(bed)
     del newbed[:]
@@ -323,7 +327,7 @@ def dotplot_main(args):
         anchorfile = anchorksfile
 
     qbed, sbed, qorder, sorder, is_self = check_beds(anchorfile, p, opts,
-                sorted=(not opts.nosort))
+                sorted=(not opts.nosort), columnar=True)
 
     if opts.skipempty:
         ac = AnchorFile(anchorfile)
@@ -14,10 +14,11 @@ import logging
 import numpy as np
 
 from collections import defaultdict
+from hashlib import md5
 
 from jcvi.formats.sizes import Sizes
-from jcvi.formats.base import LineFile, DictFile
-from jcvi.formats.bed import Bed, bins
+from jcvi.formats.base import BaseFile, LineFile, DictFile, npz_memmap
+from jcvi.formats.bed import Bed, binstore
 from jcvi.algorithms.matrix import moving_sum
 from jcvi.graphics.base import plt, Rectangle, CirclePolygon, savefig, \
             ticker, human_readable_base, latex
@@ -67,6 +68,51 @@ class BinFile (LineFile):
             self.mapping[chr].append((len, binlen))
         fp.close()
 
+    def get_arrays(self, chr):
+        m, n = zip(*self.mapping[chr])
+        return np.array(m, dtype="float"), np.array(n, dtype="float")
+
+
+class BinStore (BaseFile):
+    """
+    Reader for the .npz bin store written by `jcvi.formats.bed binstore`. The
+    store is saved uncompressed, so the bin arrays are memory-mapped directly
+    from the file instead of being loaded.
+    """
+    def __init__(self, filename):
+        super(BinStore, self).__init__(filename)
+        store = np.load(filename)
+        self.seqids = list(store["seqids"])
+        self.tracks = list(store["tracks"])
+        self.binsizes = list(store["binsizes"])
+        self.mode = str(store["mode"])
+        store.close()
+
+    def memmap(self, key):
+        return npz_memmap(self.filename, key)
+
+    def get_track(self, track, binsize):
+        return BinTrack(self, self.tracks.index(track), binsize)
+
+
+class BinTrack (object):
+    """
+    One bed file at one bin size in a `BinStore`, can be used in place of
+    `BinFile`.
+    """
+    def __init__(self, store, i, binsize):
+        self.filename = store.tracks[i]
+        self.values = store.memmap("values_{0}_{1}".format(i, binsize))
+        self.binlens = store.memmap("binlens_{0}".format(binsize))
+        offsets = store.memmap("offsets_{0}".format(binsize))
+        self.offsets = dict((x, (offsets[j], offsets[j + 1])) for j, x in
+                            enumerate(store.seqids))
+
+    def get_arrays(self, chr):
+        a, b = self.offsets[chr]
+        return np.array(self.values[a:b], dtype="float"), \
+               np.array(self.binlens[a:b], dtype="float")
+
 
 def main():
 
@@ -116,10 +162,7 @@ def get_nbins(clen, shift):
 
 
 def linearray(binfile, chr, window, shift):
-    mn = binfile.mapping[chr]
-    m, n = zip(*mn)
-
-    m = np.array(m, dtype="float")
+    m, n = binfile.get_arrays(chr)
     w = window / shift
     m = moving_sum(m, window=w)
     return m
@@ -482,27 +525,31 @@ def draw_gauge(ax, margin, maxl, rightmargin=None):
 
 def get_binfiles(inputfiles, fastafile, shift, mode="span", subtract=None,
                  binned=False, merge=True):
-    if not binned:
-        binopts = ["--binsize={0}".format(shift)]
-        binopts.append("--mode={0}".format(mode))
-        if subtract:
-            binopts.append("--subtract={0}".format(subtract))
-        if not merge:
-            binopts.append("--nomerge")
-        binfiles = [bins([x, fastafile] + binopts) for x in inputfiles if op.exists(x)]
-    else:
-        binfiles = inputfiles
-    binfiles = [BinFile(x) for x in binfiles]
+    if binned:
+        return [BinFile(x) for x in inputfiles]
 
-    return binfiles
+    inputfiles = [x for x in inputfiles if op.exists(x)]
+    if not inputfiles:
+        return []
 
+    # All tracks are binned in one go into a single store, named after the
+    # inputs and all the binning options so that different plots don't clash
+    binopts = ["--binsize={0}".format(shift), "--mode={0}".format(mode)]
+    if subtract:
+        binopts.append("--subtract={0}".format(subtract))
+    if not merge:
+        binopts.append("--nomerge")
+    key = md5("\t".join([fastafile] + inputfiles + binopts)).hexdigest()
+    storefile = "{0}.{1}.bins.npz".format(op.basename(inputfiles[0]), key[:8])
+    binstore([fastafile] + inputfiles + binopts +
+             ["--outfile={0}".format(storefile)])
+    store = BinStore(storefile)
 
-def stackarray(binfile, chr, window, shift):
-    mn = binfile.mapping[chr]
-    m, n = zip(*mn)
+    return [store.get_track(x, shift) for x in inputfiles]
 
-    m = np.array(m, dtype="float")
-    n = np.array(n, dtype="float")
+
+def stackarray(binfile, chr, window, shift):
+    m, n = binfile.get_arrays(chr)
 
     w = window / shift
     m = moving_sum(m, window=w)
@@ -254,7 +254,6 @@ def deletion(args):
                  help="Minimum span to call a deletion")
     p.add_option("--split", default=False, action="store_true",
                  help="Break at cigar N into separate parts")
-    p.set_tmpdir()
     opts, args = p.parse_args(args)
 
     if len(args) != 2:
@@ -271,7 +270,6 @@ def deletion(args):
             cmd += " | cut -f1-4"
             sh(cmd, outfile=bedfile)
 
-    sort_tmpdir = "--tmpdir={0}".format(opts.tmpdir)
     if bedfile.endswith(".sorted.bed"):
         pf = bedfile.rsplit(".", 2)[0]
         sortedbedfile = bedfile
@@ -279,7 +277,7 @@ def deletion(args):
         pf = bedfile.rsplit(".", 1)[0]
         sortedbedfile = pf + ".sorted.bed"
         if need_update(bedfile, sortedbedfile):
-            sort([bedfile, "-u", "--accn", sort_tmpdir])
+            sort([bedfile, "-u", "--accn"])
 
     # Find reads that contain multiple matches
     ibedfile = pf + ".d.bed"
@@ -314,7 +312,7 @@ def deletion(args):
                             (seqid, start - 1, end, ies_name)), file=fw)
             ies_id += 1
         fw.close()
-        sort([countbedfile, "-i", sort_tmpdir])
+        sort([countbedfile, "-i"])
 
     # Remove deletions that contain some read depth
     depthbedfile = pf + ".depth.bed"
@@ -6,6 +6,8 @@ Disjoint set data structure <http://code.activestate.com/recipes/387776/>
 Author: Michael Droettboom
 """
 
+import numpy as np
+
 
 class Grouper(object):
     """
@@ -108,6 +110,279 @@ class Grouper(object):
         return self._mapping.keys()
 
 
+class UnionFind(object):
+    """
+    Disjoint sets over dense integer IDs 0 .. n-1, backed by NumPy arrays.
+    Use `join()` for single links (union by rank and path compression) and
+    `join_pairs()` to add many links at once. New IDs can be appended with
+    `add()`. The size of each set and the number of sets are kept up to date.
+
+    >>> uf = UnionFind(6)
+    >>> uf.join(0, 1)
+    >>> uf.join_pairs([1, 3], [2, 4])
+    >>> uf.joined(0, 2), uf.joined(0, 3)
+    (True, False)
+    >>> uf.labels().tolist()
+    [0, 0, 0, 3, 3, 5]
+    >>> len(uf), uf.nsets, uf.set_size(4)
+    (6, 3, 2)
+    >>> uf.add()
+    6
+    """
+
+    def __init__(self, n=0):
+        self.n = n
+        self.nsets = n
+        self._parent = np.arange(max(n, 1))
+        self._rank = np.zeros(max(n, 1), dtype=np.int8)
+        self._size = np.ones(max(n, 1), dtype=int)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def parent(self):
+        return self._parent[:self.n]
+
+    def add(self, count=1):
+        """
+        Append `count` new singleton sets, returns the first new ID.
+        """
+        n = self.n
+        m = n + count
+        if m > len(self._parent):
+            capacity = max(2 * len(self._parent), m)
+            self._parent = np.resize(self._parent, capacity)
+            self._rank = np.resize(self._rank, capacity)
+            self._size = np.resize(self._size, capacity)
+        self._parent[n:m] = np.arange(n, m)
+        self._rank[n:m] = 0
+        self._size[n:m] = 1
+        self.n = m
+        self.nsets += count
+        return n
+
+    def find(self, a):
+        parent = self._parent
+        root = a
+        while parent[root] != root:
+            root = parent[root]
+        while parent[a] != root:
+            parent[a], a = root, parent[a]
+        return root
+
+    def join(self, a, *args):
+        rank, size = self._rank, self._size
+        ra = self.find(a)
+        for arg in args:
+            rb = self.find(arg)
+            if ra == rb:
+                continue
+            if rank[ra] < rank[rb]:
+                ra, rb = rb, ra
+            self._parent[rb] = ra
+            size[ra] += size[rb]
+            self.nsets -= 1
+            if rank[ra] == rank[rb]:
+                rank[ra] += 1
+
+    def joined(self, a, b):
+        return bool(self.find(a) == self.find(b))
+
+    def set_size(self, a):
+        """
+        Number of members in the set that a belongs to.
+        """
+        return int(self._size[self.find(a)])
+
+    def remove(self, a):
+        """
+        Stop counting a as a member of its set. The ID itself stays in place,
+        so that the other members remain linked through it.
+        """
+        root = self.find(a)
+        self._size[root] -= 1
+        if not self._size[root]:
+            self.nsets -= 1
+
+    def compress(self):
+        """
+        Point every element directly to its root, by pointer jumping.
+        """
+        parent = self.parent
+        while True:
+            grandparent = parent[parent]
+            if (grandparent == parent).all():
+                break
+            parent[:] = grandparent
+
+    def join_pairs(self, a, b):
+        """
+        Vectorized join of a[i] and b[i] for all i. Each round hooks the
+        larger root onto the smallest root it is linked to, until all pairs
+        share the same root.
+        """
+        parent, size = self.parent, self._size
+        a, b = np.asarray(a, dtype=int), np.asarray(b, dtype=int)
+        self.compress()
+        roots = np.flatnonzero(parent == np.arange(self.n))
+        while len(a):
+            self.compress()
+            ra, rb = parent[a], parent[b]
+            linked = ra != rb
+            a, b, ra, rb = a[linked], b[linked], ra[linked], rb[linked]
+            if not len(a):
+                break
+            np.minimum.at(parent, np.maximum(ra, rb), np.minimum(ra, rb))
+
+        # Old roots pass their sizes on to the new roots
+        merged = roots[parent[roots] != roots]
+        np.add.at(size, parent[merged], size[merged])
+        self.nsets -= len(merged)
+
+    def labels(self):
+        """
+        Returns the root of each element.
+        """
+        self.compress()
+        return self.parent.copy()
+
+
+class ArrayGrouper(object):
+    """
+    Same interface as `Grouper`, built on `UnionFind`. Keys are mapped to
+    dense integer IDs in the order they are first seen. Joins are buffered
+    and applied with one vectorized `join_pairs()` when the sets are next
+    needed, and the sets are labeled in one pass and cached until the next
+    join. Each set lists its members in the order they were first seen.
+
+    >>> g = ArrayGrouper()
+    >>> g.join('a', 'b')
+    >>> g.join('b', 'c')
+    >>> g.join('d', 'e')
+    >>> list(g)
+    [['a', 'b', 'c'], ['d', 'e']]
+    >>> len(g), g.num_members
+    (2, 5)
+    >>> g.joined('a', 'c'), g.joined('a', 'd'), 'f' in g
+    (True, False, False)
+    >>> g['e']
+    ('d', 'e')
+    >>> del g['b']
+    >>> list(g)
+    [['a', 'c'], ['d', 'e']]
+    """
+
+    def __init__(self, init=()):
+        self._ids = {}
+        self._keys = []
+        self._uf = UnionFind()
+        self._pending = ([], [])
+        self._cache = None
+        for x in init:
+            self._id(x)
+
+    def _id(self, key):
+        ids = self._ids
+        if key not in ids:
+            ids[key] = len(self._keys)
+            self._keys.append(key)
+            self._cache = None
+        return ids[key]
+
+    def _flush(self):
+        """
+        Add the new keys to the UnionFind and apply the buffered joins.
+        """
+        uf = self._uf
+        if len(self._keys) > len(uf):
+            uf.add(len(self._keys) - len(uf))
+        a, b = self._pending
+        if a:
+            uf.join_pairs(a, b)
+            self._pending = ([], [])
+
+    def join(self, a, *args):
+        """
+        Join given arguments into the same set. Accepts one or more arguments.
+        """
+        ia = self._id(a)
+        pa, pb = self._pending
+        for x in args:
+            pa.append(ia)
+            pb.append(self._id(x))
+        self._cache = None
+
+    def joined(self, a, b):
+        """
+        Returns True if a and b are members of the same set.
+        """
+        ids = self._ids
+        if a not in ids or b not in ids:
+            return False
+        groups, group_of = self._groups()
+        return bool(group_of[ids[a]] == group_of[ids[b]])
+
+    def _groups(self):
+        """
+        The sets as arrays of IDs, ordered by their first member, and the
+        index of the set of each ID (-1 for deleted keys).
+        """
+        if self._cache is not None:
+            return self._cache
+        self._flush()
+        uf = self._uf
+        ids = np.array(sorted(self._ids.values()), dtype=int)
+        group_of = np.full(len(uf), -1, dtype=int)
+        groups = []
+        if len(ids):
+            labels = uf.labels()[ids]
+            order = np.argsort(labels, kind="mergesort")
+            ids, labels = ids[order], labels[order]
+            groups = np.split(ids, np.flatnonzero(np.diff(labels)) + 1)
+            groups.sort(key=lambda x: x[0])
+            for i, group in enumerate(groups):
+                group_of[group] = i
+        self._cache = groups, group_of
+        return self._cache
+
+    def __iter__(self):
+        """
+        Returns an iterator returning each of the disjoint sets as a list.
+        """
+        keys = self._keys
+        groups, group_of = self._groups()
+        for group in groups:
+            yield [keys[i] for i in group]
+
+    def __getitem__(self, key):
+        """
+        Returns the set that a certain key belongs.
+        """
+        keys = self._keys
+        groups, group_of = self._groups()
+        return tuple(keys[i] for i in groups[group_of[self._ids[key]]])
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    def __len__(self):
+        self._flush()
+        return self._uf.nsets
+
+    def __delitem__(self, key):
+        self._flush()
+        self._uf.remove(self._ids.pop(key))
+        self._cache = None
+
+    @property
+    def num_members(self):
+        return len(self._ids)
+
+    def keys(self):
+        return self._ids.keys()
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
@@ -4,9 +4,14 @@ Itertools recipes
 with some modifications.
 """
 
+import os
+import os.path as op
+import heapq
+import tempfile
+
 from itertools import *
 from collections import Iterable
-from six.moves import zip_longest
+from six.moves import zip_longest, cPickle
 
 
 def take(n, iterable):
@@ -300,6 +305,89 @@ class peekable(object):
         return ret
 
 
+class ExternalSort(object):
+    """Sort an iterable that does not fit into memory.
+
+    Items are read ``chunksize`` at a time, sorted and pickled into runs on
+    disk. Whenever there are ``maxruns`` runs, they are merged into one, so
+    that no more than ``maxruns`` files are ever open at once. Iterating over
+    the object merges the runs lazily, so it can be iterated over more than
+    once. Items are compared as they are, use tuples with the sort key in
+    front::
+
+        >>> list(ExternalSort([3, 1, 2, 5, 4], chunksize=2))
+        [1, 2, 3, 4, 5]
+        >>> len(ExternalSort(range(10, 0, -1), chunksize=1, maxruns=3).runs)
+        2
+
+    """
+    def __init__(self, iterable, chunksize=1000000, tmpdir=None, maxruns=64):
+        assert maxruns > 1, "maxruns must be at least 2"
+        self.tmpdir = tmpdir
+        self.runs = []
+        self.nitems = 0
+        # levels[i] holds the runs that went through i merges
+        levels = []
+        for chunk in chunked(iterable, chunksize):
+            chunk.sort()
+            self.add_run(levels, 0, self.write_run(chunk), maxruns)
+            self.nitems += len(chunk)
+        runs = [x for level in levels for x in level]
+        while len(runs) > maxruns:
+            runs = runs[maxruns:] + [self.merge_runs(runs[:maxruns])]
+        self.runs = runs
+
+    def add_run(self, levels, i, runfile, maxruns):
+        if len(levels) == i:
+            levels.append([])
+        levels[i].append(runfile)
+        if len(levels[i]) == maxruns:
+            merged = self.merge_runs(levels[i])
+            levels[i] = []
+            self.add_run(levels, i + 1, merged, maxruns)
+
+    def merge_runs(self, runs):
+        runfile = self.write_run(self.merge(runs))
+        for x in runs:
+            os.remove(x)
+        return runfile
+
+    def write_run(self, items):
+        fd, runfile = tempfile.mkstemp(suffix=".run", dir=self.tmpdir)
+        fw = os.fdopen(fd, "wb")
+        for item in items:
+            cPickle.dump(item, fw, cPickle.HIGHEST_PROTOCOL)
+        fw.close()
+        return runfile
+
+    def merge(self, runs):
+        return heapq.merge(*[self.iter_run(x) for x in runs])
+
+    def __len__(self):
+        return self.nitems
+
+    def __iter__(self):
+        return self.merge(self.runs)
+
+    def iter_run(self, runfile):
+        fp = open(runfile, "rb")
+        while True:
+            try:
+                yield cPickle.load(fp)
+            except EOFError:
+                break
+        fp.close()
+
+    def close(self):
+        for runfile in self.runs:
+            if op.exists(runfile):
+                os.remove(runfile)
+        self.runs = []
+
+    def __del__(self):
+        self.close()
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
@@ -10,6 +10,7 @@ both on the 2D dotplot and 1D-projection
 from __future__ import print_function
 
 import sys
+import numpy as np
 
 from itertools import groupby
 from collections import namedtuple, defaultdict
@@ -480,7 +481,6 @@ def range_depth(ranges, size, verbose=True):
     Overlay ranges on [start, end], and summarize the ploidy of the intervals.
     """
     from jcvi.utils.iter import pairwise
-    from jcvi.utils.cbook import percentage
 
     # Make endpoints
     endpoints = []
@@ -515,13 +515,145 @@ def range_depth(ranges, size, verbose=True):
 
     assert sum(depthstore.values()) == size
     if verbose:
-        for depth, count in sorted(depthstore.items()):
-            print("Depth {0}: {1}".\
-                    format(depth, percentage(count, size)), file=sys.stderr)
+        print_depth(depthstore, size)
 
     return depthstore, depthdetails
 
 
+def print_depth(depthstore, size):
+    """
+    Summarize the ploidy returned by `range_depth()` to stderr.
+    """
+    from jcvi.utils.cbook import percentage
+
+    for depth, count in sorted(depthstore.items()):
+        print("Depth {0}: {1}".\
+                format(depth, percentage(count, size)), file=sys.stderr)
+
+
+class RangeIndex(object):
+    """
+    Persistent per-seqid index on a collection of ranges. Within each seqid,
+    ranges are sorted by start, together with the running maximum of the ends
+    (and which range attains it), as well as the ends sorted on their own. All
+    queries are binary searches on these arrays, and return the original
+    ranges. `key` maps each item to (seqid, start, end), by default the first
+    three fields are used.
+
+    >>> ranges = [("1", 30, 45), ("1", 40, 50), ("1", 10, 20), ("2", 5, 8)]
+    >>> ri = RangeIndex(ranges)
+    >>> ri.overlap("1", 18, 35)
+    [('1', 10, 20), ('1', 30, 45)]
+    >>> ri.contain("1", 25, 60)
+    [('1', 30, 45), ('1', 40, 50)]
+    >>> ri.nearest("1", 22, 25)
+    ('1', 10, 20)
+    >>> ri.knearest("1", 52, 60, k=2)
+    [('1', 40, 50), ('1', 30, 45)]
+    >>> ri.overlap("3", 1, 100)
+    []
+    """
+    def __init__(self, ranges, key=None):
+        key = key or (lambda x: x[:3])
+        groups = defaultdict(list)
+        for r in ranges:
+            seqid, start, end = key(r)
+            groups[seqid].append((start, end, r))
+
+        self.index = {}
+        for seqid, rr in groups.items():
+            starts, ends, items = zip(*rr)
+            starts = np.array(starts, dtype=np.int64)
+            ends = np.array(ends, dtype=np.int64)
+            # Stable sort so that ties keep their input order
+            order = np.argsort(starts, kind="mergesort")
+            starts, ends = starts[order], ends[order]
+            items = [items[x] for x in order]
+            maxends = np.maximum.accumulate(ends)
+            # Which range attains the running maximum end
+            argmaxends = np.arange(len(ends))
+            argmaxends[1:][ends[1:] < maxends[:-1]] = -1
+            argmaxends = np.maximum.accumulate(argmaxends)
+            ends_order = np.argsort(ends, kind="mergesort")
+            self.index[seqid] = (starts, ends, maxends, argmaxends,
+                                 ends[ends_order], ends_order, items)
+
+    def _overlap_idx(self, seqid, start, end):
+        if seqid not in self.index:
+            return np.zeros(0, dtype=int), None
+        starts, ends, maxends = self.index[seqid][:3]
+        # Only ranges in [lo, hi) can possibly overlap [start, end]
+        lo = np.searchsorted(maxends, start, side="left")
+        hi = np.searchsorted(starts, end, side="right")
+        idx = np.arange(lo, hi)
+        return idx[ends[lo:hi] >= start], self.index[seqid]
+
+    def overlap(self, seqid, start, end):
+        """
+        Ranges that overlap [start, end].
+        """
+        idx, ii = self._overlap_idx(seqid, start, end)
+        return [ii[-1][x] for x in idx]
+
+    def contain(self, seqid, start, end):
+        """
+        Ranges that are completely within [start, end].
+        """
+        idx, ii = self._overlap_idx(seqid, start, end)
+        if not len(idx):
+            return []
+        starts, ends = ii[:2]
+        idx = idx[(starts[idx] >= start) & (ends[idx] <= end)]
+        return [ii[-1][x] for x in idx]
+
+    def nearest(self, seqid, start, end):
+        """
+        Range closest to [start, end], overlapping ranges are at distance 0.
+        Returns None if the seqid is not indexed.
+        """
+        if seqid not in self.index:
+            return None
+        starts, ends, maxends, argmaxends, _, _, items = self.index[seqid]
+        hi = np.searchsorted(starts, end, side="right")
+        candidates = []
+        if hi > 0:
+            # Among ranges starting before end, the one reaching furthest
+            j = argmaxends[hi - 1]
+            candidates.append((max(start - ends[j], 0), j))
+        if hi < len(starts):
+            candidates.append((starts[hi] - end, hi))
+        if not candidates:
+            return None
+        dist, j = min(candidates)
+        return items[j]
+
+    def knearest(self, seqid, start, end, k=1):
+        """
+        Up to k ranges closest to [start, end], ordered by distance.
+        """
+        if seqid not in self.index or k <= 0:
+            return []
+        starts, ends, maxends, argmaxends, sorted_ends, ends_order, items = \
+                self.index[seqid]
+        idx, ii = self._overlap_idx(seqid, start, end)
+        res = [items[x] for x in idx[:k]]
+        # Walk outwards, left by descending ends, right by ascending starts
+        left = np.searchsorted(sorted_ends, start, side="left") - 1
+        right = np.searchsorted(starts, end, side="right")
+        while len(res) < k:
+            ldist = start - sorted_ends[left] if left >= 0 else None
+            rdist = starts[right] - end if right < len(starts) else None
+            if ldist is None and rdist is None:
+                break
+            if rdist is None or (ldist is not None and ldist <= rdist):
+                res.append(items[ends_order[left]])
+                left -= 1
+            else:
+                res.append(items[right])
+                right += 1
+        return res
+
+
 if __name__ == '__main__':
 
     import doctest
@@ -35,6 +35,9 @@ ext_modules = [
               include_dirs=[np.get_include()],
               extra_compile_args=["-O3"]),
     Extension("jcvi.formats.cblast", ["jcvi/formats/cblast.pyx"],
+              extra_compile_args=["-O3"]),
+    Extension("jcvi.algorithms.clis", ["jcvi/algorithms/clis.pyx"],
+              include_dirs=[np.get_include()],
               extra_compile_args=["-O3"])
 ]
 
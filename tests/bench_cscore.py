@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+%prog [nhits] [nids]
+
+Benchmark the vectorized C-score (`jcvi.formats.blast.get_cscores`) against
+the dict loop of `jcvi.compara.blastfilter.filter_cscore_python`, on synthetic
+hits (default 10M hits between 1M IDs). With --blastfile, the hits are also
+written as a BLAST tabular file and read back with `read_blast_columns`, text
+and binary (`blast binary`).
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+import logging
+import numpy as np
+
+from collections import defaultdict
+
+from jcvi.formats.blast import get_cscores, read_blast_columns, binary
+from jcvi.apps.base import OptionParser
+
+
+def timed(msg, func, *args, **kwargs):
+    t0 = time.time()
+    result = func(*args, **kwargs)
+    print("{0}: {1:.2f} s".format(msg, time.time() - t0))
+    return result
+
+
+def cscores_dict(queries, subjects, scores, cutoff):
+    # Same loop as filter_cscore_python, over the plain columns
+    best_score = defaultdict(float)
+    for q, s, score in zip(queries, subjects, scores):
+        if score > best_score[q]:
+            best_score[q] = score
+        if score > best_score[s]:
+            best_score[s] = score
+
+    return [score / max(best_score[q], best_score[s]) > cutoff
+            for q, s, score in zip(queries, subjects, scores)]
+
+
+def write_blast(blastfile, queries, subjects, scores):
+    fw = open(blastfile, "w")
+    for q, s, score in zip(queries, subjects, scores):
+        print("g{0}\tg{1}\t90.00\t100\t10\t0\t1\t100\t1\t100\t1e-20\t{2}".\
+              format(q, s, score), file=fw)
+    fw.close()
+
+
+def main(args):
+    p = OptionParser(__doc__)
+    p.add_option("--cutoff", default=.7, type="float",
+                 help="C-score cutoff [default: %default]")
+    p.add_option("--blastfile",
+                 help="Also time reading hits from this (new) BLAST file")
+    p.add_option("--seed", default=666, type="int",
+                 help="Random seed [default: %default]")
+    opts, args = p.parse_args(args)
+
+    if len(args) > 2:
+        sys.exit(not p.print_help())
+
+    nhits = int(float(args[0])) if args else 10000000
+    nids = int(float(args[1])) if len(args) > 1 else 1000000
+    np.random.seed(opts.seed)
+    queries = np.random.randint(0, nids, size=nhits)
+    subjects = np.random.randint(0, nids, size=nhits)
+    scores = np.random.randint(50, 1000, size=nhits).astype(float)
+    print("{0} hits between {1} IDs".format(nhits, nids))
+
+    cs, mask = timed("get_cscores", get_cscores, queries, subjects, scores,
+                     cutoff=opts.cutoff)
+    expected = timed("dict loop", cscores_dict, queries.tolist(),
+                     subjects.tolist(), scores.tolist(), opts.cutoff)
+    assert mask.tolist() == expected
+
+    blastfile = opts.blastfile
+    if blastfile:
+        timed("write `{0}`".format(blastfile), write_blast, blastfile,
+              queries, subjects, scores.astype(int))
+        timed("read_blast_columns (text)", read_blast_columns, blastfile)
+        timed("blast binary", binary, [blastfile])
+        timed("read_blast_columns (binary)", read_blast_columns, blastfile,
+              binary=True)
+        os.remove(blastfile)
+        os.remove(blastfile + ".npz")
+
+
+if __name__ == '__main__':
+    logging.disable(logging.DEBUG)
+    main(sys.argv[1:])
@@ -18,3 +18,1219 @@ def test_formats_cblast():
         "Os09g11510	Os08g13650	92.31	39	3	0	2273	2311	3237	3199	0.001	54.0")
     assert b.query == b'Os09g11510'
     assert b.hitlen == 39
+
+
+def test_formats_bedarray(tmpdir):
+    """ Test formats.bed - columnar BedArray agrees with Bed
+    """
+    from jcvi.formats.bed import Bed, BedArray
+
+    bedfile = tmpdir.join("test.bed")
+    bedfile.write("chr10\t10\t20\tg4\t0\t+\n"
+                  "chr2\t50\t80\tg2\t0\t-\n"
+                  "chr2\t0\t30\tg1\t0\t+\n"
+                  "chr10\t0\t5\tg3\t0\t-\n")
+    bed = Bed(str(bedfile))
+    barray = BedArray(str(bedfile))
+    assert [str(x) for x in barray] == [str(x) for x in bed]
+    assert barray.seqids == bed.seqids
+    assert list(barray.get_breaks()) == list(bed.get_breaks())
+    assert barray.order["g4"][0] == bed.order["g4"][0]
+    assert barray.order_in_chr["g4"][:2] == bed.order_in_chr["g4"][:2]
+    assert [str(x) for x in barray.extract("chr2", 1, 40)] == \
+           [str(x) for x in bed.extract("chr2", 1, 40)]
+    assert [str(x) for x in BedArray.from_bed(bed).to_bed()] == \
+           [str(x) for x in bed]
+    fields = lambda b: [getattr(b, x) for x in b.__slots__]
+    extrafile = tmpdir.join("extra.bed")
+    extrafile.write("chr1\t0\t5\tg1\t0\t+\tx\ty\nchr1\t7\t9\n")
+    assert [fields(x) for x in BedArray(str(extrafile))] == \
+           [fields(x) for x in Bed(str(extrafile))]
+
+    # Ranks are within each seqid, also when seqids are interleaved
+    barray = BedArray(str(tmpdir.join("test.bed")), sorted=False)
+    ranks = dict((x, barray.order_in_chr[x][:2]) for x in barray.order)
+    assert ranks == {"g4": ("chr10", 0), "g2": ("chr2", 0),
+                     "g1": ("chr2", 1), "g3": ("chr10", 1)}
+
+
+def test_utils_rangeindex():
+    """ Test utils.range - RangeIndex against brute force
+    """
+    import random
+    from jcvi.utils.range import RangeIndex, range_overlap
+
+    random.seed(666)
+    ranges = []
+    for i in range(500):
+        start = random.randint(1, 10000)
+        ranges.append(("chr{0}".format(i % 3), start,
+                       start + random.randint(0, 300)))
+    ri = RangeIndex(ranges)
+    for i in range(100):
+        start = random.randint(1, 10000)
+        q = ("chr1", start, start + random.randint(0, 500))
+        expected = [r for r in ranges if range_overlap(q, r)]
+        assert sorted(ri.overlap(*q)) == sorted(expected)
+        dist = lambda r: max(r[1] - q[2], q[1] - r[2], 0)
+        near = ri.knearest(q[0], q[1], q[2], k=5)
+        expected = sorted(dist(r) for r in ranges if r[0] == "chr1")[:5]
+        assert [dist(r) for r in near] == expected
+        assert dist(ri.nearest(*q)) == expected[0]
+
+
+def test_formats_bed_range_index():
+    """ Test formats.bed - cached range index follows Bed mutations
+    """
+    from copy import copy, deepcopy
+    from jcvi.formats.bed import Bed, BedLine
+
+    def accns(features):
+        return sorted(b.accn for b in features)
+
+    bed = Bed()
+    bed.extend(BedLine("chr1\t{0}\t{1}\tg{0}".format(i * 10, i * 10 + 5))
+               for i in range(10))
+    assert accns(bed.overlap("chr1", 1, 30)) == ["g0", "g10", "g20"]
+    bed.insert(0, BedLine("chr1\t0\t100\tbig"))
+    assert accns(bed.overlap("chr1", 50, 50)) == ["big"]
+    bed[0] = BedLine("chr1\t0\t100\thuge")
+    assert accns(bed.overlap("chr1", 50, 50)) == ["huge"]
+    del bed[0]
+    assert accns(bed.overlap("chr1", 50, 50)) == []
+    bed.pop()
+    assert accns(bed.overlap("chr1", 86, 100)) == []
+    bed[0].end = 100
+    del bed.range_index
+    assert accns(bed.overlap("chr1", 86, 100)) == ["g0"]
+    for b in (copy(bed), deepcopy(bed)):
+        assert b._range_index is None
+        del b[:]
+        assert accns(b.overlap("chr1", 1, 100)) == []
+    assert len(accns(bed.overlap("chr1", 1, 100))) == 9
+
+
+def test_formats_bed_engine(tmpdir):
+    """ Test formats.bed - in-process merge/intersect/subtract/complement
+    """
+    import random
+    from jcvi.formats.bed import Bed, BedArray, bed_merge, bed_intersect, \
+                bed_subtract, bed_complement, intersectBed_wao
+
+    def covered(bed):
+        bases = set()
+        for b in bed:
+            bases.update((b.seqid, x) for x in range(b.start, b.end + 1))
+        return bases
+
+    random.seed(666)
+    for name, n in (("a", 200), ("b", 50)):
+        rows = []
+        for i in range(n):
+            start = random.randint(0, 3000)
+            rows.append("chr{0}\t{1}\t{2}\t{3}{4}".format(random.randint(1, 2),
+                        start, start + random.randint(1, 200), name, i))
+        tmpdir.join(name + ".bed").write("\n".join(rows) + "\n")
+
+    abed = BedArray(str(tmpdir.join("a.bed")))
+    bbed = BedArray(str(tmpdir.join("b.bed")))
+    a, b = covered(abed), covered(bbed)
+    assert covered(bed_merge(abed)) == a
+    assert covered(bed_intersect(abed, bbed)) == a & b
+    assert covered(bed_subtract(abed, bbed)) == a - b
+    sizes = [("chr1", 4000), ("chr2", 4000)]
+    genome = set((x, i) for x, size in sizes for i in range(1, size + 1))
+    assert covered(bed_complement(abed, sizes)) == genome - a
+
+    # Same order as `intersectBed -wao`, a and b in file order
+    afile, bfile = str(tmpdir.join("a.bed")), str(tmpdir.join("b.bed"))
+    expected = []
+    for x in Bed(afile, sorted=False):
+        hits = [y.accn for y in Bed(bfile, sorted=False) if x.seqid == y.seqid
+                and max(x.start, y.start) <= min(x.end, y.end)]
+        expected += [(x.accn, y) for y in hits or [None]]
+    assert [(x.accn, y and y.accn) for x, y in
+            intersectBed_wao(afile, bfile)] == expected
+
+
+def test_graphics_landscape_binstore(tmpdir):
+    """ Test graphics.landscape - bin stores of different inputs don't clash
+    """
+    from jcvi.graphics.landscape import get_binfiles
+
+    tmpdir.join("a.sizes").write("chr1\t250\n")
+    tmpdir.join("a.genes.bed").write("chr1\t0\t100\tg1\nchr1\t50\t150\tg2\n")
+    tmpdir.join("a.repeats.bed").write("chr1\t200\t220\tr1\n")
+    with tmpdir.as_cwd():
+        genes, = get_binfiles(["a.genes.bed"], "a.sizes", 100)
+        assert list(genes.get_arrays("chr1")[0]) == [100, 50, 0]
+        repeats, = get_binfiles(["a.repeats.bed"], "a.sizes", 100)
+        assert list(repeats.get_arrays("chr1")[0]) == [0, 0, 20]
+        counts, = get_binfiles(["a.genes.bed"], "a.sizes", 100,
+                               mode="count", merge=False)
+        assert list(counts.get_arrays("chr1")[0]) == [2, 2, 0]
+        genes, = get_binfiles(["a.genes.bed"], "a.sizes", 100)
+        assert list(genes.get_arrays("chr1")[0]) == [100, 50, 0]
+
+
+def test_formats_bed_merge_fasta(tmpdir):
+    """ Test formats.bed - mergeBed scores and fastaFromBed headers
+    """
+    from jcvi.formats.bed import mergeBed, fastaFromBed
+    import jcvi.formats.fasta  # imported lazily, before the chdir below
+
+    tmpdir.join("a.bed").write("chr1\t0\t10\tg1\t2\t+\n"
+                               "chr1\t5\t20\tg2\t3\t-\n"
+                               "chr1\t30\t34\tg3\t1.5\t-\n")
+    tmpdir.join("genome.fasta").write(">chr1\n" + "ACGT" * 10 + "\n")
+    with tmpdir.as_cwd():
+        merged = [x.split("\t") for x in
+                  open(mergeBed("a.bed", scores="sum")).read().splitlines()]
+        assert [x[-1] for x in merged] == ["5", "1.5"]
+        fastafile = fastaFromBed("a.bed", "genome.fasta", stranded=True)
+        headers = [x for x in open(fastafile) if x[0] == ">"]
+        assert headers == [">chr1:0-10(+)\n", ">chr1:5-20(-)\n",
+                           ">chr1:30-34(-)\n"]
+        assert open(fastafile).read().split()[-1] == "GTAC"
+
+
+def test_formats_blastbinary(tmpdir):
+    """ Test formats.blast - binary cache gives same hits as text
+    """
+    import os
+    from jcvi.formats.blast import Blast, BlastSlow, BlastBinary, \
+                blast_to_binary, read_blast_columns
+
+    rows = []
+    for i in range(30):
+        for j in range(i % 4):
+            sstart, sstop = j + 1, j + 100
+            if i % 3 == 0:
+                sstart, sstop = sstop, sstart
+            rows.append("q{0}\ts{1}\t{2}\t100\t2\t0\t1\t100\t{3}\t{4}\t"
+                        "1e-20\t{5}".format(i, j % 2, (90.5, 100, 92.31)[j],
+                                            sstart, sstop, 50.1 + j))
+    blastfile = str(tmpdir.join("a.blast"))
+    tmpdir.join("a.blast").write("\n".join(rows) + "\n")
+    expected = [(q, [str(b) for b in blines])
+                for q, blines in Blast(blastfile).iter_hits()]
+    besthits = [str(b) for q, b in Blast(blastfile).iter_best_hit(N=1)]
+    besthsps = [str(b) for q, b in
+                Blast(blastfile).iter_best_hit(N=1, hsps=True)]
+    allhits = [str(b) for b in Blast(blastfile)]
+    allscores = [(b.pctid, b.score, b.evalue) for b in Blast(blastfile)]
+    slowhits = [str(b) for b in BlastSlow(blastfile)]
+    decode = lambda ids, queries, subjects, scores, pctids: \
+            ([ids[x] for x in queries], [ids[x] for x in subjects],
+             scores.tolist(), pctids.tolist())
+    columns = decode(*read_blast_columns(blastfile))
+
+    binfile = blast_to_binary(blastfile, blastfile + ".npz", chunksize=7)
+    assert len(BlastBinary(binfile)) == len(rows)
+    os.utime(blastfile, (0, 0))
+    assert Blast(blastfile).binary is None
+    blast = Blast(blastfile, binary=True)
+    assert blast.binary is not None
+    assert [(q, [str(b) for b in blines])
+            for q, blines in blast.iter_hits()] == expected
+    assert [str(b) for q, b in blast.iter_best_hit(N=1)] == besthits
+    assert [str(b) for q, b in blast.iter_best_hit(N=1, hsps=True)] == besthsps
+    assert [str(b) for b in blast] == allhits
+    assert [(b.pctid, b.score, b.evalue) for b in blast] == allscores
+    assert [str(b) for b in BlastSlow(blastfile, binary=True)] == slowhits
+    assert decode(*read_blast_columns(blastfile, binary=True)) == columns
+
+
+def test_compara_filter_cscore():
+    """ Test compara.blastfilter - vectorized C-score filter
+    """
+    import random
+    from jcvi.formats.blast import BlastLine
+    from jcvi.compara.blastfilter import filter_cscore
+
+    random.seed(666)
+    blasts = [BlastLine("q{0}\ts{1}\t90\t100\t1\t0\t1\t100\t1\t100\t1e-20\t{2}"
+              .format(random.randint(0, 20), random.randint(0, 20),
+                      random.randint(50, 100))) for i in range(200)]
+    for cutoff in (0, .5, .7, .9999):
+        expected = [str(b) for b in filter_cscore(blasts, cscore=cutoff,
+                                                  vectorized=False)]
+        assert [str(b) for b in filter_cscore(blasts, cscore=cutoff)] \
+                == expected
+
+
+def test_utils_externalsort(tmpdir):
+    """ Test utils.iter - external sort with a bounded number of runs
+    """
+    import random
+    from jcvi.utils.iter import ExternalSort
+
+    random.seed(666)
+    items = [(random.randint(0, 50), i) for i in range(1000)]
+    for chunksize, maxruns in ((1000, 2), (7, 2), (7, 5), (1, 64)):
+        es = ExternalSort(iter(items), chunksize=chunksize,
+                          tmpdir=str(tmpdir), maxruns=maxruns)
+        assert len(es.runs) <= maxruns and len(es) == len(items)
+        assert list(es) == list(es) == sorted(items)
+        assert len(tmpdir.listdir()) == len(es.runs)
+        es.close()
+        assert not tmpdir.listdir()
+    assert list(ExternalSort([])) == []
+
+
+def test_compara_blastfilter_streaming(tmpdir):
+    """ Test compara.blastfilter - --streaming gives the in-memory output
+    """
+    import random
+    from jcvi.compara.blastfilter import main
+
+    random.seed(666)
+    for name in "ab":
+        rows = ["chr{0}\t{1}\t{2}\t{3}{4}".format(i % 2, i * 100,
+                i * 100 + random.randint(50, 90), name, i) for i in range(60)]
+        tmpdir.join(name + ".bed").write("\n".join(rows) + "\n")
+    rows = []
+    for i in range(600):
+        q, s = random.randint(0, 59), random.randint(0, 59)
+        rows.append("a{0}\tb{1}\t90\t100\t1\t0\t1\t100\t1\t100\t{2}\t{3}".\
+                    format(q, s, random.choice(("1e-20", "1e-5")),
+                           random.randint(50, 70)))
+    tmpdir.join("a.blast").write("\n".join(rows) + "\n")
+    tmpdir.join("self.blast").write("\n".join(x.replace("\tb", "\ta")
+                                              for x in rows) + "\n")
+
+    for blastfile, sbed in (("a.blast", "b.bed"), ("self.blast", "a.bed")):
+        blastfile = str(tmpdir.join(blastfile))
+        args = [blastfile, "--qbed", str(tmpdir.join("a.bed")),
+                "--sbed", str(tmpdir.join(sbed))]
+        for extra in ([], ["--tandem_Nmax=0"]):
+            main(args + extra)
+            expected = open(blastfile + ".filtered").read()
+            main(args + extra + ["--streaming", "--chunksize=37",
+                                 "--tmpdir={0}".format(tmpdir)])
+            assert open(blastfile + ".filtered").read() == expected
+            assert expected
+
+
+def test_compara_synteny_scan():
+    """ Test compara.synteny - grid-bucketed scan against back-scan
+    """
+    import random
+    from jcvi.utils.grouper import Grouper
+    from jcvi.compara.synteny import synteny_scan, _score
+
+    def back_scan(points, xdist, ydist, N):
+        clusters = Grouper()
+        points = sorted(points)
+        for i in range(len(points)):
+            for j in range(i - 1, -1, -1):
+                if points[i][0] - points[j][0] > xdist:
+                    break
+                if abs(points[i][1] - points[j][1]) > ydist:
+                    continue
+                clusters.join(points[i], points[j])
+        return sorted(sorted(x) for x in clusters if _score(x) >= N)
+
+    random.seed(666)
+    for i in range(50):
+        points = [(random.randint(0, 200), random.randint(0, 200), 1.)
+                  for j in range(random.randint(0, 200))]
+        # dense tandem region
+        points += [(random.randint(50, 60), random.randint(80, 90), 2.)
+                   for j in range(random.randint(0, 50))]
+        # non-integer positions, as in `synteny breakpoint`
+        points += [(random.randint(0, 200), random.randint(0, 400) / 2., 3.)
+                   for j in range(random.randint(0, 50))]
+        xdist, ydist = random.randint(0, 20), random.randint(0, 20)
+        N = random.randint(1, 5)
+        assert synteny_scan(points, xdist, ydist, N) == \
+                back_scan(points, xdist, ydist, N)
+
+
+def test_compara_synteny_read_blast(tmpdir):
+    """ Test compara.synteny - columnar beds give the same ranks and seqids
+    """
+    import random
+    from jcvi.formats.bed import Bed, BedArray
+    from jcvi.compara.synteny import read_blast
+
+    random.seed(666)
+    rows = ["chr{0}\t{1}\t{2}\tg{3}".format(i % 3, i * 100, i * 100 + 50, i)
+            for i in range(120)]
+    bedfile = str(tmpdir.join("a.bed"))
+    tmpdir.join("a.bed").write("\n".join(rows) + "\n")
+    blastfile = str(tmpdir.join("a.a.blast"))
+    tmpdir.join("a.a.blast").write("".join(
+        "g{0}\tg{1}\t90\t100\t1\t0\t1\t100\t1\t100\t1e-20\t{2}\n".
+        format(random.randint(0, 130), random.randint(0, 130),
+               random.randint(50, 100)) for i in range(500)))
+
+    def fields(blasts):
+        return [(b.query, b.subject, b.qi, b.si, b.qseqid, b.sseqid)
+                for b in blasts]
+
+    bed, barray = Bed(bedfile), BedArray(bedfile)
+    # Ranks and seqids must not go through BedLine
+    barray.bedline = None
+    for is_self in (False, True):
+        assert fields(read_blast(blastfile, barray.order, barray.order,
+                                 is_self=is_self, ostrip=False)) == \
+               fields(read_blast(blastfile, bed.order, bed.order,
+                                 is_self=is_self, ostrip=False))
+
+
+def test_compara_batch_scan():
+    """ Test compara.synteny - parallel batch_scan agrees with serial
+    """
+    import random
+    from jcvi.compara.synteny import batch_scan
+
+    class Hit(object):
+        def __init__(self, qseqid, sseqid, qi, si, score):
+            self.qseqid, self.sseqid = qseqid, sseqid
+            self.qi, self.si, self.score = qi, si, score
+
+    random.seed(666)
+    hits = []
+    for i in range(2000):
+        qseqid, sseqid = random.choice("ABC"), random.choice("XYZ")
+        qi = random.randint(0, 300)
+        si = qi + random.randint(-5, 5)
+        hits.append(Hit(qseqid, sseqid, qi, si, float(random.randint(50, 99))))
+
+    clusters = batch_scan(hits, xdist=10, ydist=10, N=4)
+    assert clusters
+    assert batch_scan(hits, xdist=10, ydist=10, N=4, cpus=3) == clusters
+
+
+def test_utils_arraygrouper():
+    """ Test utils.grouper - ArrayGrouper agrees with Grouper
+    """
+    import random
+    from jcvi.utils.grouper import Grouper, ArrayGrouper
+
+    random.seed(666)
+    for i in range(20):
+        g, ag = Grouper(), ArrayGrouper()
+        for j in range(random.randint(0, 300)):
+            a, b = random.randint(0, 200), random.randint(0, 200)
+            g.join(a, b)
+            ag.join(a, b)
+            if j % 50 == 0:  # Queries in between buffered joins
+                a, b = random.randint(0, 200), random.randint(0, 200)
+                assert ag.joined(a, b) == g.joined(a, b)
+                assert len(ag) == len(g)
+        for j in range(random.randint(0, 20)):
+            a = random.randint(0, 200)
+            if a in g:
+                del g[a]
+                del ag[a]
+        assert len(ag) == len(g)
+        assert ag.num_members == g.num_members
+        assert sorted(sorted(x) for x in ag) == sorted(sorted(x) for x in g)
+        for a in g.keys():
+            assert sorted(ag[a]) == sorted(g[a])
+
+
+def test_algorithms_lis():
+    """ Test algorithms.lis - Fenwick HIS and row-vectorized LIS
+    """
+    import random
+    import numpy as np
+    from jcvi.algorithms.lis import heaviest_increasing_subsequence, \
+            longest_monotonic_subseq_length, \
+            longest_monotonic_subseq_length_loose, \
+            longest_increasing_subseq_length, \
+            longest_monotonic_subseq_lengths, longest_increasing_subsequences
+
+    def brute_his(a):
+        # Quadratic dynamic programming
+        best = [w for k, w in a]
+        for i, (key, weight) in enumerate(a):
+            for j in range(i):
+                if a[j][0] < key:
+                    best[i] = max(best[i], best[j] + weight)
+        return max([0] + best)
+
+    random.seed(666)
+    for i in range(50):
+        a = [(random.randint(0, 30), random.randint(1, 10) * random.random())
+             for j in range(random.randint(0, 60))]
+        seq, weight = heaviest_increasing_subsequence(a)
+        assert abs(weight - brute_his(a)) < 1e-9
+        assert abs(sum(w for k, w in seq) - weight) < 1e-9
+        assert all(x[0] < y[0] for x, y in zip(seq, seq[1:]))
+
+    X = np.random.RandomState(666).randint(0, 20, size=(30, 40))
+    score, diff = longest_monotonic_subseq_lengths(X)
+    assert list(zip(score, diff)) == \
+            [longest_monotonic_subseq_length(x.tolist()) for x in X]
+    score, diff = longest_monotonic_subseq_lengths(X, loose=True)
+    assert list(zip(score, diff)) == \
+            [longest_monotonic_subseq_length_loose(x.tolist()) for x in X]
+    for x, idx in zip(X, longest_increasing_subsequences(X)):
+        assert (np.diff(idx) > 0).all() and (np.diff(x[idx]) > 0).all()
+        assert len(idx) == longest_increasing_subseq_length(x.tolist())
+
+
+def test_algorithms_packing():
+    """ Test algorithms.lpsolve - built-in packing solver against brute force
+    """
+    import random
+    from itertools import product
+    from jcvi.algorithms.lpsolve import PackingSolver, solve_packing
+
+    def brute(weights, constraints, capacities):
+        best = 0
+        for x in product((0, 1), repeat=len(weights)):
+            if all(sum(x[i] for i in c) <= cap
+                   for c, cap in zip(constraints, capacities)):
+                best = max(best, sum(w for w, xi in zip(weights, x) if xi))
+        return best
+
+    random.seed(666)
+    for i in range(30):
+        n = random.randint(1, 12)
+        weights = [random.randint(-2, 20) for j in range(n)]
+        constraints = [random.sample(range(n), random.randint(1, n))
+                       for j in range(random.randint(0, 6))]
+        capacities = [random.randint(1, 2) for c in constraints]
+        results, obj_val, upper_bound = \
+                solve_packing(weights, constraints, capacities, cpus=2)
+        assert obj_val == upper_bound == brute(weights, constraints,
+                                               capacities)
+        assert obj_val == sum(weights[x] for x in results)
+        assert all(sum(1 for x in results if x in c) <= cap
+                   for c, cap in zip(constraints, capacities))
+
+        s = PackingSolver(weights, constraints, capacities, node_limit=2)
+        assert s.obj_val <= obj_val <= s.upper_bound
+
+
+def test_compara_quota_constraints():
+    """ Test compara.quota - maximal cliques and 2D overlap sweep
+    """
+    import random
+    from jcvi.utils.grouper import Grouper
+    from jcvi.utils.range import range_overlap
+    from jcvi.compara.quota import get_1D_overlap, get_1D_cliques, \
+            get_2D_overlap
+
+    def brute_2D_overlap(eclusters):
+        mergeables = Grouper()
+        for i, (xi, yi, si) in enumerate(eclusters):
+            mergeables.join(i)
+            for j, (xj, yj, sj) in enumerate(eclusters[:i]):
+                if range_overlap(xi, xj) and range_overlap(yi, yj):
+                    mergeables.join(i, j)
+        return mergeables
+
+    def make_ranges(n, size=500):
+        ranges = []
+        for i in range(n):
+            start = random.randint(0, size)
+            ranges.append((random.choice("12"), start,
+                           start + random.randint(0, 80)))
+        return ranges
+
+    random.seed(666)
+    for i in range(20):
+        eclusters = make_ranges(random.randint(0, 100))
+        depth = random.randint(1, 3)
+        cliques = get_1D_overlap(eclusters, depth)
+        maximal = get_1D_cliques(eclusters, depth)
+        assert maximal <= cliques
+        assert all(any(set(c) <= set(m) for m in maximal) for c in cliques)
+
+        n = random.randint(0, 200)
+        size = random.choice((500, 5000))
+        eclusters = list(zip(make_ranges(n, size), make_ranges(n, size),
+                             [1] * n))
+        assert sorted(sorted(g) for g in get_2D_overlap(None, eclusters)) == \
+                sorted(sorted(g) for g in brute_2D_overlap(eclusters))
+
+
+def test_assembly_hic_scorer():
+    """ Test assembly.hic - incremental tour scores against chic
+    """
+    import array
+    import numpy as np
+    from jcvi.assembly.chic import score_evaluate_M, score_evaluate_Q
+    from jcvi.assembly.hic import BB, TourScorer, TourMoveDelta
+
+    def as_tour(x):
+        return array.array('i', [int(t) for t in x])
+
+    np.random.seed(666)
+    N = 40
+    sizes = np.random.randint(10000, 3000000, size=N)
+    M = np.random.randint(0, 5, size=(N, N)) * (np.random.random((N, N)) < .3)
+    M = np.triu(M, 1)
+    M = M + M.T
+    oriented = {}
+    for a, b in zip(*np.nonzero(M)):
+        oriented[(a, b)] = dict(((ao, bo), np.random.randint(0, 5, size=BB))
+                                for ao in (-1, 1) for bo in (-1, 1))
+    signs = np.random.choice([-1, 1], size=N)
+
+    def Q(signs):
+        Q = -np.ones((N, N, BB), dtype=int)
+        for (a, b), k in oriented.items():
+            Q[a, b] = k[(signs[a], signs[b])]
+        return Q
+
+    tour = as_tour(np.random.permutation(N))
+    scorer = TourScorer(tour, sizes, M, oriented=oriented)
+    assert np.isclose(scorer.score_M(), score_evaluate_M(tour, sizes, M)[0])
+    assert np.isclose(scorer.score_Q(signs),
+                      score_evaluate_Q(tour, sizes, Q(signs))[0])
+
+    for i in range(30):
+        p, q = sorted(np.random.randint(0, N, size=2))
+        q += 1
+        segment = list(tour[p:q])
+        if i % 2:
+            segment = segment[::-1]
+        else:
+            segment = segment[1:] + segment[:1]
+        delta = scorer.move_delta_M(p, q, segment)
+        score = scorer.score_M()
+        scorer.move(p, q, segment)
+        tour[p:q] = as_tour(segment)
+        assert np.isclose(score + delta, score_evaluate_M(tour, sizes, M)[0])
+        assert np.isclose(scorer.score_M(), score + delta)
+
+    for i in range(N):
+        stour = tour[:i] + tour[i + 1:]
+        assert np.isclose(scorer.score_M() + scorer.remove_delta_M(i),
+                          score_evaluate_M(stour, sizes, M)[0])
+
+    for i in range(N):
+        score = scorer.score_Q(signs)
+        delta = scorer.flip_delta_Q(i, signs)
+        signs[tour[i]] *= -1
+        assert np.isclose(score + delta,
+                          score_evaluate_Q(tour, sizes, Q(signs))[0])
+
+    # Mutation deltas for unrelated parent tours share one scorer
+    move_delta = TourMoveDelta(sizes, M)
+    for i in range(30):
+        tour = as_tour(np.random.permutation(N))
+        p, q = sorted(np.random.randint(0, N, size=2))
+        q += 1
+        segment = tour[p:q][::-1]
+        mutant = tour[:p] + segment + tour[q:]
+        assert np.isclose(move_delta(tour, p, q, segment),
+                          score_evaluate_M(mutant, sizes, M)[0] -
+                          score_evaluate_M(tour, sizes, M)[0])
+        assert list(move_delta.scorer.tour) == list(tour)
+
+
+def test_assembly_hic_ga_fitness():
+    """ Test algorithms.ec - GA with incremental fitness reports exact scores
+    """
+    import numpy as np
+    from jcvi.algorithms.ec import GA_setup, GA_run, genome_mutation
+    from jcvi.assembly.chic import score_evaluate_M
+    from jcvi.assembly.hic import TourMoveDelta
+
+    np.random.seed(666)
+    N = 30
+    sizes = np.random.randint(10000, 3000000, size=N)
+    M = np.random.randint(0, 5, size=(N, N)) * (np.random.random((N, N)) < .3)
+    M = np.triu(M, 1)
+    M = M + M.T
+    toolbox = GA_setup(list(np.random.permutation(N)))
+    toolbox.register("evaluate", score_evaluate_M, tour_sizes=sizes, tour_M=M)
+    toolbox.register("mutate", genome_mutation,
+                     delta=TourMoveDelta(sizes, M))
+    tour, fitness = GA_run(toolbox, ngen=30, npop=20)
+    assert fitness.values == score_evaluate_M(tour, sizes, M)
+
+
+def test_assembly_hic_sparse(tmpdir):
+    """ Test assembly.hic - sparse CLM matrices against dense scores
+    """
+    import array
+    import numpy as np
+    from jcvi.assembly.chic import score_evaluate_M, score_evaluate_P, \
+        score_evaluate_Q
+    from jcvi.assembly.hic import BB, CLMFile
+
+    np.random.seed(666)
+    N = 30
+    tigs = ["tig{:02d}".format(i) for i in range(N)]
+    sizes = np.random.randint(10000, 2000000, size=N)
+    idsfile = tmpdir.join("test.ids")
+    idsfile.write("".join("{}\t{}\n".format(t, s)
+                          for t, s in zip(tigs, sizes)))
+    rows = []
+    for a in range(N):
+        for b in range(a + 1, N):
+            if np.random.random() > .2:
+                continue
+            n = np.random.randint(1, 6)
+            for ao in "+-":
+                for bo in "+-":
+                    dists = np.random.randint(1000, 2000000, size=n)
+                    rows.append("{}{} {}{}\t{}\t{}\n".format(
+                        tigs[a], ao, tigs[b], bo, n,
+                        " ".join(str(x) for x in dists)))
+    clmfile = tmpdir.join("test.clm")
+    clmfile.write("".join(rows))
+
+    clm = CLMFile(str(clmfile))
+    clm.active -= set(tigs[:3])
+    assert clm.N == N - 3
+    M = clm.M
+    assert clm.M is M
+    tig_to_idx = clm.tig_to_idx
+    clm.signs = np.random.choice([-1, 1], size=clm.N)
+
+    # Dense matrices, built the same way as before they were sparse
+    dM = np.zeros((clm.N, clm.N), dtype=int)
+    dP = np.zeros((clm.N, clm.N, 2), dtype=int)
+    dQ = -np.ones((clm.N, clm.N, BB), dtype=int)
+    orientations = clm.orientations
+    for (at, bt), links in clm.contacts.items():
+        if at in tig_to_idx and bt in tig_to_idx:
+            ai, bi = tig_to_idx[at], tig_to_idx[bt]
+            dM[ai, bi] = dM[bi, ai] = links
+            strandedness, md, mh = orientations[(at, bt)]
+            dP[ai, bi] = dP[bi, ai] = md, mh
+    for (at, bt), k in clm.contacts_oriented.items():
+        if at in tig_to_idx and bt in tig_to_idx:
+            ai, bi = tig_to_idx[at], tig_to_idx[bt]
+            dQ[ai, bi] = k[(clm.signs[ai], clm.signs[bi])]
+    assert (M.toarray() == dM).all()
+    assert (clm.P.toarray() == dP.reshape(clm.N, -1)).all()
+
+    sizes = clm.active_sizes
+    for i in range(5):
+        tour = array.array('i', np.random.permutation(clm.N))
+        assert np.isclose(score_evaluate_M(tour, sizes, M),
+                          score_evaluate_M(tour, sizes, dM))
+        assert np.isclose(score_evaluate_P(tour, sizes, clm.P),
+                          score_evaluate_P(tour, sizes, dP))
+        assert np.isclose(score_evaluate_Q(tour, sizes, clm.Q),
+                          score_evaluate_Q(tour, sizes, dQ))
+        assert np.isclose(clm.scorer(tour).score_Q(clm.signs),
+                          score_evaluate_Q(tour, sizes, dQ))
+
+    clm.active -= set(tigs[3:5])
+    assert clm.M.shape == (N - 5, N - 5)
+
+
+def test_assembly_hic_bam2mat(tmpdir):
+    """ Test assembly.hic - region-sharded bam2mat and resolution pyramid
+    """
+    import json
+    import random
+    import numpy as np
+    import pytest
+    pysam = pytest.importorskip("pysam")
+    from jcvi.assembly.hic import bam2mat, load_pyramid
+
+    random.seed(666)
+    seqs = [("chr1", 30000000), ("chr2", 12000000), ("chr3", 500000)]
+    header = {"HD": {"VN": "1.0", "SO": "coordinate"},
+              "SQ": [{"SN": sn, "LN": ln} for sn, ln in seqs]}
+    reads = []
+    for i in range(3000):
+        a, b = random.randint(0, 2), random.choice([0, 0, 1, 2])
+        apos = random.randint(0, seqs[a][1] - 100)
+        bpos = random.randint(0, seqs[b][1] - 100)
+        for r, (ref, pos, mref, mpos) in enumerate(((a, apos, b, bpos),
+                                                     (b, bpos, a, apos))):
+            x = pysam.AlignedSegment()
+            x.query_name = "read{}".format(i)
+            x.query_sequence = "A" * 50
+            x.flag = 1 | (64 if r == 0 else 128)
+            x.reference_id, x.reference_start = ref, pos
+            x.next_reference_id, x.next_reference_start = mref, mpos
+            x.mapping_quality = random.choice([0, 20, 60])
+            x.cigartuples = [(0, 50)]
+            reads.append(x)
+    reads.sort(key=lambda x: (x.reference_id, x.reference_start))
+    bamfile = str(tmpdir.join("test.bam"))
+    with pysam.AlignmentFile(bamfile, "wb", header=header) as fw:
+        for x in reads:
+            fw.write(x)
+    pysam.index(bamfile)
+
+    # Link counts, the same as LACHESIS rules in bam2mat
+    N = 1000000
+    starts = {"chr1": 0, "chr2": 31}
+    A = np.zeros((44, 44), dtype=int)
+    for x in reads:
+        if x.mapping_quality == 0 or x.is_read2:
+            continue
+        achr = seqs[x.reference_id][0]
+        bchr = seqs[x.next_reference_id][0]
+        if achr not in starts or bchr not in starts:
+            continue
+        if achr == bchr and abs(x.reference_start -
+                                x.next_reference_start) < 100:
+            continue
+        abin = starts[achr] + x.reference_start // N
+        bbin = starts[bchr] + x.next_reference_start // N
+        A[abin, bbin] += 1
+        if abin != bbin:
+            A[bbin, abin] += 1
+
+    pf = str(tmpdir.join("test"))
+    bam2mat([bamfile, "--resolution={}".format(N), "--cpus=2", "--levels=2",
+             "--batch=100"])
+    assert (np.load(pf + ".npy") == A).all()
+    dists = np.load(pf + ".dist.npy")
+    header = json.load(open(pf + ".json"))
+    assert header["total_bins"] == 44
+    assert sorted(header["resolutions"]) == ["1000000", "2000000"]
+    for res in (1000000, 2000000):
+        bam2mat([bamfile, "--resolution={}".format(res)])
+        total_bins = header["resolutions"][str(res)]["total_bins"]
+        assert (load_pyramid(pf + ".npz", res, total_bins) ==
+                np.load(pf + ".npy")).all()
+        if res == N:
+            assert (np.load(pf + ".dist.npy") == dists).all()
+
+
+def test_assembly_hic_bam2mat_nolinks(tmpdir):
+    """ Test assembly.hic - bam2mat with a contig that has no links
+    """
+    import numpy as np
+    import pytest
+    pysam = pytest.importorskip("pysam")
+    from jcvi.assembly.hic import bam2mat
+
+    N = 1000000
+    header = {"HD": {"VN": "1.0", "SO": "coordinate"},
+              "SQ": [{"SN": "chr1", "LN": 12000000},
+                     {"SN": "chr2", "LN": 12000000}]}
+    bamfile = str(tmpdir.join("test.bam"))
+    with pysam.AlignmentFile(bamfile, "wb", header=header) as fw:
+        for i, (pos, mpos) in enumerate(((1000, 5000000), (5000000, 1000))):
+            x = pysam.AlignedSegment()
+            x.query_name = "read0"
+            x.query_sequence = "A" * 50
+            x.flag = 1 | (64 if i == 0 else 128)
+            x.reference_id, x.reference_start = 0, pos
+            x.next_reference_id, x.next_reference_start = 0, mpos
+            x.mapping_quality = 60
+            x.cigartuples = [(0, 50)]
+            fw.write(x)
+    pysam.index(bamfile)
+
+    pf = str(tmpdir.join("test"))
+    # One link per batch, so the last batch of every region is empty
+    bam2mat([bamfile, "--resolution={}".format(N), "--batch=1"])
+    A = np.load(pf + ".npy")
+    assert A.shape == (26, 26)
+    assert A.sum() == 2 and A[0, 5] == A[5, 0] == 1
+
+
+def test_assembly_hic_clmbin(tmpdir):
+    """ Test assembly.hic - binary CLM loads the same contacts as the text
+    """
+    import math
+    import os
+    import numpy as np
+    from jcvi.assembly.hic import LB, UB, CLM_DTYPE, CLMFile, clm2bin, \
+        golden_array, hmean_int, read_clm_text
+
+    a = np.random.randint(1, 10000000, size=1000)
+    counts = np.zeros(UB - LB + 1, dtype=int)
+    for x in a:
+        c = int(round(math.log(x, 1.61803398875)))
+        counts[min(max(c, LB), UB) - LB] += 1
+    assert (golden_array(a) == counts).all()
+
+    tmpdir.join("test.ids").write("tig1\t50000\ntig2\t80000\n"
+                                  "tig3\t20000\trecover\n")
+    clmfile = tmpdir.join("test.clm")
+    clmfile.write("tig1+ tig2+\t2\t6000 90000\n"
+                  "tig1+ tig2-\t2\t100000 10000\n"
+                  "tig1- tig2+\t2\t5000 7000\n"
+                  "tig1- tig2-\t2\t3000000 40000\n"
+                  "tig2+ tig3-\t1\t30000\n"
+                  "tig4+ tig1+\t1\t30000\n")
+    clmfile = str(clmfile)
+    for skiprecover in (False, True):
+        clm = CLMFile(clmfile, skiprecover=skiprecover)
+        clm2bin([clmfile])
+        os.utime(clmfile, (0, 0))
+        clmbin = CLMFile(clmfile, skiprecover=skiprecover)
+        # The binary records stay memory-mapped
+        assert isinstance(clmbin.records.records, np.memmap)
+        os.remove(clmfile + ".bin")
+        for field in CLM_DTYPE.names:
+            assert (clm.records[field] == clmbin.records[field]).all()
+        assert clm.contacts == clmbin.contacts
+        assert clm.orientations[("tig1", "tig2")] == \
+            (-1, 2, hmean_int([5000, 7000]))
+        assert len(clm.records) == 1 + (not skiprecover)
+        assert (clm.M.toarray() == clmbin.M.toarray()).all()
+
+    # Lines of the same pair that are not adjacent
+    clmfile = tmpdir.join("split.clm")
+    clmfile.write("A+ B+\t1\t1000\n"
+                  "C+ D+\t1\t2000\n"
+                  "A+ B-\t3\t1000 2000 3000\n")
+    ids, records = read_clm_text(str(clmfile))
+    links = dict(((ids[a], ids[b]), n) for a, b, n in
+                 zip(records["a"], records["b"], records["links"]))
+    assert links == {("A", "B"): 3, ("C", "D"): 1}
+
+
+def test_algorithms_ec_islands():
+    """ Test algorithms.ec - island model GA is deterministic given the seed
+    """
+    from jcvi.algorithms.ec import GA_setup, GA_islands, colinear_evaluate, \
+        make_data
+
+    scaffolds = make_data(100, 10)
+    guess = [0, 1, 7, 6, 5, 4, 3, 2, 8, 9]
+    toolbox = GA_setup(guess)
+    toolbox.register("evaluate", colinear_evaluate, scaffolds=scaffolds)
+    gens = []
+    tours = [GA_islands(toolbox, ngen=10, npop=20, islands=3, migration=5,
+                        callback=lambda tour, gen: gens.append(gen),
+                        verbose=False) for i in range(2)]
+    assert list(tours[0]) == list(tours[1])
+    assert tours[0].fitness.values == colinear_evaluate(tours[0], scaffolds)
+    assert tours[0].fitness.values[0] >= colinear_evaluate(guess,
+                                                           scaffolds)[0]
+    assert gens[:3] == [5, 10, 15]
+
+
+def test_assembly_allmaps_evaluator():
+    """ Test assembly.allmaps - batch fitness against colinear_evaluate_multi
+    """
+    import random
+    import numpy as np
+    from jcvi.algorithms.clis import longest_monotonic_subseq_lengths_loose
+    from jcvi.algorithms.lis import longest_monotonic_subseq_length_loose
+    from jcvi.assembly.allmaps import ColinearEvaluator, \
+        colinear_evaluate_multi
+
+    random.seed(666)
+    X = [[random.randint(0, 5) for i in range(30)] for j in range(20)]
+    best, diff = longest_monotonic_subseq_lengths_loose(
+                    np.array(X, dtype="float64"))
+    assert list(zip(best, diff)) == \
+        [longest_monotonic_subseq_length_loose(x) for x in X]
+
+    n = 50
+    scfs = []
+    for k in range(4):
+        scf = {}
+        for s in range(n):
+            if random.random() < .7:
+                scf[s] = [random.randint(0, 20)
+                          for i in range(random.randint(0, 5))]
+        scfs.append(scf)
+    weights = [1., 2., .5, 3.]
+    evaluator = ColinearEvaluator(scfs, weights, n)
+    tours = [random.sample(range(n), n) for i in range(10)]
+    assert evaluator.evaluate_batch(tours) == \
+        [colinear_evaluate_multi(x, scfs, weights) for x in tours]
+    assert evaluator(tours[0]) == colinear_evaluate_multi(tours[0], scfs,
+                                                          weights)
+
+
+def test_algorithms_tsp_native():
+    """ Test algorithms.tsp - in-process solver against enumeration
+    """
+    import numpy as np
+    import networkx as nx
+    from jcvi.algorithms.graph import shortest_path_lengths
+    from jcvi.algorithms.tsp import LocalSearchTSP, hamiltonian
+
+    rng = np.random.RandomState(666)
+    for i in range(5):
+        D = rng.rand(8, 8) * 10    # Asymmetric
+        exact = LocalSearchTSP(D)
+        heuristic = LocalSearchTSP(D, exact=0, seed=i)
+        assert sorted(heuristic.tour) == list(range(8))
+        assert abs(heuristic.cost - exact.cost) < 1e-9
+
+    xy = rng.rand(60, 2)
+    D = np.sqrt(((xy[:, None] - xy[None]) ** 2).sum(axis=-1))
+    greedy = LocalSearchTSP(D, restarts=1, kicks=0)
+    improved = LocalSearchTSP(D, time_budget=2)
+    assert sorted(improved.tour) == list(range(60))
+    assert improved.cost <= greedy.cost
+
+    # Don't-look bits: nothing to look at leaves the tour alone, a kick is
+    # repaired from the cities next to the new edges only
+    tour = greedy.nearest_neighbor()
+    assert (greedy.local_search(tour.copy(), np.zeros(60, dtype=bool))
+            == tour).all()
+    tour = greedy.local_search(tour)
+    kicked, look = greedy.double_bridge(tour)
+    assert look.sum() <= 6
+    repaired = greedy.local_search(kicked.copy(), look)
+    assert sorted(repaired) == list(range(60))
+    assert greedy.evaluate(repaired) <= greedy.evaluate(kicked)
+
+    g = [(1, 2), (2, 3), (3, 4), (4, 2), (3, 5)]
+    assert hamiltonian(g, solver="native") == [1, 2, 4, 3, 5]
+    g = [("START", x, 1) for x in "abc"] + [(x, "END", 1) for x in "abc"] + \
+        [("a", "b", 1), ("b", "c", 1), ("c", "a", 5)]
+    assert hamiltonian(g, directed=True, solver="native") == \
+           ["START", "a", "b", "c", "END"]
+
+    G = nx.DiGraph()
+    G.add_weighted_edges_from([(1, 2, 1), (2, 3, 2), (1, 3, 5), (3, 4, 1)])
+    assert shortest_path_lengths(G, [(1, 4), (4, 1), (2, 5)]) == {(1, 4): 4}
+
+
+def test_formats_fasta_faidx(tmpdir):
+    """ Test formats.fasta - .fai random access agrees with SeqIO
+    """
+    import random
+    from jcvi.formats.fasta import Fasta, FastaIndex
+
+    random.seed(666)
+    fastafile = tmpdir.join("test.fasta")
+    seqs, lines = {}, []
+    for i in range(20):
+        size = random.randint(0, 300)
+        width = random.choice((10, 60, 61))
+        seq = "".join(random.choice("ACGTN") for j in range(size))
+        seqs["s{0}".format(i)] = seq
+        lines.append(">s{0} sample {0}".format(i))
+        lines += [seq[j: j + width] for j in range(0, size, width)]
+    fastafile.write("\n".join(lines) + "\n")
+    fastafile = str(fastafile)
+
+    fi = FastaIndex(fastafile)
+    assert tmpdir.join("test.fasta.fai").check()
+    assert fi.keys() == ["s{0}".format(i) for i in range(20)]
+    for name, seq in seqs.items():
+        assert fi.fetch(name) == seq
+        for j in range(20):
+            start = random.randint(0, len(seq))
+            stop = random.randint(start, len(seq) + 5)
+            assert fi.fetch(name, start, stop) == seq[start:stop]
+
+    f = Fasta(fastafile, index=True)
+    g = Fasta(fastafile)
+    assert f.faidx is not None and len(f) == len(g)
+    assert dict(f.itersizes()) == dict(g.itersizes())
+    for name in seqs:
+        assert str(f[name].seq) == str(g[name].seq)
+        assert f[name].description == g[name].description
+    feature = dict(chr="s3", start=5, stop=40, strand="-")
+    assert f.sequence(feature) == g.sequence(feature)
+    assert sorted(f.iterkeys()) == sorted(g.iterkeys())
+    assert f.tostring() == g.tostring() == seqs
+    assert [k for k, rec in f.iteritems_ordered()] == fi.keys()
+    fi.close()
+    assert fi.fp is None
+
+    # Uneven line wrapping can't be indexed, SeqIO.index is used instead
+    uneven = tmpdir.join("uneven.fasta")
+    uneven.write(">a\nACG\nACGTT\nA\n")
+    f = Fasta(str(uneven), index=True)
+    assert f.faidx is None and str(f["a"].seq) == "ACGACGTTA"
+    assert dict(f.itersizes()) == {"a": 9}
+
+    empty = tmpdir.join("empty.fasta")
+    empty.write("")
+    f = Fasta(str(empty), index=True)
+    assert f.faidx is not None and len(f) == 0
+    assert f.keys() == [] and list(f.iteritems()) == [] and "a" not in f
+
+
+def test_formats_twobit(tmpdir):
+    """ Test formats.twobit - packed store decodes back to the FASTA
+    """
+    import os
+    import pytest
+    import random
+    import re
+    from jcvi.formats.twobit import TwoBit, get_twobit, write_twobit
+
+    random.seed(666)
+    fastafile = tmpdir.join("test.fasta")
+    seqs, lines = {}, []
+    for i in range(10):
+        seq = "".join(random.choice("ACGTacgtNn") * random.randint(1, 20)
+                      for j in range(random.randint(0, 100)))
+        seqs["s{0}".format(i)] = seq
+        lines.append(">s{0}".format(i))
+        lines += [seq[j: j + 60] for j in range(0, len(seq), 60)]
+    fastafile.write("\n".join(lines) + "\n")
+
+    tb = get_twobit(str(fastafile))
+    assert tmpdir.join("test.fasta.2bit").check()
+    assert tb.keys() == ["s{0}".format(i) for i in range(10)]
+    for name, seq in seqs.items():
+        assert tb.fetch(name) == seq
+        upper = seq.upper()
+        for j in range(20):
+            start = random.randint(0, len(seq))
+            stop = random.randint(start, len(seq))
+            region = upper[start:stop]
+            assert tb.fetch(name, start, stop, mask=False) == region
+            assert list(tb.codes(name, start, stop)) == \
+                   ["TCAGN".index(x) for x in region]
+        starts, sizes = tb.nruns(name)
+        assert list(zip(starts, sizes)) == \
+               [(m.start(), len(m.group())) for m in re.finditer("N+", upper)]
+
+    # Ambiguity codes are restored and are not N runs
+    fastafile = tmpdir.join("iupac.fasta")
+    fastafile.write(">a\nACGTRYKMACGTNNNNACGT\n>b\nacnry-NNx\n")
+    tb = get_twobit(str(fastafile))
+    assert tb.fetch("a") == "ACGTRYKMACGTNNNNACGT"
+    assert tb.fetch("b") == "acnry-NNx"
+    assert tb.fetch("b", mask=False) == "ACNRY-NNX"
+    assert list(zip(*tb.nruns("a"))) == [(12, 4)]
+    assert list(zip(*tb.nruns("b"))) == [(2, 1), (6, 2)]
+
+    # Falls back to a temporary file when .2bit cannot be written
+    fastafile = tmpdir.join("readonly.fasta")
+    fastafile.write(">a\nACGTR\n")
+    tmpdir.mkdir("readonly.fasta.2bit")  # Not writable as a file
+    os.utime(str(tmpdir.join("readonly.fasta.2bit")), (0, 0))
+    assert get_twobit(str(fastafile)).fetch("a") == "ACGTR"
+
+    # Ids the index cannot hold are rejected before anything is written
+    for bad in (">a\nACGT\n>a\nACGT\n", ">{0}\nACGT\n".format("x" * 256)):
+        fastafile = tmpdir.join("bad.fasta")
+        fastafile.write(bad)
+        with pytest.raises(ValueError):
+            write_twobit(str(fastafile), str(tmpdir.join("bad.2bit")))
+        assert not tmpdir.join("bad.2bit").check()
+
+    # Duplicate names from other writers, the last record wins
+    fastafile = tmpdir.join("dup.fasta")
+    fastafile.write(">a\nACGT\n>b\nNNRY\n")
+    twobitfile = tmpdir.join("dup.2bit")
+    write_twobit(str(fastafile), str(twobitfile))
+    twobitfile.write_binary(twobitfile.read_binary().replace(b"\x01b", b"\x01a"))
+    tb = TwoBit(str(twobitfile))
+    assert tb.keys() == ["a"]
+    assert tb.fetch("a") == "NNRY"
+
+
+def test_formats_fasta_composition(tmpdir):
+    """ Test formats.fasta - composition kernels against per-base counts
+    """
+    import random
+    import re
+    from jcvi.formats.fasta import SequenceInfo, gc_bins, summary_counts
+
+    random.seed(666)
+    fastafile = tmpdir.join("test.fasta")
+    seqs, lines = [], []
+    for i in range(10):
+        seq = "".join(random.choice("ACGTacgtNnR") * random.randint(1, 15)
+                      for j in range(random.randint(1, 80)))
+        seqs.append(("s{0}".format(i), seq))
+        lines.append(">s{0} desc".format(i))
+        lines += [seq[j: j + 60] for j in range(0, len(seq), 60)]
+    fastafile.write("\n".join(lines) + "\n")
+    fastafile = str(fastafile)
+
+    s = SequenceInfo(fastafile, gapstats=True)
+    assert s.nseqs == 10
+    assert s.real == sum(sum(x in "ACGT" for x in seq.upper())
+                         for name, seq in seqs)
+    assert s.sum == sum(len(seq) for name, seq in seqs)
+    assert s.gaps == sum(len(re.findall("N{10,}", seq.upper()))
+                         for name, seq in seqs)
+
+    assert summary_counts(fastafile) == \
+           [(name, seq.count("N") + seq.count("n"), len(seq))
+            for name, seq in seqs]
+
+    for binsize, step in ((50, None), (30, 7)):
+        expected = []
+        for name, seq in seqs:
+            seq = seq.upper()
+            for i in range(0, len(seq) - binsize + 1, step or binsize):
+                window = seq[i: i + binsize]
+                at = window.count("A") + window.count("T")
+                gc = window.count("G") + window.count("C")
+                if at + gc:
+                    expected.append(gc * 100 // (at + gc))
+        assert gc_bins(fastafile, binsize=binsize, step=step) == expected
+
+
+def test_formats_record_pipeline(tmpdir):
+    """ Test formats.base - record chunks and apps.grid.pipeline_map
+    """
+    import random
+    from jcvi.apps.grid import pipeline_map
+    from jcvi.formats.base import iter_record_chunks, iter_chunk_texts
+
+    random.seed(666)
+    records = {}
+    records["fasta"] = [">r{0} d\n{1}\n".format(i, "\n".join(
+                        "ACGT" * random.randint(1, 20)
+                        for j in range(random.randint(1, 4))))
+                        for i in range(50)]
+    records["fastq"] = []
+    for i in range(50):
+        L = random.randint(1, 40)
+        records["fastq"].append("@r{0}\n{1}\n+\n{2}\n".format(i, "A" * L, "I" * L))
+
+    for format, recs in records.items():
+        filename = tmpdir.join("test." + format)
+        filename.write("".join(recs))
+        for chunksize in (1, 17, 1 << 22):
+            texts = []
+            for index, n, chunk in iter_record_chunks(str(filename),
+                                    format=format, chunksize=chunksize,
+                                    group=2 if format == "fastq" else 1):
+                assert index == len(texts)
+                texts += list(iter_chunk_texts(chunk, format=format))
+                assert len(texts) == index + n
+            assert texts == recs
+
+    args = list(range(100))
+    assert list(pipeline_map(abs, args, cpus=2, maxpending=3)) == args
+
+
+def test_formats_fastq_reader(tmpdir):
+    """ Test formats.fastq - block reader against Biopython, gz and offsets
+    """
+    import gzip
+    import random
+    from Bio.SeqIO.QualityIO import FastqGeneralIterator
+    from jcvi.formats.fastq import iter_fastq, high_qv
+
+    random.seed(666)
+    lines = []
+    for i in range(100):
+        L = random.randint(1, 50)
+        lines += ["@r{0} desc".format(i),
+                  "".join(random.choice("ACGTN") for j in range(L)), "+",
+                  "".join(random.choice("#5?I") for j in range(L))]
+    text = "\n".join(lines)  # No trailing newline
+    fastqfile = tmpdir.join("test.fastq")
+    fastqfile.write(text)
+    gzfile = str(tmpdir.join("test.fastq.gz"))
+    for half in (lines[:200], lines[200:]):  # Two gzip members
+        fw = gzip.open(gzfile, "ab")
+        fw.write(("\n".join(half) + "\n").encode())
+        fw.close()
+
+    expected = list(FastqGeneralIterator(open(str(fastqfile))))
+    for filename in (str(fastqfile), gzfile):
+        for blocksize in (1, 13, 1 << 22):
+            got = [(rec.header[1:], rec.seq, rec.qual) for rec in
+                   iter_fastq(filename, blocksize=blocksize)]
+            assert got == expected
+
+    for rec, (title, seq, qual) in \
+            zip(iter_fastq(str(fastqfile), offset=31), expected):
+        assert rec.qual == "".join(chr(ord(x) + 31) for x in qual)
+        assert list(rec.quality) == [ord(x) + 31 for x in qual]
+
+    quals = [qual for title, seq, qual in expected]
+    assert list(high_qv(quals, "5", pct=50)) == \
+           [sum(x >= "5" for x in q) >= len(q) * 50 // 100 for q in quals]